@@ -310,21 +310,27 @@ class ConditionRelation(ConditionBase):
         self._wm = wmi
         subj = self._params.getParamValue(self._subject_key)
         obj = self._params.getParamValue(self._object_key)
-        additional = ""
+        # The query text depends only on which elements are abstract, the values are bound
+        query = "?x ?relation ?y"
+        bindings = {'relation': self._owl_label}
         if subj.getIdNumber() < 0:
-            additional += ". ?x rdf:type {}".format(subj.type)
+            query += ". ?x rdf:type ?xtype"
+            bindings['xtype'] = subj.type
             subj = "?x"
         else:
+            bindings['x'] = subj.id
             subj = subj.id
         if obj.getIdNumber() < 0:
-            additional += ". ?y rdf:type {}".format(obj.type)
+            query += ". ?y rdf:type ?ytype"
+            bindings['ytype'] = obj.type
             obj = "?y"
         else:
+            bindings['y'] = obj.id
             obj = obj.id
-        if additional == "":
+        if 'xtype' not in bindings and 'ytype' not in bindings:
             v = self._wm.get_relations(subj, self._owl_label, obj)
         else:
-            v = self._wm.query_ontology("SELECT * WHERE {" + "{} {} {}".format(subj, self._owl_label, obj) + additional + ".}")
+            v = self._wm.query_ontology("SELECT * WHERE {" + query + ".}", bindings=bindings)
         self._description = "[{}] {}({})-{}-{}({}) ({})".format(self._label, self._subject_key, subj, self._owl_label, self._object_key, obj, self._desired_state)
         #print "{} {} {} {}".format(subj, self._owl_label, obj, v)
         if v:
@@ -427,12 +433,12 @@ class AbstractConditionRelation(ConditionBase):
         subj = self._params.getParamValue(self._subject_key).type
         obj = self._params.getParamValue(self._object_key).type
         v = wmi.query_ontology("""
-                               SELECT ?ytypes WHERE {{
-                                       {{ ?xtypes rdfs:subClassOf* {subj}. }} UNION {{ {subj} rdfs:subClassOf* ?xtypes. }}
-                                       {{ ?ytypes rdfs:subClassOf* {obj}. }} UNION {{ {obj} rdfs:subClassOf* ?ytypes. }}
-                                       ?xtypes rdfs:subClassOf ?restriction . ?restriction owl:onProperty {relation}. ?restriction ?quantity ?ytypes.
-                                    }}
-                               """.format(subj=subj, relation=self._owl_label, obj=obj))
+                               SELECT ?ytypes WHERE {
+                                       { ?xtypes rdfs:subClassOf* ?subj. } UNION { ?subj rdfs:subClassOf* ?xtypes. }
+                                       { ?ytypes rdfs:subClassOf* ?obj. } UNION { ?obj rdfs:subClassOf* ?ytypes. }
+                                       ?xtypes rdfs:subClassOf ?restriction . ?restriction owl:onProperty ?relation. ?restriction ?quantity ?ytypes.
+                                    }
+                               """, bindings={'subj': subj, 'relation': self._owl_label, 'obj': obj})
         #print "{} {} {}".format(subj, self._owl_label, v)
         self._description = "[{}] {}-{}-{} ({})".format(self._label, subj, self._owl_label, obj, self._desired_state)
         if v:
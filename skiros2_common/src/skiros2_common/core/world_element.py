@@ -232,7 +232,7 @@ class Element(object):
         if isinstance(pred, str):
             pred = [pred]
         if pred:
-            if pred[0] == "":
+            if next(iter(pred)) == "":
                 pred = []
         for r in self._relations:
             if (r['src'] == subj or subj == "") and (r['type'] in pred or not pred) and (r['dst'] == obj or obj == ""):
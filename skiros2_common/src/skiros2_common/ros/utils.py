@@ -336,6 +336,58 @@ def element2msg(element):
     return msg
 
 
+def element2state(element):
+    """
+    @brief      Returns a copy of the properties and relations of an
+                element, to compute its changes later with delta2msg
+    """
+    properties = {k: (p.dataType(), list(p.values)) for k, p in element._properties.items()}
+    relations = set((r['src'], r['type'], r['dst']) for r in element._relations)
+    return properties, relations
+
+
+def delta2msg(state, element):
+    """
+    @brief      Returns the changes of an element since its state
+
+    @param      state    the state returned by element2state
+    @param      element  the updated element
+
+    @return     (WmElementDelta)
+    """
+    properties, relations = state
+    msg = msgs.WmElementDelta()
+    msg.id = element.id
+    msg.label = element.label
+    msg.type = element.type
+    changed = {}
+    for k, p in element._properties.items():
+        if properties.get(k) != (p.dataType(), p.values):
+            changed[k] = p
+    msg.properties = serializePropertyMap(changed)
+    msg.removed_properties = [k for k in properties if k not in element._properties]
+    curr = set((r['src'], r['type'], r['dst']) for r in element._relations)
+    msg.added_relations = [msgs.Relation(*r) for r in curr - relations]
+    msg.removed_relations = [msgs.Relation(*r) for r in relations - curr]
+    return msg
+
+
+def apply_delta_msg(element, msg):
+    """
+    @brief      Apply the changes of a WmElementDelta to an element
+    """
+    element._label = msg.label
+    element._type = msg.type
+    element._properties.update(deserializePropertyMap(msg.properties))
+    for k in msg.removed_properties:
+        element._properties.pop(k, None)
+    if msg.removed_relations:
+        removed = set((r.subjectId, r.predicate, r.objectId) for r in msg.removed_relations)
+        element._relations = [r for r in element._relations if (r['src'], r['type'], r['dst']) not in removed]
+    for r in msg.added_relations:
+        element.addRelation(r.subjectId, r.predicate, r.objectId)
+
+
 def relation2msg(r):
     rmsg = msgs.Relation()
     rmsg.subjectId = r['src']
@@ -1,23 +1,69 @@
 class IdGen:
+    """
+    @brief      Allocates integer ids: the lowest free id from the last
+                allocated, desired or released one
+
+                The allocated ids are flags in a bytearray, so that
+                checking and releasing an id is O(1) and finding the next
+                free one is a memchr. The bytearray grows only while at
+                least one byte out of _DENSITY is an allocated id: the ids
+                beyond it, e.g. timestamps, are kept in a set, so that the
+                memory stays proportional to the number of ids
+    """
+    _DENSITY = 8
+    _MIN_SIZE = 1024
+
     def __init__(self):
-        self._id = 0
-        self._ids = []
+        self.clear()
 
     def getId(self, desired=-1):
         if desired >= 0:
             self._id = desired
-        while self._id in self._ids:
+        if self._id < len(self._used):
+            free = self._used.find(b'\x00', self._id)
+            self._id = free if free >= 0 else len(self._used)
+        while self._id in self._sparse:
             self._id += 1
-        self._ids.append(self._id)
+        if self._id >= len(self._used):
+            self._grow()
+        if self._id < len(self._used):
+            self._used[self._id] = 1
+        else:
+            self._sparse.add(self._id)
+        self._count += 1
         return self._id
 
     def hasId(self, uid):
-        return uid in self._ids
+        if 0 <= uid < len(self._used):
+            return self._used[uid] == 1
+        return uid in self._sparse
 
     def removeId(self, uid):
-        self._ids.remove(uid)
+        if not self.hasId(uid):
+            raise ValueError("Id {} is not allocated".format(uid))
+        if uid < len(self._used):
+            self._used[uid] = 0
+        else:
+            self._sparse.remove(uid)
+        self._count -= 1
         self._id = uid
 
     def clear(self):
-        self._ids = []
+        self._used = bytearray()
+        self._sparse = set()
+        self._count = 0
         self._id = 0
+
+    def _grow(self):
+        """
+        @brief      Extend the bytearray up to the current id, if it stays
+                    dense enough, moving there the ids of the set it covers
+        """
+        limit = max(self._MIN_SIZE, self._DENSITY * (self._count + 1))
+        if self._id >= limit:
+            return
+        size = max(self._id + 1, min(limit, 2 * len(self._used)))
+        self._used.extend(bytearray(size - len(self._used)))
+        for uid in [uid for uid in self._sparse if uid < size]:
+            self._sparse.remove(uid)
+            self._used[uid] = 1
@@ -0,0 +1,170 @@
+import threading
+from functools import wraps
+from timeit import default_timer as now
+
+
+class ReadWriteLock(object):
+    """
+    @brief      Lock shared by readers and exclusive for writers
+
+                Waiting writers have the precedence over new readers. The
+                lock is reentrant: a thread holding it can acquire it
+                again in any mode, except a reader asking for write
+                access (an upgrade would deadlock with the other
+                readers)
+
+                The time spent waiting for the lock is collected per
+                mode, and per thread with pop_thread_wait
+
+    Usage:
+        with lock.read:
+            --Read something--
+        with lock.write:
+            --Modify something--
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._writes = 0
+        self._waiting_writers = 0
+        self._local = threading.local()
+        self._stats = {'read': [0, 0, 0.0, 0.0], 'write': [0, 0, 0.0, 0.0]}
+        self.read = _LockMode(self.acquire_read, self.release_read)
+        self.write = _LockMode(self.acquire_write, self.release_write)
+
+    def _thread_reads(self):
+        return getattr(self._local, 'reads', 0)
+
+    def acquire_read(self):
+        me = threading.current_thread()
+        if self._writer is me or self._thread_reads():
+            self._local.reads = self._thread_reads() + 1
+            return
+        with self._cond:
+            start = None
+            while self._writer is not None or self._waiting_writers:
+                if start is None:
+                    start = now()
+                self._cond.wait()
+            self._readers += 1
+            self._count('read', start)
+        self._local.reads = 1
+
+    def release_read(self):
+        reads = self._thread_reads() - 1
+        self._local.reads = reads
+        if reads or self._writer is threading.current_thread():
+            return
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        me = threading.current_thread()
+        if self._writer is me:
+            self._writes += 1
+            return
+        if self._thread_reads():
+            raise RuntimeError("Can not acquire the write lock while holding the read lock")
+        with self._cond:
+            start = None
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    if start is None:
+                        start = now()
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = me
+            self._writes = 1
+            self._count('write', start)
+
+    def release_write(self):
+        if self._writer is not threading.current_thread():
+            raise RuntimeError("Can not release a write lock not owned")
+        self._writes -= 1
+        if self._writes:
+            return
+        with self._cond:
+            self._writer = None
+            self._cond.notify_all()
+
+    def _count(self, mode, start):
+        """
+        @brief Update the statistics of a mode. Called with the condition lock held
+        """
+        stats = self._stats[mode]
+        stats[0] += 1
+        if start is not None:
+            wait = now() - start
+            stats[1] += 1
+            stats[2] += wait
+            stats[3] = max(stats[3], wait)
+            self._local.wait = getattr(self._local, 'wait', 0.0) + wait
+
+    def pop_thread_wait(self):
+        """
+        @brief      Returns the time the calling thread waited for the lock
+                    since the last call
+        """
+        wait = getattr(self._local, 'wait', 0.0)
+        self._local.wait = 0.0
+        return wait
+
+    def get_stats(self):
+        """
+        @brief      Returns the contention statistics
+
+        @return     dict mode ('read', 'write') -> dict with the number of
+                    acquisitions, the number of acquisitions that had to
+                    wait, the total and the maximum wait time in seconds
+        """
+        with self._cond:
+            return {mode: {'count': s[0], 'contended': s[1], 'wait': s[2], 'max_wait': s[3]} for mode, s in self._stats.items()}
+
+    def report(self):
+        """
+        @brief      Returns the contention statistics as a string
+        """
+        return " ".join("{}: {} ({} waited, {:0.3f} secs total, {:0.3f} secs max).".format(mode, s['count'], s['contended'], s['wait'], s['max_wait'])
+                        for mode, s in sorted(self.get_stats().items()))
+
+
+class _LockMode(object):
+    def __init__(self, acquire, release):
+        self.acquire = acquire
+        self.release = release
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.release()
+        return False
+
+
+def read_locked(func):
+    """
+    Decorator for methods reading an object protected by the ReadWriteLock self._rw_lock
+    """
+    @wraps(func)
+    def wrapped(self, *args, **kwargs):
+        with self._rw_lock.read:
+            return func(self, *args, **kwargs)
+    return wrapped
+
+
+def write_locked(func):
+    """
+    Decorator for methods modifying an object protected by the ReadWriteLock self._rw_lock
+    """
+    @wraps(func)
+    def wrapped(self, *args, **kwargs):
+        with self._rw_lock.write:
+            return func(self, *args, **kwargs)
+    return wrapped
@@ -0,0 +1,43 @@
+import unittest
+from skiros2_common.tools.id_generator import IdGen
+
+
+class TestIdGen(unittest.TestCase):
+    def test_allocation(self):
+        gen = IdGen()
+        self.assertEqual([gen.getId() for _ in range(3)], [0, 1, 2])
+        self.assertEqual(gen.getId(10), 10)
+        self.assertEqual(gen.getId(1), 3)
+        self.assertTrue(gen.hasId(10))
+        self.assertFalse(gen.hasId(5))
+        self.assertFalse(gen.hasId(-1))
+
+    def test_sparse(self):
+        gen = IdGen()
+        self.assertEqual(gen.getId(1697543210), 1697543210)
+        self.assertEqual(gen.getId(), 1697543211)
+        # Far ids do not allocate the bytes up to them
+        self.assertLess(len(gen._used), 1024 * 1024)
+        self.assertTrue(gen.hasId(1697543211))
+        gen.removeId(1697543210)
+        self.assertFalse(gen.hasId(1697543210))
+        self.assertEqual(gen.getId(), 1697543210)
+        self.assertEqual(gen.getId(0), 0)
+
+    def test_release(self):
+        gen = IdGen()
+        for _ in range(5):
+            gen.getId()
+        gen.removeId(1)
+        self.assertFalse(gen.hasId(1))
+        # The released id is reused first
+        self.assertEqual(gen.getId(), 1)
+        self.assertEqual(gen.getId(), 5)
+        self.assertRaises(ValueError, gen.removeId, 7)
+        gen.clear()
+        self.assertFalse(gen.hasId(0))
+        self.assertEqual(gen.getId(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
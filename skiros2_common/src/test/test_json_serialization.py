@@ -1,6 +1,7 @@
 import unittest
 import skiros2_common.ros.utils as utils
 import skiros2_common.core.params as param
+from skiros2_common.core.world_element import Element
 
 s_param_map_strings = [ 
 '[param: "{\\"values\\": [], \\"specType\\": 0, \\"type\\": \\"dict\\", \\"description\\": \\"\\", \\"key\\"\\\n  : \\"MyDict\\"}"]',
@@ -79,6 +80,28 @@ class TestSerialization(unittest.TestCase):
 
         self.assertEqual(expected, str(s_property_map)) 
 
+    def test_element_delta(self):
+        e = Element("skiros:Product", "cup", "skiros:Product-2")
+        e.setProperty("skiros:Size", 1.0)
+        e.setProperty("skiros:FrameId", "cup")
+        e.addRelation("skiros:Location-1", "skiros:contain", "-1")
+        copy = utils.msg2element(utils.element2msg(e))
+        state = utils.element2state(e)
+        e.setProperty("skiros:Size", 2.0)
+        e.removeProperty("skiros:FrameId")
+        e.removeRelation2("skiros:Location-1", "skiros:contain", "-1")
+        e.addRelation("-1", "skiros:hasA", "skiros:Location-3")
+        delta = utils.delta2msg(state, e)
+        self.assertEqual([p.key for p in delta.properties], ["skiros:Size"])
+        self.assertEqual(delta.removed_properties, ["skiros:FrameId"])
+        self.assertEqual([r.objectId for r in delta.added_relations], ["skiros:Location-3"])
+        self.assertEqual([r.subjectId for r in delta.removed_relations], ["skiros:Location-1"])
+        utils.apply_delta_msg(copy, delta)
+        self.assertEqual(list(copy.available_properties), ["skiros:Size"])
+        self.assertEqual(copy.getProperty("skiros:Size").value, 2.0)
+        self.assertEqual(copy._relations, e._relations)
+        self.assertEqual(utils.delta2msg(utils.element2state(e), e).properties, [])
+
 
 if __name__ == "__main__":
     unittest.main()
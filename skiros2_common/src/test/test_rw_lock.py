@@ -0,0 +1,72 @@
+import threading
+import time
+import unittest
+from skiros2_common.tools.rw_lock import ReadWriteLock
+
+
+class TestReadWriteLock(unittest.TestCase):
+
+    def setUp(self):
+        self.lock = ReadWriteLock()
+
+    def run_thread(self, target):
+        t = threading.Thread(target=target)
+        t.daemon = True
+        t.start()
+        return t
+
+    def test_shared_read(self):
+        inside = threading.Event()
+        release = threading.Event()
+
+        def reader():
+            with self.lock.read:
+                inside.set()
+                release.wait(1.0)
+        t = self.run_thread(reader)
+        self.assertTrue(inside.wait(1.0))
+        # A second reader doesn't wait for the first one
+        start = time.time()
+        with self.lock.read:
+            self.assertLess(time.time() - start, 0.5)
+        release.set()
+        t.join(1.0)
+        self.assertEqual(self.lock.get_stats()['read']['contended'], 0)
+
+    def test_exclusive_write(self):
+        inside = threading.Event()
+        events = []
+
+        def writer():
+            with self.lock.write:
+                inside.set()
+                time.sleep(0.1)
+                events.append('write')
+        t = self.run_thread(writer)
+        self.assertTrue(inside.wait(1.0))
+        with self.lock.read:
+            events.append('read')
+        t.join(1.0)
+        self.assertEqual(events, ['write', 'read'])
+        stats = self.lock.get_stats()
+        self.assertEqual(stats['read']['contended'], 1)
+        self.assertGreater(stats['read']['wait'], 0.05)
+        self.assertGreater(self.lock.pop_thread_wait(), 0.05)
+        self.assertEqual(self.lock.pop_thread_wait(), 0.0)
+
+    def test_reentrant(self):
+        with self.lock.write:
+            with self.lock.read:
+                with self.lock.write:
+                    pass
+        with self.lock.read:
+            with self.lock.read:
+                self.assertRaises(RuntimeError, self.lock.acquire_write)
+        # Lock is free again
+        t = self.run_thread(lambda: self.lock.write.__enter__())
+        t.join(1.0)
+        self.assertFalse(t.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -470,6 +470,7 @@ class SkirosWidget(QWidget, SkirosInteractiveMarkers):
         self._wmi.set_monitor_cb(lambda d: self.wm_update_signal.emit(d))
         self._sli.set_monitor_cb(lambda d: self.task_progress_signal.emit(d))
         self._snapshot_id = ""
+        self._seq = 0  # Seq of the last change applied, 0 if unknown
         self._snapshot_stamp = rospy.Time.now()
         self._wm_mutex = Lock()
         self._task_mutex = Lock()
@@ -777,32 +778,41 @@ class SkirosWidget(QWidget, SkirosInteractiveMarkers):
     @Slot()
     def on_wm_update(self, data):
         with self._wm_mutex:
+            if self._snapshot_id != data.prev_snapshot_id and data.action != "reset" and self._seq and data.seq > self._seq:
+                # Try to catch up with the missed changes before querying the whole scene
+                for delta in self._wmi.get_deltas(self._seq) or []:
+                    if delta.seq < data.seq and self._snapshot_id == delta.prev_snapshot_id:
+                        self._apply_wm_update(delta)
             # Discard msgs not in sync with local wm version
             if self._snapshot_id == data.prev_snapshot_id and data.action != "reset":
-                self._snapshot_id = data.snapshot_id
-                cur_item = self.wm_tree_widget.currentItem()
-                cur_item_id = cur_item.text(1)
-                if data.action == 'update' or data.action == 'update_properties':
-                    for elem in data.elements:
-                        elem = rosutils.msg2element(elem)
-                        self._update_wm_node(elem, cur_item_id)
-                elif data.action == 'add':
-                    for elem in data.elements:
-                        elem = rosutils.msg2element(elem)
-                        if not self._add_wm_node(elem):
-                            self._snapshot_id = ""
-                elif data.action == 'remove' or data.action == 'remove_recursive':
-                    for elem in data.elements:
-                        elem = rosutils.msg2element(elem)
-                        self._remove_wm_node(elem)
-                # reselect current item
-                items = self.wm_tree_widget.findItems(cur_item_id, Qt.MatchRecursive | Qt.MatchFixedString, 1)
-                if items:
-                    self.wm_tree_widget.setCurrentItem(items[0])
+                self._apply_wm_update(data)
             elif data.stamp > self._snapshot_stamp or self._snapshot_id == "":  # Ignores obsolete msgs
                 log.info("[wm_update]", "Wm not in sync, querying wm scene")
                 self.create_wm_tree()
 
+    def _apply_wm_update(self, data):
+        self._snapshot_id = data.snapshot_id
+        self._seq = data.seq
+        cur_item = self.wm_tree_widget.currentItem()
+        cur_item_id = cur_item.text(1)
+        for i, elem in enumerate(data.elements):
+            elem = rosutils.msg2element(elem)
+            # Transactions mix different actions, one per element
+            action = data.element_actions[i] if data.action == 'transaction' else data.action
+            if action == 'update' or action == 'update_properties':
+                self._update_wm_node(elem, cur_item_id)
+            elif action == 'add':
+                if not self._add_wm_node(elem):
+                    self._snapshot_id = ""
+            elif action == 'remove' or action == 'remove_recursive':
+                self._remove_wm_node(elem)
+        for delta in data.element_deltas:
+            self._patch_wm_node(delta, cur_item_id)
+        # reselect current item
+        items = self.wm_tree_widget.findItems(cur_item_id, Qt.MatchRecursive | Qt.MatchFixedString, 1)
+        if items:
+            self.wm_tree_widget.setCurrentItem(items[0])
+
     def on_marker_feedback(self, feedback):
         if feedback.event_type == InteractiveMarkerFeedback.POSE_UPDATE:
             with self._wm_mutex:
@@ -884,6 +894,7 @@ class SkirosWidget(QWidget, SkirosInteractiveMarkers):
                 log.warn("[create_wm_tree]", "Failed to retrieve scene, will try again.")
         # print "GOT SCENE {}".format([e.id for e in scene_tuple[0]])
         self._snapshot_id = scene_tuple[1]
+        self._seq = 0
         self._snapshot_stamp = rospy.Time.now()
         scene = {elem.id: elem for elem in scene_tuple[0]}
         root = scene['skiros:Scene-0']
@@ -938,6 +949,22 @@ class SkirosWidget(QWidget, SkirosInteractiveMarkers):
             item.setText(1, elem.id)
             parents[0].addChild(item)
 
+    def _patch_wm_node(self, delta, cur_item_id):
+        """
+        @brief      Update the tree with the changes of an element. The
+                    element is fetched only if it is selected or if its
+                    relations changed
+        """
+        if delta.added_relations or delta.removed_relations:
+            return self._update_wm_node(self._wmi.get_element(delta.id), cur_item_id)
+        items = self.wm_tree_widget.findItems(delta.id, Qt.MatchRecursive | Qt.MatchFixedString, 1)
+        if items:
+            items[0].setText(0, utils.ontology_type2name(delta.id) if not delta.label else utils.ontology_type2name(delta.label))
+        if delta.id == cur_item_id:
+            self.wm_properties_widget.blockSignals(True)
+            self.fill_properties_table(self._wmi.get_element(delta.id))
+            self.wm_properties_widget.blockSignals(False)
+
     def _add_wm_node(self, elem):
         parent_rel = elem.getRelation(pred=self._wmi.get_sub_properties('skiros:spatiallyRelated'), obj='-1')
         to_expand = True
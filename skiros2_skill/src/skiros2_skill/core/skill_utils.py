@@ -1,5 +1,4 @@
 from skiros2_common.core.world_element import Element
-from skiros2_world_model.core.world_model_abstract_interface import WmException
 import skiros2_common.core.params as params
 from skiros2_skill.core.processors import Serial, ParallelFf, State
 import skiros2_common.tools.logger as log
@@ -49,17 +48,20 @@ class NodeExecutor():
         self._last_print = ""
 
     def syncParams(self, params):
-        for k, p in params.items():
+        element_params = [p for p in params.values() if p.dataTypeIs(Element)]
+        # All the instances are read in a single request
+        eids = [v.id for p in element_params for v in p.values if v.getIdNumber() >= 0]
+        elements = dict(zip(eids, self._wm.get_elements(eids))) if eids else {}
+        for p in element_params:
             vs = p.values
-            if p.dataTypeIs(Element):
-                for i in reversed(range(0, len(vs))):
-                    if vs[i].getIdNumber() >= 0:
-                        try:
-                            vs[i] = self._wm.get_element(vs[i].id)
-                        except WmException:
-                            log.info("[syncParams]", "{} was deleted, removing from parameters".format(vs[i].id))
-                            vs.pop(i)
-                p.values = vs
+            for i in reversed(range(0, len(vs))):
+                if vs[i].getIdNumber() >= 0:
+                    if elements[vs[i].id] is None:
+                        log.info("[syncParams]", "{} was deleted, removing from parameters".format(vs[i].id))
+                        vs.pop(i)
+                    else:
+                        vs[i] = elements[vs[i].id]
+            p.values = vs
 
     def trackParam(self, key, prop="", relation="", print_all=False):
         """
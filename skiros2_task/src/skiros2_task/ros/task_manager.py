@@ -132,6 +132,10 @@ class TaskManagerNode(PrettyObject):
 
     def initDomain(self):
         skills = self._wmi.resolve_elements(wmi.Element(":Skill"))
+        # The params and conditions of all the skills are read in a single request
+        predicates = ["skiros:hasParam", "skiros:hasPreCondition", "skiros:hasHoldCondition", "skiros:hasPostCondition"]
+        eids = [p['dst'] for skill in skills for predicate in predicates for p in skill.getRelations(pred=predicate)]
+        elements = dict(zip(eids, self._wmi.get_elements(eids))) if eids else {}
         for skill in skills:
             params = {}
             preconds = []
@@ -139,18 +143,18 @@ class TaskManagerNode(PrettyObject):
             postconds = []
             # Note: Only skills with pre AND post conditions are considered for planning
             for p in skill.getRelations(pred="skiros:hasParam"):
-                e = self._wmi.get_element(p['dst'])
+                e = elements[p['dst']]
                 params[e._label] = e.getProperty("skiros:DataType").value
             for p in skill.getRelations(pred="skiros:hasPreCondition"):
-                e = self._wmi.get_element(p['dst'])
+                e = elements[p['dst']]
                 if e.type.find("ConditionRelation") != -1 or e.type == "skiros:ConditionProperty" or e.type == "skiros:ConditionHasProperty":
                     preconds.append(pddl.Predicate(e, params, e.type.find("Abs") != -1))
             for p in skill.getRelations(pred="skiros:hasHoldCondition"):
-                e = self._wmi.get_element(p['dst'])
+                e = elements[p['dst']]
                 if e.type.find("ConditionRelation") != -1 or e.type == "skiros:ConditionProperty" or e.type == "skiros:ConditionHasProperty":
                     holdconds.append(pddl.Predicate(e, params, e.type.find("Abs") != -1))
             for p in skill.getRelations(pred="skiros:hasPostCondition"):
-                e = self._wmi.get_element(p['dst'])
+                e = elements[p['dst']]
                 if e.type.find("ConditionRelation") != -1 or e.type == "skiros:ConditionProperty" or e.type == "skiros:ConditionHasProperty":
                     postconds.append(pddl.Predicate(e, params, e.type.find("Abs") != -1))
             self._pddl_interface.addAction(pddl.Action(skill, params, preconds, holdconds, postconds))
@@ -164,9 +168,10 @@ class TaskManagerNode(PrettyObject):
         objects = {}
         elements = {}
         self._elements = {}
-        # Find objects
+        # Find objects, all in the same version of the scene
+        snapshot_id = self._wmi.get_snapshot_id()
         for objType in self._pddl_interface._types._types["thing"]:
-            temp = self._wmi.resolve_elements(wmi.Element(objType))
+            temp = self._wmi.resolve_elements(wmi.Element(objType), snapshot_id=snapshot_id)
             elements[objType] = temp
             if len(temp) > 0:
                 objects[objType] = []
@@ -227,32 +232,30 @@ class TaskManagerNode(PrettyObject):
                         xtype) is None else self._pddl_interface.getSubTypes(xtype)
                     suby = [ytype] if self._pddl_interface.getSubTypes(
                         ytype) is None else self._pddl_interface.getSubTypes(ytype)
+                    # Fixed query texts: the server parses them once, the values are bound
                     if p.abstracts:
-                        query_str_template = """
-                            SELECT ?x ?y WHERE {{
-                                    {{ ?xtypes rdfs:subClassOf* {xtype}. }} UNION {{ {xtype} rdfs:subClassOf* ?xtypes. }}
-                                    {{ ?ytypes rdfs:subClassOf* {ytype}. }} UNION {{ {ytype} rdfs:subClassOf* ?ytypes. }}
-                                    ?xtypes rdfs:subClassOf ?restriction . ?restriction owl:onProperty {relation}. ?restriction ?quantity ?ytypes.
+                        query_str = """
+                            SELECT ?x ?y WHERE {
+                                    { ?xtypes rdfs:subClassOf* ?xtype. } UNION { ?xtype rdfs:subClassOf* ?xtypes. }
+                                    { ?ytypes rdfs:subClassOf* ?ytype. } UNION { ?ytype rdfs:subClassOf* ?ytypes. }
+                                    ?xtypes rdfs:subClassOf ?restriction . ?restriction owl:onProperty ?relation. ?restriction ?quantity ?ytypes.
                                     ?x rdf:type/rdfs:subClassOf* ?xtypes. ?y rdf:type/rdfs:subClassOf* ?ytypes.
-                            }}"""
+                            }"""
                     else:
-                        query_str_template = """
-                            SELECT ?x ?y WHERE {{
-                            {{ ?x {relation} ?y. ?x rdf:type/rdfs:subClassOf* {xtype}. ?y rdf:type/rdfs:subClassOf* {ytype}.}}
+                        query_str = """
+                            SELECT ?x ?y WHERE {
+                            { ?x ?relation ?y. ?x rdf:type/rdfs:subClassOf* ?xtype. ?y rdf:type/rdfs:subClassOf* ?ytype.}
                             UNION
-                            {{?t {relation} ?z. ?t rdf:type/rdfs:subClassOf* {xtype}. ?z rdf:type/rdfs:subClassOf* {ytype}. ?t skiros:hasTemplate ?x. ?z skiros:hasTemplate ?y. }}
+                            {?t ?relation ?z. ?t rdf:type/rdfs:subClassOf* ?xtype. ?z rdf:type/rdfs:subClassOf* ?ytype. ?t skiros:hasTemplate ?x. ?z skiros:hasTemplate ?y. }
                             UNION
-                            {{?t {relation} ?y. ?t rdf:type/rdfs:subClassOf* {xtype}. ?y rdf:type/rdfs:subClassOf* {ytype}. ?t skiros:hasTemplate ?x.}}
+                            {?t ?relation ?y. ?t rdf:type/rdfs:subClassOf* ?xtype. ?y rdf:type/rdfs:subClassOf* ?ytype. ?t skiros:hasTemplate ?x.}
                             UNION
-                            {{?x {relation} ?z. ?x rdf:type/rdfs:subClassOf* {xtype}. ?z rdf:type/rdfs:subClassOf* {ytype}. ?z skiros:hasTemplate ?y.}}
-                            }}"""
+                            {?x ?relation ?z. ?x rdf:type/rdfs:subClassOf* ?xtype. ?z rdf:type/rdfs:subClassOf* ?ytype. ?z skiros:hasTemplate ?y.}
+                            }"""
                     for x in subx:
                         for y in suby:
-                            query_str = query_str_template.format(relation=p.name, xtype=x, ytype=y)
-                            answer = self._wmi.query_ontology(query_str)
-                            for line in answer:
-                                tokens = line.strip().split(" ")
-                                self._pddl_interface.addInitState(pddl.GroundPredicate(p.name, tokens))
+                            for row in self._wmi.query_rows(query_str, bindings={'relation': p.name, 'xtype': x, 'ytype': y}):
+                                self._pddl_interface.addInitState(pddl.GroundPredicate(p.name, list(row)))
 
         for p in self._pddl_interface._functions:
             c = cond.ConditionProperty("", p.name, "x", p.operator, p.value, True)
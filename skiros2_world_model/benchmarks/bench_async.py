@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""
+Latency of 100 independent resolves sent to a running world model server,
+one after the other with the WorldModelInterface and pipelined with the
+AsyncWorldModelInterface, with several numbers of workers. Adds some
+locations to the scene first, and removes them at the end.
+
+Usage: bench_async.py [requests]
+       (with a world model server running, e.g.
+        roslaunch skiros2 world_model_server.launch)
+"""
+import sys
+import rospy
+import skiros2_common.tools.logger as log
+from skiros2_common.core.world_element import Element
+from skiros2_world_model.ros.world_model_interface import WorldModelInterface
+from skiros2_world_model.ros.world_model_async_interface import AsyncWorldModelInterface
+from common import timeit, report
+
+LOCATIONS = 20
+
+
+def sequential(wmi, elements):
+    return [wmi.resolve_elements(e) for e in elements]
+
+
+def pipelined(awmi, elements):
+    futures = [awmi.resolve_elements(e) for e in elements]
+    return [f.result() for f in futures]
+
+
+def main(requests):
+    rospy.init_node("bench_async", anonymous=True)
+    log.setLevel(log.WARN)
+    wmi = WorldModelInterface("bench_async")
+    added = []
+    for i in range(LOCATIONS):
+        location = Element("skiros:Location", "bench_async_{}".format(i))
+        location.addRelation("skiros:Scene-0", "skiros:contain", "-1")
+        added.append(wmi.add_element(location))
+    elements = [Element("skiros:Location", "bench_async_{}".format(i % LOCATIONS)) for i in range(requests)]
+    rows = [("sequential", timeit(lambda: sequential(wmi, elements)))]
+    for workers in (2, 4, 8, 16):
+        awmi = AsyncWorldModelInterface(wmi, workers)
+        pipelined(awmi, elements[:workers])
+        rows.append(("pipelined, {} workers".format(workers), timeit(lambda: pipelined(awmi, elements))))
+        awmi.shutdown()
+    report("{} independent resolves".format(requests), rows)
+    for location in added:
+        wmi.remove_element(location)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
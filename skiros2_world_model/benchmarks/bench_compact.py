@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+Memory and latency of a synthetic scene context in the rdflib Memory
+store and in a CompactStore, at several sizes. The memory is the one
+allocated while adding the statements, measured with tracemalloc.
+
+Usage: bench_compact.py [statements ...]
+"""
+import sys
+import random
+import tracemalloc
+import rdflib
+from rdflib.namespace import RDF
+from rdflib.plugins.stores.memory import Memory
+from skiros2_world_model.core.compact_store import CompactStore
+from common import SKIROS_URI, make_scene_triples, timeit, report
+
+
+def build(store, triples):
+    graph = rdflib.ConjunctiveGraph(store=store)
+    scene = graph.get_context('scene')
+    scene.addN((s, p, o, scene) for s, p, o in triples)
+    return graph, scene
+
+
+def measure(store, triples):
+    tracemalloc.start()
+    graph, scene = build(store, triples)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return graph, scene, memory
+
+
+def lookups(scene, subjects, location):
+    for subject in subjects:
+        list(scene.predicate_objects(subject))
+        scene.value(subject, RDF.type)
+    for _ in scene.subjects(RDF.type, location):
+        pass
+
+
+def update(scene, statements):
+    for statement in statements:
+        scene.remove(statement)
+    for statement in statements:
+        scene.add(statement)
+
+
+def main(sizes):
+    skiros = rdflib.Namespace(SKIROS_URI)
+    for size in sizes:
+        triples = make_scene_triples(size // 6)
+        rng = random.Random(0)
+        subjects = [s for s, p, o in rng.sample(triples, 1000)]
+        statements = rng.sample(triples, 1000)
+        times = {}
+        memories = []
+        for name, factory in (("Memory store", Memory), ("CompactStore", CompactStore)):
+            graph, scene, memory = measure(factory(), triples)
+            memories.append((name, memory))
+            times.setdefault("add all", []).append((name, timeit(lambda: build(factory(), triples), repeat=1)))
+            times.setdefault("1000 element lookups", []).append((name, timeit(lambda: lookups(scene, subjects, skiros['Location']))))
+            times.setdefault("1000 removes and adds", []).append((name, timeit(lambda: update(scene, statements))))
+            del graph, scene
+        print("Scene of {} statements, allocated memory".format(len(triples)))
+        for name, memory in memories:
+            print("  {:<40} {:>10.1f} MB {:>8.1f} bytes/statement".format(name, memory / 1e6, float(memory) / len(triples)))
+        for operation in ("add all", "1000 element lookups", "1000 removes and adds"):
+            report("{}, {} statements".format(operation, len(triples)), times[operation])
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or [100000, 1000000])
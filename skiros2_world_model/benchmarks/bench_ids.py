@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Cost of the id allocation when adding many elements to the world model.
+Adds N elements with the same label, and reports the time of every tenth
+of them: it stays flat with the IdGen bitmap. The IdGen alone is compared
+with the previous list based implementation.
+
+Usage: bench_ids.py [elements]
+"""
+import sys
+import skiros2_common.tools.logger as log
+from skiros2_common.core.world_element import Element
+from skiros2_common.tools.id_generator import IdGen
+from skiros2_world_model.core.world_model import WorldModel
+from common import load_ontologies, timeit, report
+
+
+class ListIdGen:
+    """
+    @brief      Reference implementation, with linear membership tests
+    """
+
+    def __init__(self):
+        self._id = 0
+        self._ids = []
+
+    def getId(self, desired=-1):
+        if desired >= 0:
+            self._id = desired
+        while self._id in self._ids:
+            self._id += 1
+        self._ids.append(self._id)
+        return self._id
+
+    def hasId(self, uid):
+        return uid in self._ids
+
+    def removeId(self, uid):
+        self._ids.remove(uid)
+        self._id = uid
+
+
+def churn(gen, size):
+    """
+    @brief      Allocate size ids, then release and allocate again one id
+                out of ten
+    """
+    for _ in range(size):
+        gen.getId()
+    for uid in range(0, size, 10):
+        gen.removeId(uid)
+        gen.hasId(uid)
+        gen.getId()
+
+
+def main(size):
+    log.setLevel(log.WARN)
+    report("IdGen, {} ids".format(size // 10), [
+        ("list", timeit(lambda: churn(ListIdGen(), size // 10), repeat=1)),
+        ("bitmap", timeit(lambda: churn(IdGen(), size // 10), repeat=1)),
+    ])
+    wm = WorldModel(False, 'scene', lambda *args, **kwargs: None)
+    load_ontologies(wm)
+    wm.reset()
+    batch = size // 10
+    rows = []
+    for i in range(10):
+        dt = timeit(lambda: [wm.add_element(Element("skiros:Product", "cup"), "bench") for _ in range(batch)], repeat=1)
+        rows.append(("elements {}-{}".format(i * batch, (i + 1) * batch), dt))
+    report("Add {} elements with the same label".format(size), rows)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""
+Microbenchmark of the 'individuals' query template on a synthetic scene,
+with the rdf:type/rdfs:subClassOf* path and with the direct rdf:type
+pattern on the materialized inferred types. The cost of enabling the
+inferred types is reported apart.
+
+Usage: bench_inferred.py [elements]
+"""
+import sys
+import skiros2_common.tools.logger as log
+from skiros2_world_model.core.ontology_rdflib import Ontology
+from common import load_ontologies, make_scene_triples, timeit, report
+
+
+def make_ontology(size):
+    ontology = Ontology()
+    load_ontologies(ontology)
+    scene = ontology.ontology('scene')
+    scene.addN((s, p, o, scene) for s, p, o in make_scene_triples(size))
+    ontology._invalidate_ontology_indexes()
+    return ontology
+
+
+def run(ontology, template, classes):
+    for cls in classes:
+        list(ontology.query(template, bindings={'class': ontology.lightstring2uri(cls)}))
+
+
+def main(size):
+    log.setLevel(log.WARN)
+    classes = ["skiros:Location", "skiros:Product", "sumo:Object"]
+    plain = make_ontology(size)
+    inferred = make_ontology(size)
+    enable = timeit(inferred.enable_inferred_types, repeat=1)
+    path, direct = plain.query_template('individuals'), inferred.query_template('individuals')
+    assert [set(plain.query(path, bindings={'class': plain.lightstring2uri(c)})) for c in classes] == \
+        [set(inferred.query(direct, bindings={'class': inferred.lightstring2uri(c)})) for c in classes]
+    print("{} inferred statements, enabled in {:0.4f} s".format(len(inferred.ontology('inferred')), enable))
+    report("Query the individuals of {} classes, {} elements".format(len(classes), size), [
+        ("rdf:type/rdfs:subClassOf* path", timeit(lambda: run(plain, path, classes))),
+        ("materialized rdf:type", timeit(lambda: run(inferred, direct, classes))),
+    ])
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+Microbenchmark of the ontology loading at boot, parsing N synthetic
+RDF/XML ontology files in one process and in pools of worker processes.
+The statements are then added to the graph in the main process.
+
+The scaling depends on the cores available: with a single core the pool
+only adds the cost of starting the workers.
+
+Usage: bench_load.py [files] [classes_per_file]
+"""
+import os
+import sys
+import shutil
+import tempfile
+import multiprocessing
+import rdflib
+from rdflib.namespace import RDF, RDFS, OWL
+import skiros2_common.tools.logger as log
+from skiros2_world_model.core.ontology_rdflib import Ontology
+from skiros2_world_model.core.parse_cache import parse_files
+from common import timeit, report
+
+
+def write_ontologies(directory, files, classes):
+    """
+    @brief      Write files ontologies of classes classes each, in a
+                class hierarchy with labels and comments
+    """
+    filenames = []
+    for i in range(files):
+        ns = rdflib.Namespace('http://test.org/onto{}.owl#'.format(i))
+        graph = rdflib.Graph()
+        graph.bind('onto{}'.format(i), ns)
+        graph.add((rdflib.URIRef('http://test.org/onto{}.owl'.format(i)), RDF.type, OWL.Ontology))
+        for j in range(classes):
+            graph.add((ns['C{}'.format(j)], RDF.type, OWL.Class))
+            graph.add((ns['C{}'.format(j)], RDFS.subClassOf, ns['C{}'.format(j // 4)]))
+            graph.add((ns['C{}'.format(j)], RDFS.label, rdflib.Literal('class {}'.format(j))))
+            graph.add((ns['C{}'.format(j)], RDFS.comment, rdflib.Literal('The class number {} of ontology {}'.format(j, i))))
+        filename = os.path.join(directory, 'onto{}.owl'.format(i))
+        graph.serialize(destination=filename, format='xml')
+        filenames.append(filename)
+    return filenames
+
+
+def load(filenames, processes):
+    ontology = Ontology()
+    parsed = parse_files([(f, Ontology.default_context_id(f), None) for f in filenames], processes=processes)
+    for filename, p in zip(filenames, parsed):
+        ontology.load(filename, parsed=p)
+    return ontology
+
+
+def main(files, classes):
+    log.setLevel(log.WARN)
+    directory = tempfile.mkdtemp()
+    try:
+        filenames = write_ontologies(directory, files, classes)
+        reference = load(filenames, 1)
+        assert len(load(filenames, 2).ontology()) == len(reference.ontology())
+        print("{} files, {} statements, {} cores".format(files, len(reference.ontology()), multiprocessing.cpu_count()))
+        rows = [("sequential parse", timeit(lambda: load(filenames, 1), repeat=1))]
+        for processes in (2, 4, 8):
+            if processes <= files:
+                rows.append(("{} processes".format(processes), timeit(lambda: load(filenames, processes), repeat=1)))
+        report("Load {} ontology files".format(files), rows)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 16, int(sys.argv[2]) if len(sys.argv) > 2 else 2000)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+Microbenchmark of Ontology.uri2lightstring / lightstring2uri on a scene with
+10k elements, comparing the namespace index against the previous linear
+scan over the graph namespaces.
+
+Usage: bench_namespaces.py [scene_size]
+"""
+import sys
+import rdflib
+import skiros2_common.tools.logger as log
+from skiros2_world_model.core.ontology_rdflib import Ontology
+from common import load_ontologies, make_scene_triples, timeit, report
+
+
+def linear_uri2lightstring(ontology, uri):
+    """
+    @brief      Reference implementation, scanning all namespaces
+    """
+    if isinstance(uri, rdflib.URIRef):
+        uri = uri.n3().replace('<', '').replace('>', '')
+    if uri.find("#") < 0:
+        return uri
+    tokens = uri.split("#")
+    for prefix, uri1 in ontology.ontology().namespaces():
+        if tokens[0] == uri1[:-1]:
+            return "{}:{}".format(prefix, tokens[1])
+    return uri
+
+
+def linear_lightstring2uri(ontology, name):
+    """
+    @brief      Reference implementation, scanning all namespaces
+    """
+    tokens = name.split(":")
+    for prefix, uri in ontology.ontology().namespaces():
+        if tokens[0] == prefix:
+            return rdflib.term.URIRef("{}{}".format(uri, tokens[1]))
+    return rdflib.term.URIRef(name)
+
+
+def main(size):
+    log.setLevel(log.WARN)
+    ontology = Ontology()
+    load_ontologies(ontology)
+    triples = make_scene_triples(size)
+    terms = [t for triple in triples for t in triple if isinstance(t, rdflib.URIRef)]
+    lightstrings = [ontology.uri2lightstring(t) for t in terms]
+    assert lightstrings == [linear_uri2lightstring(ontology, t) for t in terms]
+    assert [ontology.lightstring2uri(l) for l in lightstrings] == [linear_lightstring2uri(ontology, l) for l in lightstrings]
+
+    print("Scene: {} elements, {} triples, {} namespaces".format(size, len(triples), len(list(ontology.ontology().namespaces()))))
+    report("uri2lightstring ({} uris)".format(len(terms)), [
+        ("linear scan", timeit(lambda: [linear_uri2lightstring(ontology, t) for t in terms])),
+        ("index", timeit(lambda: [ontology.uri2lightstring(t) for t in terms])),
+    ])
+    report("lightstring2uri ({} names)".format(len(lightstrings)), [
+        ("linear scan", timeit(lambda: [linear_lightstring2uri(ontology, l) for l in lightstrings])),
+        ("index", timeit(lambda: [ontology.lightstring2uri(l) for l in lightstrings])),
+    ])
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+"""
+Microbenchmark of WorldModel.get_recursive on the scene tree, comparing
+the walk on the relations index against the walk on the elements
+relations, which checks every child in the graph.
+
+Usage: bench_recursive.py [scene_size]
+"""
+import sys
+from collections import OrderedDict
+import skiros2_common.tools.logger as log
+from skiros2_world_model.core.world_model import WorldModel
+from common import load_ontologies, make_scene_triples, timeit, report
+
+
+def main(size):
+    log.setLevel(log.WARN)
+    wm = WorldModel(False, 'scene', lambda *args, **kwargs: None)
+    load_ontologies(wm)
+    wm.reset(add_root=False)
+    # A tree with 8 children per location. The chains of make_scene_triples are
+    # too deep for the recursive element walk
+    contain = wm.lightstring2uri("skiros:contain")
+    triples = make_scene_triples(size, 0)
+    for i in range(1, size + 1):
+        parent = "skiros:Scene-0" if i <= 8 else "skiros:Location-{}".format(((i - 9) // 8) * 2 + 1)
+        triples.append((wm.lightstring2uri(parent), contain, wm.lightstring2uri("skiros:{}-{}".format("Location" if i % 2 else "Product", i))))
+    wm.context.addN((s, p, o, wm.context) for s, p, o in triples)
+    wm.restore()
+    rels = wm.get_sub_relations_set("skiros:sceneProperty")
+    root = wm.get_element("skiros:Scene-0")
+
+    def element_walk():
+        elist = OrderedDict()
+        wm._get_recursive(root, rels, frozenset(), elist)
+        return elist
+
+    assert set(element_walk()) == set(wm.get_recursive("skiros:Scene-0", "skiros:sceneProperty"))
+    print("Scene: {} elements, {} statements".format(size, len(wm.context)))
+    report("get_recursive skiros:Scene-0 skiros:sceneProperty", [
+        ("element walk", timeit(element_walk)),
+        ("relations index", timeit(lambda: wm.get_recursive("skiros:Scene-0", "skiros:sceneProperty"))),
+    ])
+    report("walk only, no elements", [
+        ("relations index", timeit(lambda: wm._walk("skiros:Scene-0", rels, frozenset()))),
+    ])
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
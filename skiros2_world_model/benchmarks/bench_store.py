@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+Startup time of the world model with the in-memory store, loading the
+ontologies and a 50k statements scene from files, against reopening the
+same world model from a SQLiteStore.
+
+Usage: bench_store.py [scene_statements]
+"""
+import os
+import sys
+import shutil
+import tempfile
+import rdflib
+import skiros2_common.tools.logger as log
+from skiros2_world_model.core.world_model import WorldModel
+from skiros2_world_model.core.sqlite_store import SQLiteStore
+from common import load_ontologies, make_scene_triples, timeit, report
+
+
+def start_memory(scene_file):
+    wm = WorldModel(False, 'scene', lambda *args: None)
+    load_ontologies(wm)
+    wm.workspace, filename = os.path.split(scene_file)
+    wm.load_context(filename)
+    return wm
+
+
+def start_sqlite(store_path, scene_file=None):
+    graph = rdflib.ConjunctiveGraph(store=SQLiteStore(store_path))
+    wm = WorldModel(False, 'scene', lambda *args: None, graph)
+    if scene_file is None:
+        wm.set_default_prefix('skiros', 'http://rvmi.aau.dk/ontologies/skiros.owl#')
+        wm.restore()
+    else:
+        load_ontologies(wm)
+        wm.workspace, filename = os.path.split(scene_file)
+        wm.load_context(filename)
+    return wm
+
+
+def main(statements):
+    log.setLevel(log.WARN)
+    directory = tempfile.mkdtemp()
+    try:
+        scene_file = os.path.join(directory, 'scene.turtle')
+        store_path = os.path.join(directory, 'wm.sqlite')
+        triples = make_scene_triples(statements // 6)
+        scene = rdflib.Graph()
+        for t in triples:
+            scene.add(t)
+        scene.serialize(scene_file, format='turtle')
+
+        def first_start():
+            if os.path.exists(store_path):
+                SQLiteStore().destroy(store_path)
+            start_sqlite(store_path, scene_file).ontology().close()
+
+        def restart():
+            start_sqlite(store_path).ontology().close()
+
+        def reopen():
+            graph = rdflib.ConjunctiveGraph(store=SQLiteStore(store_path))
+            assert len(graph.get_context('scene')) > 0
+            graph.close()
+
+        wm = start_memory(scene_file)
+        print("Scene: {} statements, {} in the graph".format(len(wm.context), len(wm.ontology())))
+        report("World model startup", [
+            ("memory, parse .owl + scene files", timeit(lambda: start_memory(scene_file))),
+            ("sqlite, first start (fill the store)", timeit(first_start, 1)),
+            ("sqlite, restart (reopen + index scene)", timeit(restart)),
+            ("sqlite, reopen the store only", timeit(reopen)),
+        ])
+        wm = start_sqlite(store_path)
+        assert set(wm.context) == set(start_memory(scene_file).context)
+        wm.ontology().close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
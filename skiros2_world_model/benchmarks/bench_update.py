@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+Microbenchmark of WorldModel.update_element on an element with many
+relations, comparing the set based diff against the previous tuple scan,
+which also checked again every relation target.
+
+Usage: bench_update.py [relations]
+"""
+import sys
+import skiros2_common.tools.logger as log
+from skiros2_common.core.world_element import Element
+from skiros2_world_model.core.world_model import WorldModel
+from common import load_ontologies, timeit, report
+
+
+def scan_update_element(wm, e, author):
+    """
+    @brief      Reference implementation, with linear membership tests
+    """
+    prev = wm._element2statements(wm.get_element(e.id))
+    curr = wm._element2statements(e)
+    c1, c2 = zip(*curr)
+    for s, is_relation in prev:
+        if not s in c1:
+            wm._remove(s, author, is_relation)
+    p1, p2 = zip(*prev)
+    for s, is_relation in curr:
+        if not s in p1:
+            wm._add(s, author, is_relation)
+    wm._elements_cache.put(e.id, e)
+
+
+def main(size):
+    log.setLevel(log.WARN)
+    wm = WorldModel(False, 'scene', lambda *args, **kwargs: None)
+    load_ontologies(wm)
+    wm.reset()
+    location = Element("skiros:Location", "table")
+    location.addRelation("skiros:Scene-0", "skiros:contain", "-1")
+    location = wm.add_element(location, "bench")
+    for i in range(size):
+        product = Element("skiros:Product", "product_{}".format(i))
+        product.addRelation(location.id, "skiros:contain", "-1")
+        wm.add_element(product, "bench")
+    location = wm.get_element(location.id)
+    sizes = [1.0, 2.0]
+
+    def update(function):
+        # Every update changes one property: 2 statements of delta
+        sizes.reverse()
+        location.setProperty("skiros:Size", sizes[0])
+        function(wm, location, "bench")
+
+    print("Element with {} relations".format(len(location._relations)))
+    report("update_element, one property changed", [
+        ("tuple scan", timeit(lambda: update(scan_update_element))),
+        ("set diff", timeit(lambda: update(WorldModel.update_element))),
+    ])
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,79 @@
+"""
+Helpers shared by the world model benchmarks.
+
+The benchmarks run on the core classes only and do not need a ROS master.
+"""
+import os
+import rdflib
+from rdflib.namespace import RDF, RDFS, OWL, XSD
+from timeit import default_timer as now
+
+SKIROS_URI = 'http://rvmi.aau.dk/ontologies/skiros.owl#'
+DEFAULT_OWL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'skiros2', 'owl')
+
+
+def load_ontologies(ontology, owl_dir=DEFAULT_OWL_DIR):
+    """
+    @brief      Load all .owl files found in owl_dir, like the world model
+                server does at boot
+    """
+    for (dirpath, dirnames, filenames) in os.walk(owl_dir):
+        for name in sorted(filenames):
+            if name.find('.owl') >= 0:
+                ontology.load(os.path.join(dirpath, name))
+    ontology.set_default_prefix('skiros', SKIROS_URI)
+
+
+def make_scene_triples(size, relations_per_element=1):
+    """
+    @brief      Generate the triples of a synthetic scene with size
+                elements, shaped like the ones produced by
+                IndividualsDataset._element2statements
+
+    @return     list of (s, p, o) triples
+    """
+    skiros = rdflib.Namespace(SKIROS_URI)
+    triples = []
+    root = skiros['Scene-0']
+    triples.append((root, RDF.type, OWL.NamedIndividual))
+    triples.append((root, RDF.type, skiros['Scene']))
+    triples.append((root, RDFS.label, rdflib.Literal('scene')))
+    for i in range(1, size + 1):
+        etype = 'Location' if i % 2 else 'Product'
+        subject = skiros['{}-{}'.format(etype, i)]
+        triples.append((subject, RDF.type, OWL.NamedIndividual))
+        triples.append((subject, RDF.type, skiros[etype]))
+        triples.append((subject, RDFS.label, rdflib.Literal('{}_{}'.format(etype.lower(), i % 10))))
+        triples.append((subject, skiros['Size'], rdflib.Literal(float(i % 7), datatype=XSD.float)))
+        triples.append((subject, skiros['FrameId'], rdflib.Literal('frame_{}'.format(i), datatype=XSD.string)))
+        for j in range(relations_per_element):
+            parent = root if i == 1 else skiros['Location-{}'.format(max(1, (i - 1 - j) | 1))]
+            triples.append((parent, skiros['contain'], subject))
+    return triples
+
+
+def timeit(function, repeat=3):
+    """
+    @brief      Run function repeat times
+
+    @return     the best time in seconds
+    """
+    best = None
+    for _ in range(repeat):
+        start = now()
+        function()
+        dt = now() - start
+        if best is None or dt < best:
+            best = dt
+    return best
+
+
+def report(title, rows):
+    """
+    @brief      Print a table of (name, seconds) rows, with the speedup
+                against the first row
+    """
+    print(title)
+    reference = rows[0][1]
+    for name, dt in rows:
+        print("  {:<40} {:>10.4f} s {:>8.1f}x".format(name, dt, reference / dt if dt else float('inf')))
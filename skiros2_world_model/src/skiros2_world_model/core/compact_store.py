@@ -0,0 +1,360 @@
+from array import array
+from itertools import chain
+import rdflib
+from rdflib.store import Store
+from rdflib.plugins.stores.memory import Memory
+
+_MASK = 0xFFFFFFFF
+try:
+    _TYPECODE = 'Q'
+    array(_TYPECODE)
+except ValueError:
+    _TYPECODE = 'L'  # Python 2, 64 bits on the supported platforms
+
+
+class CompactStore(Store):
+    """
+    @brief      Context aware in-memory rdflib store with dictionary
+                encoded terms
+
+                Every term is interned once and the statements refer to
+                it by a 32 bits id. A statement is a single integer key
+                s << 64 | p << 32 | o, mapped to its contexts. The SPO,
+                POS and OSP indexes map the first id to an array of the
+                other two packed in 64 bits, so a statement costs a dict
+                entry and three array items instead of the term tuples
+                and nested sets of the Memory store.
+
+                Removed statements are left in the index arrays and
+                skipped, the arrays are compacted when there are more
+                removed statements than live ones. Terms are never
+                deleted.
+
+    Usage:
+        graph = rdflib.ConjunctiveGraph(store=CompactStore())
+        or, for some contexts only, see SplitStore
+    """
+    context_aware = True
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = False
+
+    def __init__(self, configuration=None, identifier=None):
+        self._term2id = {}
+        self._id2term = []
+        self._triples = {}  # key -> context id, or tuple of context ids
+        self._removed = set()  # Keys removed, still in the index arrays
+        self._spo = {}
+        self._pos = {}
+        self._osp = {}
+        self._sizes = {}  # context id -> number of statements
+        self._graphs = {}
+        self._namespaces = Memory()
+        Store.__init__(self, configuration, identifier)
+
+    #==============================================================================
+    # Terms encoding
+    #==============================================================================
+
+    def _term_id(self, term, create=False):
+        """
+        @brief      Returns the id of a term, or None if unknown and create
+                    is False
+        """
+        tid = self._term2id.get(term)
+        if tid is None and create:
+            tid = len(self._id2term)
+            self._term2id[term] = tid
+            self._id2term.append(term)
+        return tid
+
+    def _context_id(self, context, create=False):
+        """
+        @brief      Returns the id of a context graph or identifier
+        """
+        identifier = getattr(context, 'identifier', context)
+        if isinstance(context, rdflib.Graph):
+            self._graphs.setdefault(identifier, context)
+        return self._term_id(identifier, create)
+
+    def _graph(self, cid):
+        identifier = self._id2term[cid]
+        graph = self._graphs.get(identifier)
+        if graph is None:
+            graph = self._graphs.setdefault(identifier, rdflib.Graph(store=self, identifier=identifier))
+        return graph
+
+    def _decode(self, key):
+        id2term = self._id2term
+        return id2term[key >> 64], id2term[(key >> 32) & _MASK], id2term[key & _MASK]
+
+    def _graphs_of(self, contexts):
+        if isinstance(contexts, tuple):
+            for cid in contexts:
+                yield self._graph(cid)
+        else:
+            yield self._graph(contexts)
+
+    #==============================================================================
+    # Indexes
+    #==============================================================================
+
+    def _index(self, s, p, o):
+        for index, first, rest in ((self._spo, s, p << 32 | o), (self._pos, p, o << 32 | s), (self._osp, o, s << 32 | p)):
+            items = index.get(first)
+            if items is None:
+                items = index[first] = array(_TYPECODE)
+            items.append(rest)
+
+    def _compact(self):
+        """
+        @brief      Drop the removed statements from the index arrays
+        """
+        for index in (self._spo, self._pos, self._osp):
+            index.clear()
+        self._removed.clear()
+        for key in self._triples:
+            self._index(key >> 64, (key >> 32) & _MASK, key & _MASK)
+
+    def _match(self, triple):
+        """
+        @brief      Returns the keys of the statements matching a pattern,
+                    read from the shortest index array of the bound terms
+        """
+        ids = []
+        for term in triple:
+            if term is None:
+                ids.append(None)
+            else:
+                tid = self._term2id.get(term)
+                if tid is None:
+                    return []
+                ids.append(tid)
+        s, p, o = ids
+        if s is not None and p is not None and o is not None:
+            key = s << 64 | p << 32 | o
+            return [key] if key in self._triples else []
+        candidates = []
+        if s is not None:
+            candidates.append((len(self._spo.get(s, ())), 0))
+        if p is not None:
+            candidates.append((len(self._pos.get(p, ())), 1))
+        if o is not None:
+            candidates.append((len(self._osp.get(o, ())), 2))
+        if not candidates:
+            return list(self._triples)
+        _, position = min(candidates)
+        if position == 0:
+            keys = (s << 64 | rest for rest in self._spo.get(s, ()))
+        elif position == 1:
+            keys = ((rest & _MASK) << 64 | p << 32 | rest >> 32 for rest in self._pos.get(p, ()))
+        else:
+            keys = (rest << 32 | o for rest in self._osp.get(o, ()))
+        triples = self._triples
+        return [key for key in keys if key in triples and
+                (s is None or key >> 64 == s) and
+                (p is None or (key >> 32) & _MASK == p) and
+                (o is None or key & _MASK == o)]
+
+    #==============================================================================
+    # RDF APIs
+    #==============================================================================
+
+    def add(self, triple, context, quoted=False):
+        Store.add(self, triple, context, quoted)
+        s, p, o = [self._term_id(term, True) for term in triple]
+        cid = self._context_id(context, True)
+        key = s << 64 | p << 32 | o
+        contexts = self._triples.get(key)
+        if contexts is None:
+            self._triples[key] = cid
+            if key in self._removed:
+                self._removed.discard(key)
+            else:
+                self._index(s, p, o)
+        elif contexts == cid or (isinstance(contexts, tuple) and cid in contexts):
+            return
+        else:
+            self._triples[key] = (contexts if isinstance(contexts, tuple) else (contexts,)) + (cid,)
+        self._sizes[cid] = self._sizes.get(cid, 0) + 1
+
+    def remove(self, triple, context=None):
+        cid = None
+        if context is not None:
+            cid = self._context_id(context)
+            if cid is None:
+                return
+        for key in self._match(triple):
+            contexts = self._triples[key]
+            if not isinstance(contexts, tuple):
+                contexts = (contexts,)
+            if cid is None:
+                left = ()
+            elif cid in contexts:
+                left = tuple(c for c in contexts if c != cid)
+            else:
+                continue
+            for c in contexts:
+                if c not in left:
+                    self._sizes[c] -= 1
+            if not left:
+                del self._triples[key]
+                self._removed.add(key)
+            else:
+                self._triples[key] = left[0] if len(left) == 1 else left
+        if len(self._removed) > 1024 and len(self._removed) > len(self._triples):
+            self._compact()
+
+    def triples(self, triple, context=None):
+        cid = None
+        if context is not None:
+            cid = self._context_id(context)
+            if cid is None:
+                return
+        for key in self._match(triple):
+            contexts = self._triples.get(key)
+            if contexts is None:
+                continue
+            if cid is not None and not (contexts == cid or (isinstance(contexts, tuple) and cid in contexts)):
+                continue
+            yield self._decode(key), self._graphs_of(contexts)
+
+    def __len__(self, context=None):
+        if context is None:
+            return len(self._triples)
+        cid = self._context_id(context)
+        return self._sizes.get(cid, 0) if cid is not None else 0
+
+    def contexts(self, triple=None):
+        if triple is None or triple == (None, None, None):
+            cids = [cid for cid, size in self._sizes.items() if size]
+        else:
+            cids = set()
+            for key in self._match(triple):
+                contexts = self._triples[key]
+                cids.update(contexts if isinstance(contexts, tuple) else (contexts,))
+        return iter([self._graph(cid) for cid in cids])
+
+    #==============================================================================
+    # Namespaces
+    #==============================================================================
+
+    def bind(self, prefix, namespace, override=True):
+        self._namespaces.bind(prefix, namespace, override)
+
+    def namespace(self, prefix):
+        return self._namespaces.namespace(prefix)
+
+    def prefix(self, namespace):
+        return self._namespaces.prefix(namespace)
+
+    def namespaces(self):
+        return self._namespaces.namespaces()
+
+
+class SplitStore(Store):
+    """
+    @brief      Context aware rdflib store keeping some contexts in
+                dedicated stores, e.g. the scene in a CompactStore and
+                the ontologies in the default Memory store
+
+                The namespaces are kept by the default store. On the
+                whole graph the statements of all the stores are
+                returned once, with the contexts of every store.
+
+    Usage:
+        store = SplitStore(Memory(), {rdflib.URIRef('scene'): CompactStore()})
+        graph = rdflib.ConjunctiveGraph(store=store)
+    """
+    context_aware = True
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = False
+
+    def __init__(self, default, stores, configuration=None, identifier=None):
+        """
+        @param      default  (rdflib.store.Store) store of the other contexts
+        @param      stores   dict context identifier -> store
+        """
+        self._default = default
+        self._stores = dict((rdflib.URIRef(k) if not isinstance(k, rdflib.term.Identifier) else k, v) for k, v in stores.items())
+        Store.__init__(self, configuration, identifier)
+
+    def _all(self):
+        return [self._default] + list(self._stores.values())
+
+    def _store(self, context):
+        return self._stores.get(getattr(context, 'identifier', context), self._default)
+
+    @staticmethod
+    def _has(store, triple):
+        for _ in store.triples(triple, None):
+            return True
+        return False
+
+    def close(self, commit_pending_transaction=False):
+        for store in self._all():
+            store.close(commit_pending_transaction)
+
+    #==============================================================================
+    # RDF APIs
+    #==============================================================================
+
+    def add(self, triple, context, quoted=False):
+        Store.add(self, triple, context, quoted)
+        self._store(context).add(triple, context, quoted)
+
+    def addN(self, quads):
+        for s, p, o, c in quads:
+            self.add((s, p, o), c)
+
+    def remove(self, triple, context=None):
+        if context is None:
+            for store in self._all():
+                store.remove(triple, None)
+        else:
+            self._store(context).remove(triple, context)
+
+    def triples(self, triple, context=None):
+        if context is not None:
+            for statement in self._store(context).triples(triple, context):
+                yield statement
+            return
+        stores = self._all()
+        for i, store in enumerate(stores):
+            for statement, contexts in store.triples(triple, None):
+                if any(self._has(other, statement) for other in stores[:i]):
+                    continue
+                others = [other for other in stores[i + 1:] if self._has(other, statement)]
+                if others:
+                    contexts = chain(contexts, *[other.contexts(statement) for other in others])
+                yield statement, contexts
+
+    def __len__(self, context=None):
+        if context is not None:
+            return self._store(context).__len__(context)
+        stores = self._all()
+        size = len(stores[0])
+        for i, store in enumerate(stores[1:], 1):
+            size += sum(1 for statement, _ in store.triples((None, None, None), None)
+                        if not any(self._has(other, statement) for other in stores[:i]))
+        return size
+
+    def contexts(self, triple=None):
+        return chain(*[store.contexts(triple) for store in self._all()])
+
+    #==============================================================================
+    # Namespaces
+    #==============================================================================
+
+    def bind(self, prefix, namespace, override=True):
+        self._default.bind(prefix, namespace, override)
+
+    def namespace(self, prefix):
+        return self._default.namespace(prefix)
+
+    def prefix(self, namespace):
+        return self._default.prefix(namespace)
+
+    def namespaces(self):
+        return self._default.namespaces()
@@ -0,0 +1,272 @@
+import os
+import struct
+import pickle
+import threading
+import zlib
+import rdflib
+import skiros2_common.tools.logger as log
+from timeit import default_timer as now
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# Record header: payload length, payload crc32
+_HEADER = struct.Struct('<II')
+_ADD = '+'
+_REMOVE = '-'
+_RESET = '='
+_CHECKPOINT = 'checkpoint'
+_STOP = 'stop'
+
+
+def _write_record(f, record):
+    payload = pickle.dumps(record, 2)
+    f.write(_HEADER.pack(len(payload), zlib.crc32(payload) & 0xffffffff))
+    f.write(payload)
+
+
+def _read_records(f):
+    """
+    @brief      Read the records of a file, up to the end or to the first
+                truncated or corrupted record
+
+    @return     (list of records, size of the valid part of the file)
+    """
+    records = []
+    valid = 0
+    while True:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            break
+        size, crc = _HEADER.unpack(header)
+        payload = f.read(size)
+        if len(payload) < size or zlib.crc32(payload) & 0xffffffff != crc:
+            break
+        records.append(pickle.loads(payload))
+        valid = f.tell()
+    return records, valid
+
+
+class Journal(object):
+    """
+    @brief      Append-only journal of the statements added to and removed
+                from a context, with periodic checkpoints
+
+                The changes are queued and written by a background
+                thread, which keeps its own copy of the statements. A
+                checkpoint saves that copy and empties the journal, so
+                it never blocks the world model.
+
+                Files:
+                    <filepath>.checkpoint: the statements at the last checkpoint
+                    <filepath>.journal: the changes applied after it
+
+                Replaying the journal is idempotent, so a crash between a
+                checkpoint and the journal truncation is harmless.
+
+    Usage:
+        journal = Journal("~/.skiros/journal/scene")
+        statements = journal.recover()  # None if there is nothing to recover
+        journal.start(statements)
+        journal.append(statement, added)
+        journal.checkpoint()
+        journal.stop()
+    """
+
+    def __init__(self, filepath, checkpoint_interval=60.0, checkpoint_size=10000):
+        """
+        @param      filepath             Path of the files, without extension
+        @param      checkpoint_interval  (float) Seconds between the checkpoints,
+                                         if there are changes
+        @param      checkpoint_size      (int) Number of changes triggering
+                                         a checkpoint
+        """
+        self._checkpoint_file = filepath + ".checkpoint"
+        self._journal_file = filepath + ".journal"
+        self._checkpoint_interval = checkpoint_interval
+        self._checkpoint_size = checkpoint_size
+        self._queue = queue.Queue()
+        self._thread = None
+        self._statements = set()
+        self._pending = 0
+        self._file = None
+        self._failed = False  # The journal may end with a partial record
+
+    def recover(self):
+        """
+        @brief      Replay the journal onto the last checkpoint
+
+        @return     set of statements, or None if there is no checkpoint
+        """
+        if not os.path.isfile(self._checkpoint_file):
+            return None
+        with open(self._checkpoint_file, 'rb') as f:
+            records, _ = _read_records(f)
+        if not records:
+            log.error("[{}]".format(self.__class__.__name__), "Checkpoint {} is corrupted.".format(self._checkpoint_file))
+            return None
+        statements = set(records[0])
+        replayed = 0
+        if os.path.isfile(self._journal_file):
+            with open(self._journal_file, 'rb') as f:
+                records, valid = _read_records(f)
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+            if valid < size:
+                log.warn("[{}]".format(self.__class__.__name__), "Discarding {} bytes of incomplete records at the end of {}.".format(size - valid, self._journal_file))
+                with open(self._journal_file, 'r+b') as f:
+                    f.truncate(valid)
+            for record in records:
+                self._apply(statements, record)
+            replayed = len(records)
+        log.info("[{}]".format(self.__class__.__name__), "Recovered {} statements, {} changes replayed.".format(len(statements), replayed))
+        return statements
+
+    def start(self, statements):
+        """
+        @brief      Start the writer thread. The statements are saved as first
+                    checkpoint
+
+        @param      statements  iterable of the statements of the context
+        """
+        directory = os.path.dirname(os.path.abspath(self._journal_file))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self._statements = set(statements)
+        self._write_checkpoint()
+        self._thread = threading.Thread(target=self._run, name="journal_writer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        @brief      Write the queued changes and stop the writer thread
+        """
+        if self._thread is not None:
+            self._queue.put((_STOP,))
+            self._thread.join()
+            self._thread = None
+
+    def append(self, statement, added):
+        self._queue.put((_ADD if added else _REMOVE, statement))
+
+    def extend(self, changes):
+        """
+        @param      changes  list of (statement, added) couples
+        """
+        for statement, added in changes:
+            self.append(statement, added)
+
+    def reset(self, statements):
+        """
+        @brief      Replace all the statements, e.g. after loading a file.
+                    Triggers a checkpoint
+        """
+        self._queue.put((_RESET, list(statements)))
+
+    def checkpoint(self, export=None):
+        """
+        @brief      Request a checkpoint
+
+        @param      export  (filename, namespaces) to save also the
+                            statements in a turtle file, or None
+        """
+        self._queue.put((_CHECKPOINT, export))
+
+    def _apply(self, statements, record):
+        if record[0] == _ADD:
+            statements.add(record[1])
+        elif record[0] == _REMOVE:
+            statements.discard(record[1])
+
+    def _run(self):
+        last_checkpoint = now()
+        while True:
+            if self._pending:
+                timeout = max(0.0, last_checkpoint + self._checkpoint_interval - now())
+            else:
+                # Nothing to checkpoint: block until the next change, which
+                # gets a full interval before being checkpointed
+                timeout = None
+                last_checkpoint = now()
+            try:
+                records = [self._queue.get(timeout=timeout)]
+            except queue.Empty:
+                records = []
+            # Write all the queued changes at once
+            while True:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            checkpoint = self._pending and now() - last_checkpoint >= self._checkpoint_interval
+            exports = []
+            stop = False
+            changes = []
+            for record in records:
+                if record[0] in (_ADD, _REMOVE):
+                    self._apply(self._statements, record)
+                    changes.append(record)
+                    self._pending += 1
+                elif record[0] == _RESET:
+                    self._statements = set(record[1])
+                    checkpoint = True
+                elif record[0] == _CHECKPOINT:
+                    checkpoint = True
+                    if record[1] is not None:
+                        exports.append(record[1])
+                else:
+                    stop = True
+            if self._pending >= self._checkpoint_size:
+                checkpoint = True
+            try:
+                if checkpoint or self._failed:
+                    # The checkpoint has also the changes, and replaces a failed journal
+                    self._write_checkpoint()
+                    last_checkpoint = now()
+                elif changes:
+                    for record in changes:
+                        _write_record(self._file, record)
+                    self._sync()
+                for filename, namespaces in exports:
+                    self._export(filename, namespaces)
+            except (IOError, OSError) as e:
+                # Retried with the next change or checkpoint
+                self._failed = True
+                log.error("[{}]".format(self.__class__.__name__), "Failed writing the journal: {}".format(e))
+            if stop:
+                self._file.close()
+                return
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _write_checkpoint(self):
+        """
+        @brief      Save the statements and empty the journal
+        """
+        tmp = self._checkpoint_file + ".tmp"
+        with open(tmp, 'wb') as f:
+            _write_record(f, list(self._statements))
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp, self._checkpoint_file)
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self._journal_file, 'wb')
+        self._pending = 0
+        self._failed = False
+
+    def _export(self, filename, namespaces):
+        graph = rdflib.Graph()
+        for prefix, uri in namespaces:
+            graph.bind(prefix, uri)
+        for statement in self._statements:
+            graph.add(statement)
+        directory = os.path.dirname(os.path.abspath(filename))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        graph.serialize(filename, format='turtle')
@@ -2,7 +2,539 @@ import rdflib
 import skiros2_common.tools.logger as log
 from rdflib.namespace import RDF, RDFS, OWL
 import os.path
-from wrapt.decorators import synchronized
+import threading
+import weakref
+from collections import OrderedDict
+from rdflib.plugins.sparql import prepareQuery
+from skiros2_common.tools.rw_lock import ReadWriteLock, read_locked, write_locked
+from skiros2_world_model.core.parse_cache import parse_file, parse_files
+
+
+class NamespaceIndex(object):
+    """
+    @brief      Bidirectional prefix <-> namespace index, with interned
+                conversions for the most used uris
+
+                The index must be refreshed every time a prefix is bound
+                in the graph
+    """
+    cache_size = 100000
+
+    def __init__(self, namespaces=()):
+        self.refresh(namespaces)
+
+    def refresh(self, namespaces):
+        """
+        @brief      Rebuild the index
+
+        @param      namespaces  iterable of (prefix, namespace) couples, in
+                                binding order
+        """
+        prefixes = {}
+        uris = {}
+        for prefix, uri in namespaces:
+            prefixes.setdefault(uri[:-1], prefix)
+            uris.setdefault(prefix, str(uri))
+        self._prefixes = prefixes
+        self._uris = uris
+        self._lightstrings_cache = {}
+        self._uris_cache = {}
+
+    def get_prefix(self, namespace):
+        """
+        @brief      Returns the prefix bound to the namespace (without the
+                    trailing separator), or None
+        """
+        return self._prefixes.get(namespace)
+
+    def get_namespace(self, prefix):
+        """
+        @brief      Returns the namespace bound to the prefix, or None
+        """
+        return self._uris.get(prefix)
+
+    def uri2lightstring(self, uri):
+        try:
+            return self._lightstrings_cache[uri]
+        except KeyError:
+            pass
+        if isinstance(uri, rdflib.URIRef):
+            light = uri.n3().replace('<', '').replace('>', '')
+        else:
+            light = uri
+        if light.find("#") >= 0:
+            tokens = light.split("#")
+            prefix = self._prefixes.get(tokens[0])
+            if prefix is not None:
+                light = "{}:{}".format(prefix, tokens[1])
+        self._intern(self._lightstrings_cache, uri, light)
+        return light
+
+    def lightstring2uri(self, name):
+        """
+        @brief      Converts a prefixed name (prefix:name) to an uri
+        """
+        try:
+            return self._uris_cache[name]
+        except KeyError:
+            pass
+        tokens = name.split(":")
+        uri = self._uris.get(tokens[0])
+        if uri is not None:
+            uri = rdflib.term.URIRef("{}{}".format(uri, tokens[1]))
+        else:
+            uri = rdflib.term.URIRef(name)
+        self._intern(self._uris_cache, name, uri)
+        return uri
+
+    def _intern(self, cache, key, value):
+        if len(cache) >= self.cache_size:
+            cache.clear()
+        cache[key] = value
+
+
+class HierarchyIndex(object):
+    """
+    @brief      Transitive closure of a hierarchy predicate (e.g.
+                rdfs:subClassOf)
+
+                The parent/children maps are built once from the graph
+                and then updated incrementally. Closures are computed on
+                demand and cached until a triple touching one of their
+                members is added or removed
+    """
+
+    def __init__(self, predicate):
+        self._predicate = predicate
+        self._children = None
+        self._parents = None
+        self._closures = {}
+
+    @property
+    def predicate(self):
+        return self._predicate
+
+    def invalidate(self):
+        """
+        @brief      Drop the index, it is rebuilt at the next lookup
+        """
+        self._children = None
+        self._parents = None
+        self._closures = {}
+
+    def clear_closures(self):
+        self._closures = {}
+
+    def add(self, child, parent):
+        if self._children is None:
+            return
+        self._children.setdefault(parent, {})[child] = None
+        self._parents.setdefault(child, {})[parent] = None
+        self._invalidate_ancestors(parent)
+
+    def remove(self, child, parent, graph):
+        """
+        @brief      Remove an edge, unless the triple is still asserted in
+                    another context of the graph
+        """
+        if self._children is None or (child, self._predicate, parent) in graph:
+            return
+        self._children.get(parent, {}).pop(child, None)
+        self._parents.get(child, {}).pop(parent, None)
+        self._invalidate_ancestors(parent)
+
+    def ancestors(self, graph, uri):
+        """
+        @brief      Returns the set of uri and of its ancestors
+        """
+        return self._walk(graph, uri, True)
+
+    def descendants(self, graph, uri):
+        """
+        @brief      Returns the set of uri and of its descendants
+        """
+        return self._walk(graph, uri, False)
+
+    def _walk(self, graph, uri, upwards):
+        if self._children is None:
+            self._build(graph)
+        edges = self._parents if upwards else self._children
+        visited = set()
+        stack = [uri]
+        while stack:
+            node = stack.pop()
+            if node not in visited:
+                visited.add(node)
+                stack.extend(edges.get(node, ()))
+        return visited
+
+    def get(self, graph, key, uri, to_lightstring):
+        """
+        @brief      Returns the closure of uri
+
+        @param      key             the name used by the caller for uri,
+                                    always first in the closure
+        @param      to_lightstring  function used to convert the uris of
+                                    the descendants
+
+        @return     a tuple (list of names in depth-first order, frozenset
+                    of the same names)
+        """
+        closure = self._closures.get(key)
+        if closure is not None:
+            return closure[1], closure[2]
+        if self._children is None:
+            self._build(graph)
+        members = [uri]
+        names = [key]
+        visited = set(members)
+        stack = [iter(self._children.get(uri, ()))]
+        while stack:
+            node = next(stack[-1], None)
+            if node is None:
+                stack.pop()
+            elif node not in visited:
+                visited.add(node)
+                members.append(node)
+                names.append(to_lightstring(node))
+                stack.append(iter(self._children.get(node, ())))
+        closure = (frozenset(members), tuple(names), frozenset(names))
+        self._closures[key] = closure
+        return closure[1], closure[2]
+
+    def _build(self, graph):
+        children = {}
+        parents = {}
+        for child, parent in graph.subject_objects(self._predicate):
+            children.setdefault(parent, {})[child] = None
+            parents.setdefault(child, {})[parent] = None
+        self._children = children
+        self._parents = parents
+        self._closures = {}
+
+    def _invalidate_ancestors(self, uri):
+        ancestors = set()
+        stack = [uri]
+        while stack:
+            node = stack.pop()
+            if node not in ancestors:
+                ancestors.add(node)
+                stack.extend(self._parents.get(node, ()))
+        self._closures = {k: v for k, v in self._closures.items() if ancestors.isdisjoint(v[0])}
+
+
+class PropertyKindsIndex(object):
+    """
+    @brief      Classification of the properties defined in the graph as
+                owl:DatatypeProperty, owl:ObjectProperty or
+                owl:AnnotationProperty
+
+                The table is built at the first lookup and dropped when a
+                property declaration is added or removed
+    """
+    # In order of precedence, last wins
+    kinds = (OWL.AnnotationProperty, OWL.ObjectProperty, OWL.DatatypeProperty)
+
+    def __init__(self):
+        self._kinds = None
+
+    def invalidate(self):
+        self._kinds = None
+
+    def get(self, graph):
+        """
+        @brief      Returns a dict property uri -> kind
+        """
+        kinds = self._kinds
+        if kinds is None:
+            kinds = {}
+            for kind in self.kinds:
+                for subj in graph.subjects(RDF.type, kind):
+                    kinds[subj] = kind
+            self._kinds = kinds
+        return kinds
+
+
+INFERRED_CONTEXT = 'inferred'
+
+
+class InferredTypes(object):
+    """
+    @brief      Materialized rdf:type statements entailed by
+                rdfs:subClassOf: x rdf:type C for every super class C of
+                an asserted type of x, when not asserted
+
+                The statements are kept in the INFERRED_CONTEXT context,
+                so that on the whole graph x rdf:type C matches as
+                x rdf:type/rdfs:subClassOf* C. They are updated with the
+                asserted statements, recomputing only the subjects whose
+                types are affected, and rebuilt after a bulk change.
+                Disabled until enable is called
+    """
+
+    def __init__(self):
+        self._context = None
+
+    @property
+    def enabled(self):
+        return self._context is not None
+
+    def enable(self, graph, hierarchy):
+        self._context = graph.get_context(INFERRED_CONTEXT)
+        self.rebuild(graph, hierarchy)
+
+    def __contains__(self, statement):
+        return self._context is not None and statement in self._context
+
+    def rebuild(self, graph, hierarchy):
+        if self._context is None:
+            return
+        graph.remove_context(self._context)
+        ancestors = {}
+        for subject in set(graph.subjects(RDF.type, None)):
+            self._update_subject(graph, hierarchy, subject, ancestors)
+
+    def update(self, graph, hierarchy, statement):
+        """
+        @brief      Update the inferred statements after an asserted
+                    statement was added or removed
+
+        @return     True if the inferred statements changed
+        """
+        if self._context is None:
+            return False
+        subj, predicate, obj = statement
+        if predicate == RDF.type:
+            subjects = [subj]
+        elif predicate == RDFS.subClassOf:
+            subjects = set()
+            for cls in hierarchy.descendants(graph, subj):
+                subjects.update(graph.subjects(RDF.type, cls))
+        else:
+            return False
+        changed = False
+        ancestors = {}
+        for subject in subjects:
+            changed = self._update_subject(graph, hierarchy, subject, ancestors) or changed
+        return changed
+
+    def _update_subject(self, graph, hierarchy, subject, ancestors):
+        """
+        @param      ancestors  dict class -> ancestors, memo of the caller
+        """
+        asserted = set(o for _, _, o, c in graph.quads((subject, RDF.type, None)) if c.identifier != self._context.identifier)
+        entailed = set()
+        for cls in asserted:
+            if cls not in ancestors:
+                ancestors[cls] = hierarchy.ancestors(graph, cls)
+            entailed |= ancestors[cls]
+        entailed -= asserted
+        current = set(self._context.objects(subject, RDF.type))
+        for cls in current - entailed:
+            self._context.remove((subject, RDF.type, cls))
+        for cls in entailed - current:
+            self._context.add((subject, RDF.type, cls))
+        return entailed != current
+
+
+# Queries with a fixed text, the variables being set with the bindings
+QUERY_TEMPLATES = {
+    'individuals': "SELECT ?x WHERE { ?x rdf:type/rdfs:subClassOf* ?class . }",
+    'direct_individuals': "SELECT ?x WHERE { ?x rdf:type+ ?class . }",
+    'type': "SELECT ?x WHERE { ?uri rdf:type ?x . }",
+    'instances': "SELECT ?x WHERE { ?x rdf:type ?uri . }",
+    'triples': "SELECT ?x ?y ?z WHERE { ?x ?y ?z . }",
+    'super_classes': "SELECT ?x WHERE { ?uri rdfs:subClassOf ?x . }",
+    'sub_classes': "SELECT ?x WHERE { ?x rdfs:subClassOf* ?uri . }",
+    'direct_sub_classes': "SELECT ?x WHERE { ?x rdfs:subClassOf ?uri . }",
+    'sub_properties': "SELECT ?x WHERE { ?x rdfs:subPropertyOf* ?uri . }",
+    'direct_sub_properties': "SELECT ?x WHERE { ?x rdfs:subPropertyOf ?uri . }",
+    'range': "SELECT ?x WHERE { ?uri rdfs:range ?x . }",
+}
+# Same answers on the whole graph, if the inferred types are enabled
+INFERRED_QUERY_TEMPLATES = {
+    'individuals': "SELECT ?x WHERE { ?x rdf:type ?class . }",
+}
+
+
+class CacheStats(object):
+    """
+    @brief      Hit and miss counters of a cache
+    """
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
+
+
+class QueryCache(CacheStats):
+    """
+    @brief      LRU cache of the parsed and translated SPARQL queries,
+                keyed by query text
+
+                The prefixes are resolved when a query is prepared, so
+                the cache must be cleared every time a prefix is bound
+    """
+    cache_size = 256
+
+    def __init__(self):
+        self._queries = OrderedDict()
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def clear(self):
+        with self._lock:
+            self._queries.clear()
+
+    def get(self, query, namespaces):
+        """
+        @brief      Returns the prepared query, preparing it if not in cache
+
+        @param      namespaces  function returning the (prefix, namespace)
+                                couples to resolve the query prefixes
+        """
+        # Whitespace is not significant, unless in a string literal
+        key = query if '"' in query or "'" in query else " ".join(query.split())
+        with self._lock:
+            prepared = self._queries.pop(key, None)
+            if prepared is not None:
+                self._queries[key] = prepared
+                self.hits += 1
+                return prepared
+            self.misses += 1
+        prepared = prepareQuery(query, initNs=dict(namespaces()))
+        with self._lock:
+            self._queries[key] = prepared
+            while len(self._queries) > self.cache_size:
+                self._queries.popitem(last=False)
+        return prepared
+
+
+class ContextVersions(object):
+    """
+    @brief      Counters of the modifications of each context, and of the
+                whole graph
+
+                A result read from a context is up to date as long as the
+                context version is unchanged
+    """
+
+    def __init__(self):
+        self._versions = {}
+        self._total = 0
+        self._generation = 0  # Modifications of every context
+        self._lock = threading.Lock()
+
+    def touch(self, context=None):
+        """
+        @brief      Count a modification of a context (identifier). None
+                    is a modification of every context
+        """
+        with self._lock:
+            self._total += 1
+            if context is None:
+                self._generation += 1
+            else:
+                self._versions[context] = self._versions.get(context, 0) + 1
+
+    def get(self, context=None):
+        """
+        @brief      The version of a context (identifier), or of the whole
+                    graph if None. Both counters only grow, so their sum
+                    changes with either
+        """
+        if context is None:
+            return self._total
+        return self._generation + self._versions.get(context, 0)
+
+
+class ResultCache(CacheStats):
+    """
+    @brief      LRU cache of query results, bounded by a memory budget
+
+                Every result is stored with the version of the context it
+                was read from, and is dropped at the first lookup after
+                the context is modified
+    """
+    budget = 16 * 1024 * 1024  # Bytes, as estimated by the callers
+
+    def __init__(self, budget=None):
+        if budget is not None:
+            self.budget = budget
+        self._results = OrderedDict()  # key -> (version, result, size)
+        self._lock = threading.Lock()
+        self.size = 0
+        self.reset_stats()
+
+    def __len__(self):
+        return len(self._results)
+
+    def reset_stats(self):
+        CacheStats.reset_stats(self)
+        self.invalidations = 0
+        self.evictions = 0
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self.size = 0
+
+    def get(self, key, version):
+        """
+        @brief      Returns the result stored for key at version, None if
+                    not in cache or outdated
+        """
+        with self._lock:
+            entry = self._results.pop(key, None)
+            if entry is not None:
+                if entry[0] == version:
+                    self._results[key] = entry
+                    self.hits += 1
+                    return entry[1]
+                self.size -= entry[2]
+                self.invalidations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, version, result, size):
+        """
+        @brief      Store a result, evicting the least recently used ones
+                    to stay in the budget
+
+        @param      size  (int) estimated memory of the result, in bytes
+        """
+        if size > self.budget:
+            return
+        with self._lock:
+            old = self._results.pop(key, None)
+            if old is not None:
+                self.size -= old[2]
+            self._results[key] = (version, result, size)
+            self.size += size
+            while self.size > self.budget:
+                _, (_, _, evicted) = self._results.popitem(last=False)
+                self.size -= evicted
+                self.evictions += 1
+
+
+_shared_indexes = weakref.WeakKeyDictionary()
+
+
+def _get_shared_index(graph, name, factory):
+    """
+    @brief      Returns an index of a graph. Indexes are shared by all the
+                Ontology instances working on the same store
+
+    @param      factory  function creating the index, if not existing
+    """
+    indexes = _shared_indexes.setdefault(graph.store, {})
+    if name not in indexes:
+        indexes[name] = factory()
+    return indexes[name]
 
 
 class Ontology:
@@ -13,7 +545,16 @@ class Ontology:
         if graph is not None:
             self._ontology = graph
         else:
-            self._ontology = rdflib.ConjunctiveGraph()  # store='Sleepycat' #TODO:
+            self._ontology = rdflib.ConjunctiveGraph()  # In memory. See SQLiteStore for a persistent graph
+        self._namespaces = _get_shared_index(self._ontology, 'namespaces', lambda: NamespaceIndex(self._ontology.namespaces()))
+        self._classes_hierarchy = _get_shared_index(self._ontology, 'classes', lambda: HierarchyIndex(RDFS.subClassOf))
+        self._properties_hierarchy = _get_shared_index(self._ontology, 'properties', lambda: HierarchyIndex(RDFS.subPropertyOf))
+        self._property_kinds = _get_shared_index(self._ontology, 'property_kinds', PropertyKindsIndex)
+        self._queries = _get_shared_index(self._ontology, 'queries', QueryCache)
+        self._versions = _get_shared_index(self._ontology, 'versions', ContextVersions)
+        self._inferred_types = _get_shared_index(self._ontology, 'inferred_types', InferredTypes)
+        # Shared for queries, exclusive for modifications. Also shared by all the instances working on the same store
+        self._rw_lock = _get_shared_index(self._ontology, 'lock', ReadWriteLock)
 
     def ontology(self, context_id=""):
         """
@@ -21,6 +562,8 @@ class Ontology:
 
         @param context_id can be a rdflib.Graph, an rdflib.URIRef or a string
         """
+        if isinstance(context_id, rdflib.Graph):
+            return context_id
         if context_id == "" or context_id == self._ontology.identifier:
             return self._ontology
         else:
@@ -38,8 +581,82 @@ class Ontology:
 
     def _bind(self, prefix, uri):
         self._ontology.namespace_manager.bind(prefix, uri, True, True)
+        self._refresh_namespaces()
         return rdflib.Namespace(uri)
 
+    def _refresh_namespaces(self):
+        """
+        @brief      Sync the namespace index with the graph bindings
+        """
+        self._namespaces.refresh(self._ontology.namespaces())
+        self._queries.clear()
+        self._classes_hierarchy.clear_closures()
+        self._properties_hierarchy.clear_closures()
+
+    def _invalidate_ontology_indexes(self):
+        """
+        @brief      Drop the hierarchy and property indexes after a bulk
+                    change of the graph
+        """
+        self._classes_hierarchy.invalidate()
+        self._properties_hierarchy.invalidate()
+        self._property_kinds.invalidate()
+        if self._inferred_types.enabled:
+            self._inferred_types.rebuild(self._ontology, self._classes_hierarchy)
+            self._touch_context(INFERRED_CONTEXT)
+
+    def _update_ontology_indexes(self, statement, added):
+        """
+        @brief      Keep the hierarchy and property indexes in sync with an
+                    added/removed statement
+        """
+        if statement[1] == RDF.type and statement[2] in PropertyKindsIndex.kinds:
+            self._property_kinds.invalidate()
+        for hierarchy in (self._classes_hierarchy, self._properties_hierarchy):
+            if statement[1] == hierarchy.predicate:
+                if added:
+                    hierarchy.add(statement[0], statement[2])
+                else:
+                    hierarchy.remove(statement[0], statement[2], self._ontology)
+        if self._inferred_types.update(self._ontology, self._classes_hierarchy, statement):
+            self._touch_context(INFERRED_CONTEXT)
+
+    def _touch_context(self, context_id=""):
+        """
+        @brief      Count a modification of a context, see context_version
+        """
+        graph = self.ontology(context_id)
+        self._versions.touch(None if graph is self._ontology else graph.identifier)
+
+    def context_version(self, context_id=""):
+        """
+        @brief      Returns a counter changed by every modification of the
+                    context, or of any context if context_id is empty
+        """
+        graph = self.ontology(context_id)
+        return self._versions.get(None if graph is self._ontology else graph.identifier)
+
+    @write_locked
+    def enable_inferred_types(self):
+        """
+        @brief      Materialize the rdf:type statements entailed by
+                    rdfs:subClassOf in the INFERRED_CONTEXT context, see
+                    InferredTypes
+        """
+        if not self._inferred_types.enabled:
+            self._inferred_types.enable(self._ontology, self._classes_hierarchy)
+            self._touch_context(INFERRED_CONTEXT)
+
+    def query_template(self, template_id, context_id=""):
+        """
+        @brief      Returns the text of a query of QUERY_TEMPLATES. With the
+                    inferred types, queries on the whole graph use direct
+                    rdf:type patterns instead of paths
+        """
+        if context_id == "" and self._inferred_types.enabled and template_id in INFERRED_QUERY_TEMPLATES:
+            return INFERRED_QUERY_TEMPLATES[template_id]
+        return QUERY_TEMPLATES[template_id]
+
     def set_default_prefix(self, prefix, uri):
         self._default_uri = self._bind(prefix, uri)
 
@@ -49,17 +666,7 @@ class Ontology:
     def uri2lightstring(self, uri):
         if not uri:
             return uri
-        if isinstance(uri, rdflib.URIRef):
-            uri = uri.n3()
-            uri = uri.replace('<', '')
-            uri = uri.replace('>', '')
-        if uri.find("#") < 0:
-            return uri
-        tokens = uri.split("#")
-        for prefix, uri1 in self._ontology.namespaces():
-            if tokens[0] == uri1[:-1]:
-                return "{}:{}".format(prefix, tokens[1])  # TODO: can it be optimized?
-        return uri
+        return self._namespaces.uri2lightstring(uri)
 
     def lightstring2uri(self, name):
         if isinstance(name, rdflib.URIRef):
@@ -72,11 +679,7 @@ class Ontology:
             if name.find(":") == 0:
                 name = name[1:]
             return self.add_default_prefix(name)
-        tokens = name.split(":")
-        for prefix, uri in self._ontology.namespaces():
-            if tokens[0] == prefix:
-                return rdflib.term.URIRef("{}{}".format(uri, tokens[1]))  # TODO: can it be optimized?
-        return rdflib.term.URIRef(name)
+        return self._namespaces.lightstring2uri(name)
 
     def has_context(self, context_id):
         """
@@ -104,14 +707,19 @@ class Ontology:
         for i in imports:
             new.add((rdfterm, OWL.imports, self.lightstring2uri(i)))
         self._add_prefix(uri, context_id)
+        self._touch_context(new)
         return new
 
-    def load(self, ontology_uri, context_id="", initialize=False):
+    @write_locked
+    def load(self, ontology_uri, context_id="", initialize=False, cache=None, parsed=None):
         """
         @brief Load an ontology
 
         @param context_id the id for the ontology context. If None it is generated
         @param initialize if True the context is reinitialized
+        @param cache (ParseCache) if set, a local file is read from the cache while unchanged,
+                     and cached after parsing
+        @param parsed (prefixes, statements) of the file, if already parsed with parse_files
 
         @return A context id (string) if the file defines an ontology, None otherwise
         """
@@ -119,12 +727,44 @@ class Ontology:
         if initialize and context_id is not None:
             self._ontology.remove_context(context_id)
         if not context_id:
-            context_id = ontology_uri[ontology_uri.rfind("/") + 1:ontology_uri.rfind(".")].lower()
-        contextg = self._ontology.parse(ontology_uri, publicID=context_id)
+            context_id = self.default_context_id(ontology_uri)
+        if parsed is None and cache is not None:
+            parsed = parse_files([(ontology_uri, context_id, None)], cache)[0]
+        elif parsed is None:
+            # Parsed apart, so that the store adds the statements at once
+            parsed = parse_file(ontology_uri, context_id)
+        # Same graph as parse(): since rdflib 7 the files are loaded in the default context
+        if int(rdflib.__version__.split('.')[0]) >= 7:
+            contextg = self._ontology.default_context
+        else:
+            contextg = self.ontology(context_id)
+        self._merge(contextg, *parsed)
+        # Parsing can bind the prefixes declared in the file
+        self._refresh_namespaces()
+        self._invalidate_ontology_indexes()
+        self._touch_context(context_id)
         context = contextg.value(predicate=RDF.type, object=OWL.Ontology)
         if context:
             return self._add_prefix(context)
 
+    @staticmethod
+    def default_context_id(ontology_uri):
+        """
+        @brief      The context id of an ontology file loaded without one:
+                    the lowercase file name, without extension
+        """
+        return ontology_uri[ontology_uri.rfind("/") + 1:ontology_uri.rfind(".")].lower()
+
+    def _merge(self, graph, namespaces, statements):
+        """
+        @brief      Add the statements and prefixes of a file parsed apart,
+                    see parse_files
+        """
+        graph.addN((s, p, o, graph) for s, p, o in statements)
+        for prefix, namespace in namespaces:
+            # As the parsers do, the prefixes already bound are kept
+            self._ontology.bind(prefix, namespace, override=False)
+
     def save(self, file, context_id=""):
         """
         @brief Save the ontology
@@ -133,17 +773,66 @@ class Ontology:
         """
         self.ontology(context_id).serialize(destination=file, format='turtle')
 
-    @synchronized
-    def query(self, query, context_id=""):
-        return self.ontology(context_id).query(query)
+    @read_locked
+    def query(self, query, context_id="", bindings=None):
+        """
+        @brief      Run a SPARQL query. The query is parsed once and cached
 
+        @param      bindings  dict variable name -> rdflib term, values of
+                              variables of the query
+        """
+        prepared = self._queries.get(query, self._ontology.namespaces)
+        return self.ontology(context_id).query(prepared, initBindings=bindings)
+
+    @write_locked
     def add_relation(self, r, context_id, author):
-        self.ontology(context_id).add((self.lightstring2uri(r['src']), self.lightstring2uri(r['type']), self.lightstring2uri(r['dst'])))
+        statement = (self.lightstring2uri(r['src']), self.lightstring2uri(r['type']), self.lightstring2uri(r['dst']))
+        self.ontology(context_id).add(statement)
+        self._update_ontology_indexes(statement, True)
+        self._touch_context(context_id)
 
+    @write_locked
     def remove_relation(self, r, context_id, author):
-        self.ontology(context_id).remove((self.lightstring2uri(r['src']), self.lightstring2uri(r['type']), self.lightstring2uri(r['dst'])))
+        statement = (self.lightstring2uri(r['src']), self.lightstring2uri(r['type']), self.lightstring2uri(r['dst']))
+        self.ontology(context_id).remove(statement)
+        self._update_ontology_indexes(statement, False)
+        self._touch_context(context_id)
+
+    def get_property_kind(self, predicate):
+        """
+        @brief      Returns the declared kind of a property
+                    (owl:DatatypeProperty, owl:ObjectProperty,
+                    owl:AnnotationProperty) or None if not declared
+        """
+        return self._property_kinds.get(self._ontology).get(self.lightstring2uri(predicate))
+
+    def get_sub_classes_set(self, parent_class):
+        """
+        @brief      Like get_sub_classes, recursive on the whole graph, but
+                    returns a cached frozenset
+        """
+        return self._get_closure(self._classes_hierarchy, parent_class)[1]
+
+    def get_sub_properties_set(self, parent_property):
+        """
+        @brief      Like get_sub_properties, recursive on the whole graph,
+                    but returns a cached frozenset
+        """
+        return self._get_closure(self._properties_hierarchy, parent_property)[1]
+
+    def get_sub_relations_set(self, parent_property):
+        """
+        @brief      Like get_sub_relations, recursive on the whole graph, but
+                    returns a cached frozenset
+        """
+        return self._get_closure(self._properties_hierarchy, parent_property)[1]
+
+    def _get_closure(self, hierarchy, name):
+        return hierarchy.get(self._ontology, name, self.lightstring2uri(name), self.uri2lightstring)
 
     def get_sub_classes(self, parent_class, context_id="", recursive=True):
+        if recursive and not context_id:
+            return list(self._get_closure(self._classes_hierarchy, parent_class)[0])
         to_ret = []
         to_ret.append(parent_class)
         uri = self.lightstring2uri(parent_class)
@@ -155,6 +844,8 @@ class Ontology:
         return to_ret
 
     def get_sub_properties(self, parent_property="topDataProperty", context_id="", recursive=True):
+        if recursive and not context_id:
+            return list(self._get_closure(self._properties_hierarchy, parent_property)[0])
         to_ret = []
         to_ret.append(parent_property)
         uri = self.lightstring2uri(parent_property)
@@ -166,6 +857,8 @@ class Ontology:
         return to_ret
 
     def get_sub_relations(self, parent_property="topObjectProperty", context_id="", recursive=True):
+        if recursive and not context_id:
+            return list(self._get_closure(self._properties_hierarchy, parent_property)[0])
         to_ret = []
         to_ret.append(parent_property)
         uri = self.lightstring2uri(parent_property)
@@ -0,0 +1,171 @@
+import os
+import hashlib
+import pickle
+import multiprocessing
+import rdflib
+import skiros2_common.tools.logger as log
+from timeit import default_timer as now
+
+# Changed when the format of the entries changes, to drop the old ones
+_FORMAT = 2
+
+
+class ParseCache(object):
+    """
+    @brief      Cache of parsed ontology files
+
+                The statements of a file and the prefixes bound by
+                parsing it are pickled in the cache directory, and read
+                back instead of parsing the file again while its path,
+                modification time and size are unchanged. A file parsed
+                with another context id (the base of its relative uris)
+                or format is cached apart
+
+    Usage:
+        cache = ParseCache('~/.skiros/parse_cache')
+        ontology.load('skiros.owl', cache=cache)
+    """
+
+    def __init__(self, directory):
+        self._directory = os.path.expanduser(directory)
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def directory(self):
+        return self._directory
+
+    def _entry(self, filename, context_id, format):
+        """
+        @brief      Returns the cache file of an ontology file parsed with
+                    context_id and format, and the key of its current content
+        """
+        filename = os.path.abspath(filename)
+        stat = os.stat(filename)
+        source = (filename, context_id, format)
+        key = (_FORMAT, rdflib.__version__) + source + (stat.st_mtime, stat.st_size)
+        name = hashlib.sha1(repr(source).encode('utf-8')).hexdigest() + '.pickle'
+        return os.path.join(self._directory, name), key
+
+    def load(self, filename, context_id="", format=None):
+        """
+        @brief      Read a file from the cache
+
+        @param      context_id  the context id the file was parsed with
+        @param      format      the format the file was parsed with
+
+        @return     (prefixes, statements), None if the file is not a local
+                    file, is not in cache or changed since it was cached
+        """
+        if not os.path.isfile(filename):
+            return None
+        entry, key = self._entry(filename, context_id, format)
+        try:
+            with open(entry, 'rb') as f:
+                cached_key, namespaces, statements = pickle.load(f)
+        except IOError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            log.warn("[{}]".format(self.__class__.__name__), "Dropping unreadable cache of {}: {}".format(filename, e))
+            self.misses += 1
+            return None
+        if cached_key != key:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return namespaces, statements
+
+    def store(self, filename, namespaces, statements, context_id="", format=None):
+        """
+        @brief      Write a parsed file in the cache. Errors are logged:
+                    the cache is only an optimization
+
+        @param      namespaces  list of (prefix, namespace) bound by parsing
+                                the file
+        @param      statements  list of (s, p, o) triples of the file
+        @param      context_id  the context id the file was parsed with
+        @param      format      the format the file was parsed with
+        """
+        if not os.path.isfile(filename):
+            return
+        entry, key = self._entry(filename, context_id, format)
+        temp = entry + '.tmp'
+        try:
+            if not os.path.isdir(self._directory):
+                os.makedirs(self._directory)
+            with open(temp, 'wb') as f:
+                pickle.dump((key, list(namespaces), list(statements)), f, 2)
+            os.rename(temp, entry)
+        except (IOError, OSError) as e:
+            log.warn("[{}]".format(self.__class__.__name__), "Can not cache {}: {}".format(filename, e))
+
+
+def parse_file(filename, context_id, format=None):
+    """
+    @brief      Parse a file apart from any graph. Runs in the worker
+                processes of parse_files
+
+    @param      context_id  the base of the relative uris in the file, the
+                            file location if None
+    @param      format      the file format, guessed from the extension
+                            if None
+
+    @return     (prefixes bound by the file, list of statements)
+    """
+    graph = rdflib.Graph(identifier=context_id)
+    graph.parse(filename, publicID=context_id, format=format)
+    defaults = set(rdflib.Graph().namespaces())
+    return [n for n in graph.namespaces() if n not in defaults], list(graph)
+
+
+def _parse_timed(args):
+    start = now()
+    parsed = parse_file(*args)
+    return parsed, now() - start
+
+
+def parse_files(files, cache=None, processes=None, times=None):
+    """
+    @brief      Parse several files. The files not in cache are parsed in
+                a pool of worker processes, if more than one file and more
+                than one process
+
+                The workers are spawned, not forked: forking a process
+                with threads, like a ros node, can leave a child waiting
+                for a lock held by another thread of the parent. The
+                workers import the main module, which must start the node
+                only if __name__ == '__main__'.
+                Without the spawn start method (Python 2), the files are
+                parsed in this process
+
+    @param      files      list of (filename, context_id, format), see
+                           parse_file
+    @param      cache      (ParseCache) if set, the unchanged files are read
+                           from it, and the parsed ones are cached
+    @param      processes  (int) number of worker processes, the number
+                           of cores if None. 1 to parse in this process
+    @param      times      (dict) if set, filled with filename -> seconds
+                           spent parsing, for the parsed files
+
+    @return     list of (prefixes, statements), in the order of files
+    """
+    parsed = [cache.load(*f) if cache is not None else None for f in files]
+    missing = [i for i, p in enumerate(parsed) if p is None]
+    processes = min(processes or multiprocessing.cpu_count(), len(missing))
+    if processes > 1 and hasattr(multiprocessing, 'get_context'):
+        pool = multiprocessing.get_context('spawn').Pool(processes)
+        try:
+            results = pool.map(_parse_timed, [files[i] for i in missing])
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_parse_timed(files[i]) for i in missing]
+    for i, (result, seconds) in zip(missing, results):
+        parsed[i] = result
+        if cache is not None:
+            cache.store(files[i][0], result[0], result[1], files[i][1], files[i][2])
+        if times is not None:
+            times[files[i][0]] = seconds
+    return parsed
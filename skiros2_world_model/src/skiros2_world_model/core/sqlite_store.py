@@ -0,0 +1,318 @@
+import os
+import sqlite3
+import threading
+import rdflib
+from rdflib.store import Store, VALID_STORE, NO_STORE
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS terms (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    datatype TEXT NOT NULL DEFAULT '',
+    lang TEXT NOT NULL DEFAULT '',
+    UNIQUE (kind, value, datatype, lang));
+CREATE TABLE IF NOT EXISTS quads (
+    s INTEGER NOT NULL,
+    p INTEGER NOT NULL,
+    o INTEGER NOT NULL,
+    c INTEGER NOT NULL,
+    PRIMARY KEY (s, p, o, c)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS quads_po ON quads (p, o);
+CREATE INDEX IF NOT EXISTS quads_o ON quads (o);
+CREATE INDEX IF NOT EXISTS quads_c ON quads (c);
+CREATE TABLE IF NOT EXISTS namespaces (
+    prefix TEXT PRIMARY KEY,
+    uri TEXT NOT NULL,
+    ordering INTEGER NOT NULL);
+"""
+
+
+class SQLiteStore(Store):
+    """
+    @brief      Context aware rdflib store persisted in a SQLite database
+
+                Every term is stored once in the terms table and the
+                statements refer to it by id. Terms are decoded on
+                demand and cached, so that reopening a graph doesn't
+                read anything but the namespaces.
+
+                Every modification is committed immediately (WAL
+                journal), parsing commits once per file. Terms are never
+                deleted.
+
+    Usage:
+        graph = rdflib.ConjunctiveGraph(store=SQLiteStore("/path/wm.sqlite"))
+        ...
+        graph.close()
+    """
+    context_aware = True
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = False
+
+    def __init__(self, configuration=None, identifier=None):
+        self._db = None
+        self._lock = threading.RLock()
+        self._term2id = {}
+        self._id2term = {}
+        self._graphs = {}
+        self._namespace = {}
+        self._prefix = {}
+        Store.__init__(self, configuration, identifier)
+
+    #==============================================================================
+    # Database management
+    #==============================================================================
+
+    def open(self, configuration, create=True):
+        """
+        @brief      Open the database file
+
+        @param      configuration  (string) path of the database file
+        @param      create         (bool) create the database if not existing
+
+        @return     VALID_STORE, or NO_STORE if the file doesn't exist and
+                    create is False
+        """
+        if not create and not os.path.isfile(configuration):
+            return NO_STORE
+        directory = os.path.dirname(os.path.abspath(configuration))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self._db = sqlite3.connect(configuration, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        for prefix, uri in self._db.execute("SELECT prefix, uri FROM namespaces ORDER BY ordering"):
+            self._namespace[prefix] = rdflib.URIRef(uri)
+            self._prefix[rdflib.URIRef(uri)] = prefix
+        return VALID_STORE
+
+    def close(self, commit_pending_transaction=False):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def destroy(self, configuration):
+        self.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.isfile(configuration + suffix):
+                os.remove(configuration + suffix)
+
+    #==============================================================================
+    # Terms encoding
+    #==============================================================================
+
+    def _encode(self, term):
+        if isinstance(term, rdflib.Literal):
+            return ('L', str(term), str(term.datatype or ''), term.language or '')
+        elif isinstance(term, rdflib.BNode):
+            return ('B', str(term), '', '')
+        return ('U', str(term), '', '')
+
+    def _decode(self, kind, value, datatype, lang):
+        if kind == 'U':
+            return rdflib.URIRef(value)
+        elif kind == 'B':
+            return rdflib.BNode(value)
+        return rdflib.Literal(value, datatype=datatype or None, lang=lang or None)
+
+    def _cache_term(self, tid, term):
+        self._term2id[term] = tid
+        self._id2term[tid] = term
+
+    def _term_id(self, term, create=False):
+        """
+        @brief      Returns the id of a term, or None if unknown and create
+                    is False. Must be called with the lock held
+        """
+        tid = self._term2id.get(term)
+        if tid is None:
+            row = self._encode(term)
+            found = self._db.execute("SELECT id FROM terms WHERE kind=? AND value=? AND datatype=? AND lang=?", row).fetchone()
+            if found is not None:
+                tid = found[0]
+            elif create:
+                tid = self._db.execute("INSERT INTO terms (kind, value, datatype, lang) VALUES (?, ?, ?, ?)", row).lastrowid
+            else:
+                return None
+            self._cache_term(tid, term)
+        return tid
+
+    def _load_terms(self, ids):
+        """
+        @brief      Decode and cache the terms not in cache. Must be called
+                    with the lock held
+        """
+        missing = list(set(tid for tid in ids if tid not in self._id2term))
+        for i in range(0, len(missing), 500):
+            chunk = missing[i:i + 500]
+            query = "SELECT id, kind, value, datatype, lang FROM terms WHERE id IN ({})".format(",".join("?" * len(chunk)))
+            for tid, kind, value, datatype, lang in self._db.execute(query, chunk):
+                self._cache_term(tid, self._decode(kind, value, datatype, lang))
+
+    def _context_id(self, context, create=False):
+        """
+        @brief      Returns the id of a context graph or identifier
+        """
+        identifier = getattr(context, 'identifier', context)
+        if isinstance(context, rdflib.Graph):
+            self._graphs.setdefault(identifier, context)
+        return self._term_id(identifier, create)
+
+    def _graph(self, cid):
+        self._load_terms((cid,))
+        identifier = self._id2term[cid]
+        graph = self._graphs.get(identifier)
+        if graph is None:
+            graph = self._graphs.setdefault(identifier, rdflib.Graph(store=self, identifier=identifier))
+        return graph
+
+    def _where(self, triple, context):
+        """
+        @brief      Build the WHERE clause matching a pattern
+
+        @return     (clause, parameters), or None if a term of the pattern
+                    is not in the store
+        """
+        conditions = []
+        parameters = []
+        for column, term in zip(('s', 'p', 'o'), triple):
+            if term is not None:
+                tid = self._term_id(term)
+                if tid is None:
+                    return None
+                conditions.append("{}=?".format(column))
+                parameters.append(tid)
+        if context is not None:
+            cid = self._context_id(context)
+            if cid is None:
+                return None
+            conditions.append("c=?")
+            parameters.append(cid)
+        clause = " WHERE " + " AND ".join(conditions) if conditions else ""
+        return clause, parameters
+
+    #==============================================================================
+    # RDF APIs
+    #==============================================================================
+
+    def add(self, triple, context, quoted=False):
+        Store.add(self, triple, context, quoted)
+        with self._lock:
+            quad = [self._term_id(t, True) for t in triple]
+            quad.append(self._context_id(context, True))
+            self._db.execute("INSERT OR IGNORE INTO quads (s, p, o, c) VALUES (?, ?, ?, ?)", quad)
+
+    def addN(self, quads):
+        """
+        @brief      Add the statements in a single database transaction
+        """
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                rows = []
+                for s, p, o, c in quads:
+                    Store.add(self, (s, p, o), c, False)
+                    rows.append((self._term_id(s, True), self._term_id(p, True), self._term_id(o, True), self._context_id(c, True)))
+                self._db.executemany("INSERT OR IGNORE INTO quads (s, p, o, c) VALUES (?, ?, ?, ?)", rows)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                # Drop the terms that were not committed
+                self._term2id.clear()
+                self._id2term.clear()
+                raise
+
+    def remove(self, triple, context=None):
+        with self._lock:
+            where = self._where(triple, context)
+            if where is not None:
+                self._db.execute("DELETE FROM quads" + where[0], where[1])
+
+    def triples(self, triple, context=None):
+        with self._lock:
+            where = self._where(triple, context)
+            if where is None:
+                return
+            if context is None:
+                rows = self._db.execute("SELECT DISTINCT s, p, o FROM quads" + where[0], where[1]).fetchall()
+            else:
+                rows = self._db.execute("SELECT s, p, o FROM quads" + where[0], where[1]).fetchall()
+            self._load_terms(tid for row in rows for tid in row)
+        id2term = self._id2term
+        for s, p, o in rows:
+            yield (id2term[s], id2term[p], id2term[o]), self._triple_contexts(s, p, o)
+
+    def _triple_contexts(self, s, p, o):
+        with self._lock:
+            cids = [cid for cid, in self._db.execute("SELECT c FROM quads WHERE s=? AND p=? AND o=?", (s, p, o))]
+            graphs = [self._graph(cid) for cid in cids]
+        for graph in graphs:
+            yield graph
+
+    def __len__(self, context=None):
+        with self._lock:
+            if context is None:
+                return self._db.execute("SELECT COUNT(*) FROM (SELECT DISTINCT s, p, o FROM quads)").fetchone()[0]
+            cid = self._context_id(context)
+            if cid is None:
+                return 0
+            return self._db.execute("SELECT COUNT(*) FROM quads WHERE c=?", (cid,)).fetchone()[0]
+
+    def contexts(self, triple=None):
+        with self._lock:
+            if triple is None or triple == (None, None, None):
+                cids = [cid for cid, in self._db.execute("SELECT DISTINCT c FROM quads")]
+            else:
+                ids = [self._term_id(t) for t in triple]
+                if None in ids:
+                    return iter([])
+                cids = [cid for cid, in self._db.execute("SELECT c FROM quads WHERE s=? AND p=? AND o=?", ids)]
+            return iter([self._graph(cid) for cid in cids])
+
+    #==============================================================================
+    # Namespaces
+    #==============================================================================
+
+    def bind(self, prefix, namespace, override=True):
+        """
+        @brief      Bind a prefix to a namespace, with the semantic of the
+                    rdflib Memory store
+        """
+        with self._lock:
+            bound_namespace = self._namespace.get(prefix)
+            bound_prefix = self._prefix.get(namespace)
+            if bound_prefix is None:
+                bound_prefix = self._prefix.get(bound_namespace)
+            if override:
+                if bound_prefix is not None:
+                    del self._namespace[bound_prefix]
+                if bound_namespace is not None:
+                    del self._prefix[bound_namespace]
+                self._prefix[namespace] = prefix
+                self._namespace[prefix] = namespace
+            else:
+                namespace = bound_namespace if bound_namespace is not None else namespace
+                prefix = bound_prefix if bound_prefix is not None else prefix
+                if self._namespace.get(prefix) == namespace and self._prefix.get(namespace) == prefix:
+                    return
+                self._prefix[namespace] = prefix
+                self._namespace[prefix] = namespace
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM namespaces")
+            self._db.executemany("INSERT INTO namespaces (prefix, uri, ordering) VALUES (?, ?, ?)",
+                                 [(p, str(n), i) for i, (p, n) in enumerate(self._namespace.items())])
+            self._db.execute("COMMIT")
+
+    def namespace(self, prefix):
+        return self._namespace.get(prefix)
+
+    def prefix(self, namespace):
+        return self._prefix.get(namespace)
+
+    def namespaces(self):
+        for prefix, namespace in list(self._namespace.items()):
+            yield prefix, namespace
@@ -2,19 +2,220 @@ from os import path, makedirs
 import skiros2_common.tools.logger as log
 import skiros2_common.ros.utils as utils
 from skiros2_common.core.world_element import Element
+from skiros2_common.core.property import Property
 from skiros2_world_model.ros.ontology_server import Ontology
+from skiros2_world_model.core.ontology_rdflib import CacheStats
+from skiros2_world_model.core.parse_cache import parse_file
 import rdflib
 from rdflib.namespace import RDF, RDFS, OWL, XSD
-from wrapt.decorators import synchronized
+from skiros2_common.tools.rw_lock import read_locked, write_locked
 from skiros2_common.tools.id_generator import IdGen
 from skiros2_common.tools.time_keeper import TimeKeepers
-from collections import OrderedDict
+from collections import OrderedDict, deque
+import threading
+import sys
 
 try:
     unicode
 except NameError:
     unicode = str
 
+# Python type of the property values, by literal datatype
+LITERAL_TYPES = {
+    XSD.double: float,
+    XSD.float: float,
+    XSD.int: int,
+    XSD.integer: int,
+    XSD.boolean: bool,
+    XSD.string: str,
+}
+
+
+class MultiIndex(object):
+    """
+    @brief      Maps keys to insertion-ordered sets of ids. Each entry counts
+                the statements supporting it, so that it is dropped only
+                when the last one is removed
+    """
+
+    def __init__(self):
+        self._map = {}
+
+    def __len__(self):
+        return len(self._map)
+
+    def clear(self):
+        self._map = {}
+
+    def add(self, key, uid):
+        try:
+            ids = self._map.setdefault(key, {})
+        except TypeError:
+            return
+        ids[uid] = ids.get(uid, 0) + 1
+
+    def remove(self, key, uid):
+        try:
+            ids = self._map.get(key)
+        except TypeError:
+            return
+        if not ids or uid not in ids:
+            return
+        ids[uid] -= 1
+        if ids[uid] <= 0:
+            del ids[uid]
+            if not ids:
+                del self._map[key]
+
+    def get(self, key):
+        """
+        @brief      Returns the ids associated to key (empty if the key is
+                    not hashable or not found)
+        """
+        try:
+            return self._map.get(key, {})
+        except TypeError:
+            return {}
+
+
+class ElementCache(CacheStats):
+    """
+    @brief      LRU cache of the elements read from a context, bounded in
+                number of elements
+
+                The cached elements are patched in place when their
+                relations change (see IndividualsDataset._add/_remove),
+                the evicted ones are read again from the graph on demand
+    """
+    capacity = 10000  # Elements, 0 for no bound
+
+    def __init__(self, capacity=None):
+        if capacity is not None:
+            self.capacity = capacity
+        self._elements = OrderedDict()
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def __len__(self):
+        return len(self._elements)
+
+    def reset_stats(self):
+        CacheStats.reset_stats(self)
+        self.evictions = 0
+
+    def clear(self):
+        with self._lock:
+            self._elements.clear()
+
+    def get(self, eid):
+        """
+        @brief      Returns a cached element, None if not in cache
+        """
+        with self._lock:
+            e = self._elements.pop(eid, None)
+            if e is None:
+                self.misses += 1
+                return None
+            self._elements[eid] = e
+            self.hits += 1
+            return e
+
+    def peek(self, eid):
+        """
+        @brief      Returns a cached element, without counting the access
+        """
+        return self._elements.get(eid)
+
+    def put(self, eid, e):
+        """
+        @brief      Cache an element, evicting the least recently used ones
+                    to stay in the capacity
+        """
+        with self._lock:
+            self._elements.pop(eid, None)
+            self._elements[eid] = e
+            while self.capacity and len(self._elements) > self.capacity:
+                self._elements.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, eid, default=None):
+        with self._lock:
+            return self._elements.pop(eid, default)
+
+    def memory(self):
+        """
+        @brief      Returns an estimate of the memory of the cached elements,
+                    in bytes
+        """
+        with self._lock:
+            elements = list(self._elements.values())
+        return sum(_element_memory(e) for e in elements)
+
+
+def _element_memory(e):
+    """
+    @brief      Returns an estimate of the memory of an Element, in bytes
+    """
+    size = sys.getsizeof(e) + sys.getsizeof(e._properties) + sys.getsizeof(e._relations)
+    size += sys.getsizeof(e._id) + sys.getsizeof(e._type) + sys.getsizeof(e._label)
+    for key, p in e._properties.items():
+        size += sys.getsizeof(key) + sys.getsizeof(p) + sys.getsizeof(p.values) + sum(sys.getsizeof(v) for v in p.values)
+    for r in e._relations:
+        size += sys.getsizeof(r) + sum(sys.getsizeof(v) for v in r.values())
+    return size
+
+
+class SnapshotGraph(rdflib.Graph):
+    """
+    @brief      Read-only view of a context as it was at a past version
+
+                The view stores only the statements changed since that
+                version, and reads the others from the live context
+    """
+
+    def __init__(self, context, changes):
+        """
+        @param      context  The live context graph
+        @param      changes  dict statement -> True if the statement was
+                             in the context at the snapshot version
+        """
+        rdflib.Graph.__init__(self, context.store, context.identifier, context.namespace_manager)
+        self._context = context
+        self._changes = changes
+        # Statements of the snapshot missing in the live context, indexed by subject and object
+        self._by_subject = {}
+        self._by_object = {}
+        for statement, present in changes.items():
+            if present and statement not in context:
+                self._by_subject.setdefault(statement[0], []).append(statement)
+                self._by_object.setdefault(statement[2], []).append(statement)
+        self.subjects_changed = set(statement[0] for statement in changes)
+        # Individuals whose element may differ from the live one
+        self.touched = self.subjects_changed.union(statement[2] for statement in changes)
+        self.elements = {}
+
+    def triples(self, triple):
+        subj, predicate, obj = triple
+        for statement in self._context.triples(triple):
+            if self._changes.get(statement, True):
+                yield statement
+        if subj is not None:
+            missing = self._by_subject.get(subj, ())
+        elif obj is not None:
+            missing = self._by_object.get(obj, ())
+        else:
+            missing = [statement for statements in self._by_subject.values() for statement in statements]
+        for statement in missing:
+            if (predicate is None or predicate == statement[1]) and (obj is None or obj == statement[2]):
+                yield statement
+
+    def add(self, triple):
+        raise Exception("A snapshot can not be modified")
+
+    def remove(self, triple):
+        raise Exception("A snapshot can not be modified")
+
+
 class IndividualsDataset(Ontology):
     def __init__(self, verbose, context_id, graph=None, init=False):
         """
@@ -31,7 +232,21 @@ class IndividualsDataset(Ontology):
         self._context = self.ontology(context_id)
         self._workspace = "~"
         self._filename = "{}.turtle".format(context_id)
-        self._elements_cache = dict()
+        self._elements_cache = ElementCache()
+        self._types_index = MultiIndex()
+        self._labels_index = MultiIndex()
+        self._values_index = MultiIndex()
+        # Relations between the elements, to walk the scene tree without querying the graph
+        self._children_index = MultiIndex()
+        self._subject_types_index = MultiIndex()
+        self._label_suffixes = {}  # label -> IdGen of the suffixes tried by _make_unique_uri
+        self._transaction_log = None
+        self._journal = None
+        # Changes applied since the oldest snapshot, see snapshot()
+        self._version = 0
+        self._history = None
+        self._history_start = 0
+        self._history_lock = threading.Lock()
         self._times = TimeKeepers()
         if init:
             self.reset()
@@ -67,7 +282,12 @@ class IndividualsDataset(Ontology):
         @brief Initialize the graph
         """
         self.ontology().remove_context(self.context)
+        self._invalidate_ontology_indexes()
         self._elements_cache.clear()
+        self._clear_indexes()
+        self._reset_history()
+        if self._journal is not None:
+            self._journal.reset([])
 
     def has_individual(self, name):
         """
@@ -75,7 +295,7 @@ class IndividualsDataset(Ontology):
         """
         return self.ontology().value(self.lightstring2uri(name), RDF.type) is not None
 
-    @synchronized
+    @read_locked
     def get_individual(self, name, context_id=""):
         """
         @brief Builds an element from an individual
@@ -86,25 +306,53 @@ class IndividualsDataset(Ontology):
         if not self.uri_exists(subject, context_id):
             raise Exception("Element {} doesn't exist in ontology. Uri: {}. Context: {}.".format(name, subject, context_id))
         e = Element()
+        kinds = self._property_kinds.get(self.ontology())
+        literals = OrderedDict()
         for predicate, obj in self.ontology(context_id).predicate_objects(subject):
-            if OWL.DatatypeProperty in self.ontology().objects(predicate, RDF.type) or predicate == RDFS.comment:
-                e.setProperty(self.uri2lightstring(predicate), obj.value, self.uri2lightstring(obj.datatype), force_convertion=True)
-            elif OWL.ObjectProperty in self.ontology().objects(predicate, RDF.type):
+            kind = kinds.get(predicate)
+            if kind == OWL.DatatypeProperty or predicate == RDFS.comment:
+                # As for Element.setProperty, the last value read overrides the others
+                literals[self.uri2lightstring(predicate)] = obj
+            elif kind == OWL.ObjectProperty:
                 e.addRelation("-1", self.uri2lightstring(predicate), self.uri2lightstring(obj))
             elif predicate == RDF.type and obj != OWL.NamedIndividual:
-                e._type = self.uri2lightstring(str(obj))
+                if (subject, predicate, obj) not in self._inferred_types:
+                    e._type = self.uri2lightstring(str(obj))
             elif obj == OWL.NamedIndividual:
                 pass
             elif predicate == RDFS.label:
                 e._label = obj.value
             else:
                 log.error("[get_individual]", "Ignoring {}-{}-{}. Predicate is not defined in the ontology.".format(name, self.uri2lightstring(predicate), self.uri2lightstring(obj)))
+        for key, literal in literals.items():
+            self._literal2property(e, key, literal)
         for subj, predicate in self.ontology(context_id).subject_predicates(subject):
             if (self.uri2lightstring(predicate) != "skiros:hasTemplate"):
                 e.addRelation(self.uri2lightstring(subj), self.uri2lightstring(predicate), "-1")
         self._add_reasoners_prop(e)
         return e
 
+    def _literal2property(self, e, key, literal):
+        """
+        @brief Set the property key of the element from an rdf literal
+        """
+        if literal.datatype is not None and literal.datatype not in LITERAL_TYPES:
+            log.warn("[Element]", "Datatype {} not recognized. Set default.".format(self.uri2lightstring(literal.datatype)))
+        value = self._literal_value(literal)
+        if key == 'skiros:DiscreteReasoner':
+            e.setProperty(key, value)
+        else:
+            e._properties[key] = Property(key, value)
+
+    def _literal_value(self, literal):
+        """
+        @brief The python value of an rdf literal, as in the element properties
+        """
+        dtype = LITERAL_TYPES.get(literal.datatype)
+        if dtype is None or literal.value is None:
+            return literal.value
+        return dtype(literal.value)
+
     def get_template_individual(self, name):
         """
         @brief Builds an element from an ontology individual
@@ -121,45 +369,65 @@ class IndividualsDataset(Ontology):
         """
         return bool(self.ontology(context_id).value(uri, RDF.type))
 
-    @synchronized
+    @write_locked
     def add_relation(self, r, author, is_relation):
         """
         @brief Add an rdf triple
         """
         self._add((self.lightstring2uri(r['src']), self.lightstring2uri(r['type']), self.lightstring2uri(r['dst'])), author, is_relation=is_relation)
 
-    @synchronized
+    @write_locked
     def remove_relation(self, r, author, is_relation):
         """
         @brief Remove an rdf triple
         """
         self._remove((self.lightstring2uri(r['src']), self.lightstring2uri(r['type']), self.lightstring2uri(r['dst'])), author, is_relation=is_relation)
 
+    @read_locked
     def get_relations(self, r):
         to_ret = []
         predicates = self.context.predicates(self.lightstring2uri(r['src']), self.lightstring2uri(r['dst']))
-        ptypes = self.get_sub_properties(r['type'])
+        ptypes = self.get_sub_properties_set(r['type'])
         for p in predicates:
             p = self.uri2lightstring(p)
             if p in ptypes:
                 to_ret.append(utils.makeRelation(r['src'], p, r['dst']))
         return to_ret
 
-    def get_element(self, uri):
+    def has_element(self, uri, snapshot=None):
         """
-        @brief Get an element from the scene
+        @brief Returns true if the element exists in the scene
+
+        @param snapshot if specified, check the element in the snapshot
+        """
+        return self.uri_exists(self.lightstring2uri(uri), snapshot if snapshot is not None else self.context.identifier)
+
+    def get_element(self, uri, snapshot=None):
         """
-        if uri in self._elements_cache:
-            return self._elements_cache[uri]
+        @brief Get an element from the scene
+
+        @param snapshot if specified, get the element as it was in the snapshot
+        """
+        if snapshot is not None and self.lightstring2uri(uri) in snapshot.touched:
+            if uri not in snapshot.elements:
+                e = self.get_individual(uri, snapshot)
+                e._id = uri
+                snapshot.elements[uri] = e
+            return snapshot.elements[uri]
+        e = self._elements_cache.get(uri)
+        if e is not None:
+            return e
         e = self.get_individual(uri, self.context.identifier)
         e._id = uri
-        self._elements_cache[e.id] = e
+        self._elements_cache.put(e.id, e)
         return e
 
-    @synchronized
-    def load_context(self, filename):
+    @write_locked
+    def load_context(self, filename, parsed=None):
         """
         @brief Load context from file
+
+        @param parsed (prefixes, statements) of the file, if already parsed with parse_files
         """
         if filename:
             self._filename = filename
@@ -168,23 +436,140 @@ class IndividualsDataset(Ontology):
             return
         self._stop_reasoners()
         self.reset()
-        self.context.parse(self.filedir, format='turtle')
+        if parsed is None:
+            # Parsed apart, so that the store adds the statements at once
+            parsed = parse_file(self.filedir, None, 'turtle')
+        self._merge(self.context, *parsed)
+        self._restore()
         self._start_reasoners()
         log.info("[load_context]", "Loaded context {}. ".format(self.filename))
 
-    @synchronized
+    @write_locked
+    def restore(self):
+        """
+        @brief Index the statements already in the context, e.g. when reopening a persistent store
+        """
+        self._elements_cache.clear()
+        self._restore()
+
+    @write_locked
+    def recover(self, statements):
+        """
+        @brief Replace the context statements, e.g. with the ones recovered from a journal
+        """
+        self._stop_reasoners()
+        IndividualsDataset.reset(self)
+        self.context.addN((s, p, o, self.context) for s, p, o in statements)
+        self._restore()
+        self._start_reasoners()
+
+    def _restore(self):
+        self._refresh_namespaces()
+        self._invalidate_ontology_indexes()
+        self._rebuild_indexes()
+        self._reset_history()
+        if self._journal is not None:
+            self._journal.reset(self.context)
+
+    @property
+    def version(self):
+        """
+        @brief The number of statements changed so far
+        """
+        return self._version
+
+    def enable_snapshots(self):
+        """
+        @brief Start recording the changes, to be able to read past versions
+        """
+        with self._history_lock:
+            if self._history is None:
+                self._history = deque()
+                self._history_start = self._version
+
+    def release_snapshots(self, version):
+        """
+        @brief Forget the changes before version. The previous versions can't be read anymore
+        """
+        with self._history_lock:
+            if self._history is None:
+                return
+            while self._history_start < version and self._history:
+                self._history.popleft()
+                self._history_start += 1
+
+    @read_locked
+    def snapshot(self, version):
+        """
+        @brief      Returns a read-only view of the context as it was at a
+                    version. Can be passed to get_element, resolve_elements
+                    and get_recursive
+
+        @param      version  (int) a value of the version property
+        """
+        with self._history_lock:
+            if self._history is None or version < self._history_start or version > self._version:
+                raise Exception("Version {} of context {} is not available.".format(version, self.context.identifier))
+            changes = list(self._history)[version - self._history_start:]
+        # The state at the snapshot is the opposite of the first change after it
+        first_changes = {}
+        for statement, added in changes:
+            if statement not in first_changes:
+                first_changes[statement] = not added
+        return SnapshotGraph(self.context, first_changes)
+
+    def _record_changes(self, changes):
+        """
+        @brief Record applied changes in the journal and in the snapshots history
+        """
+        if self._journal is not None:
+            self._journal.extend(changes)
+        with self._history_lock:
+            if self._history is not None:
+                self._history.extend(changes)
+            self._version += len(changes)
+        if changes:
+            self._touch_context(self.context)
+
+    def _reset_history(self):
+        """
+        @brief Forget the history after a bulk change: the previous versions can't be read anymore
+        """
+        with self._history_lock:
+            self._version += 1
+            if self._history is not None:
+                self._history.clear()
+                self._history_start = self._version
+        self._touch_context(self.context)
+
+    @write_locked
+    def set_journal(self, journal):
+        """
+        @brief      Record the changes of the context in a journal. The
+                    journal is started with the current statements
+
+        @param      journal  (Journal) a journal not started yet
+        """
+        journal.start(self.context)
+        self._journal = journal
+
+    @write_locked
     def save_context(self, filename):
         """
         @brief Save context to file
         """
         if filename:
             self._filename = filename
+        if self._journal is not None:
+            # The journal writer thread saves its copy of the statements
+            self._journal.checkpoint((self.filedir, list(self.ontology().namespaces())))
+            return
         directory = self.filedir[0:self.filedir.rfind("/")]
         if not path.exists(directory):
             makedirs(directory)
         self.context.serialize(self.filedir, format='turtle')
 
-    @synchronized
+    @write_locked
     def add_element(self, e, author):
         """
         @brief Add an element to the context
@@ -198,30 +583,34 @@ class IndividualsDataset(Ontology):
         statements = self._element2statements(e)
         for s, is_relation in statements:
             self._add(s, author, is_relation)
-        self._elements_cache[e.id] = e
+        self._elements_cache.put(e.id, e)
         return e
 
-    @synchronized
+    @write_locked
     def update_element(self, e, author):
         """
         @brief Update an element in the scene
+
+        @return     (removed, added) lists of (statement, is_relation), the
+                    statements changed by the update
         """
         for name, r in self._reasoners.items():
             if not r.parse(e, "update"):
                 raise Exception("Reasoner {} rejected the element {} update".format(name, e))
-        prev = self._element2statements(self.get_element(e.id))
-        curr = self._element2statements(e)
-        c1, c2 = zip(*curr)
-        for s, is_relation in prev:
-            if not s in c1:
-                self._remove(s, author, is_relation)
-        p1, p2 = zip(*prev)
-        for s, is_relation in curr:
-            if not s in p1:
-                self._add(s, author, is_relation)
-        self._elements_cache[e.id] = e
-
-    @synchronized
+        prev = self._element2statements(self.get_element(e.id), validate=False)
+        prev_set = set(s for s, _ in prev)
+        curr = self._element2statements(e, known=prev_set)
+        curr_set = set(s for s, _ in curr)
+        removed = [(s, is_relation) for s, is_relation in prev if s not in curr_set]
+        added = [(s, is_relation) for s, is_relation in curr if s not in prev_set]
+        for s, is_relation in removed:
+            self._remove(s, author, is_relation)
+        for s, is_relation in added:
+            self._add(s, author, is_relation)
+        self._elements_cache.put(e.id, e)
+        return removed, added
+
+    @write_locked
     def update_properties(self, e, author, reasoner=None):
         """
         @brief Update properties of an element in the scene
@@ -265,38 +654,177 @@ class IndividualsDataset(Ontology):
                 for i in range(1, len(values)):
                     self._add((subject, predicate, rdflib.term.Literal(values[i], datatype=self._get_datatype(p))), author)
                 old_e.setProperty(k, values)
-        self._elements_cache[e.id] = old_e
+        self._elements_cache.put(e.id, old_e)
 
-    @synchronized
-    def resolve_elements(self, description):
+    @read_locked
+    def resolve_elements(self, description, snapshot=None):
         """
         @brief Return all elements matching the profile in input (type, label, properties)
-        """
-        first = []
-        to_ret = []
-        for e in self._get_types(description._type):
-            if description._label == "" or description._label == "Unknown" or e._label == description._label:
-                first.append(e)
-        # Filter by properties
-        for e in first:
-            add = True
-            for k, p in description._properties.items():
-                if not e.hasProperty(k):
-                    add = False
-                    break
-                for v in p.values:
-                    if v == "" or v is None:
-                        break
-                    if not v in e.getProperty(k).values:
-                        add = False
-                        break
-                if not add:
+
+        @param snapshot if specified, resolve the elements of the snapshot
+        """
+        if snapshot is not None:
+            return self._resolve_snapshot_elements(description, snapshot)
+        # Narrow the candidates with the indexes, then check only the survivors
+        ids = None
+        if not (description._label == "" or description._label == "Unknown"):
+            ids = set(self._labels_index.get(description._label))
+        for k, p in description._properties.items():
+            k = self._index_key(k)
+            if not self._indexed_property(k):
+                continue
+            for v in p.values:
+                if v == "" or v is None:
                     break
-            if add:
+                matches = self._values_index.get((k, v))
+                ids = set(matches) if ids is None else ids.intersection(matches)
+        to_ret = []
+        for e in self._get_types(description._type, ids):
+            if self._match_description(e, description):
                 to_ret.append(e)
         return to_ret
 
-    @synchronized
+    def _resolve_snapshot_elements(self, description, snapshot):
+        """
+        @brief      Resolve with the live indexes the elements not changed
+                    since the snapshot, then check the changed ones
+        """
+        changed = set(self.uri2lightstring(s) for s in snapshot.subjects_changed)
+        to_ret = [self.get_element(e.id, snapshot) for e in self.resolve_elements(description) if e.id not in changed]
+        types = set(self._index_key(t) for t in self.get_sub_classes_set(description._type))
+        for eid in changed:
+            if self.uri_exists(self.lightstring2uri(eid), snapshot):
+                e = self.get_element(eid, snapshot)
+                if e._type in types and self._match_description(e, description):
+                    to_ret.append(e)
+        return to_ret
+
+    @write_locked
+    def transaction(self, operations, author):
+        """
+        @brief      Apply a list of operations as one atomic change: if an
+                    operation fails, all the previous ones are undone
+
+        @param      operations  list of dict with key 'action' (add,
+                                update, update_properties, remove or
+                                set_relation), 'element' and 'reasoner'
+                                (update_properties only, optional) or
+                                'relation' and 'value' (set_relation)
+        @param      author      The author
+
+        @return     list with the updated element of each operation (None
+                    for remove and set_relation)
+        """
+        if self._transaction_log is not None:
+            raise Exception("Nested transactions are not supported")
+        self._begin_transaction()
+        try:
+            results = [self._apply_operation(op, author) for op in operations]
+        except BaseException:
+            self._rollback_transaction()
+            raise
+        self._commit_transaction()
+        return results
+
+    def _apply_operation(self, op, author):
+        """
+        @brief Apply one operation of a transaction
+        """
+        action = op['action']
+        if action == 'set_relation':
+            if op.get('value', True):
+                self.add_relation(op['relation'], author, is_relation=True)
+            else:
+                self.remove_relation(op['relation'], author, is_relation=True)
+            return None
+        e = op['element']
+        if action == 'add':
+            return self.add_element(e, author)
+        if not self.uri_exists(self.lightstring2uri(e.id), self.context.identifier):
+            raise Exception("Can not {} element {}. Element doesn't exist.".format(action, e.id))
+        if action == 'update':
+            self.update_element(e, author)
+        elif action == 'update_properties':
+            self.update_properties(e, author, op.get('reasoner'))
+        elif action == 'remove':
+            self.remove_element(e, author)
+            return None
+        else:
+            raise Exception("Operation {} not recognized.".format(action))
+        return self.get_element(e.id)
+
+    def _begin_transaction(self):
+        self._transaction_log = []
+
+    def _commit_transaction(self):
+        changes, self._transaction_log = self._transaction_log, None
+        self._record_changes(changes)
+
+    def _rollback_transaction(self):
+        """
+        @brief Undo the statements changed since the beginning of the transaction
+        """
+        changes, self._transaction_log = self._transaction_log, None
+        for statement, added in reversed(changes):
+            if added:
+                self.context.remove(statement)
+            else:
+                self.context.add(statement)
+            self._index_statement(statement, not added)
+            self._update_ontology_indexes(statement, not added)
+        # Cached elements may have been modified in place, they are rebuilt on demand
+        for (subj, _, obj), _ in changes:
+            self._elements_cache.pop(self.uri2lightstring(subj), None)
+            if isinstance(obj, rdflib.term.URIRef):
+                self._elements_cache.pop(self.uri2lightstring(obj), None)
+
+    def _log_statement(self, statement, added):
+        """
+        @brief Record a changed statement in the running transaction, or as applied
+        """
+        if self._transaction_log is not None:
+            self._transaction_log.append((statement, added))
+        else:
+            self._record_changes([(statement, added)])
+
+    def _index_key(self, name):
+        """
+        @brief The prefixed name of a type or property, as in the keys of
+               the indexes
+        """
+        return self.uri2lightstring(self.lightstring2uri(name)) if name else name
+
+    def _indexed_property(self, key):
+        """
+        @brief True if all the values of the property are in the values
+               index: the reasoners can add their properties to an element
+               when it is read
+        """
+        for r in self._reasoners.values():
+            try:
+                if key in r.getAssociatedData():
+                    return False
+            except NotImplementedError:
+                return False
+        return True
+
+    def _match_description(self, e, description):
+        """
+        @brief Returns True if the element label and properties match the description
+        """
+        if not (description._label == "" or description._label == "Unknown" or e._label == description._label):
+            return False
+        for k, p in description._properties.items():
+            if not e.hasProperty(k):
+                return False
+            for v in p.values:
+                if v == "" or v is None:
+                    break
+                if not v in e.getProperty(k).values:
+                    return False
+        return True
+
+    @write_locked
     def remove_element(self, e, author):
         """
         @brief Remove an element from the scene
@@ -306,49 +834,68 @@ class IndividualsDataset(Ontology):
         except BaseException:
             log.warn("[remove_element]", "Trying to remove element {}, but doesn't exist.".format(e.id))
             return False
-        for name, r in self._reasoners.items():
-            if not r.parse(e, "remove"):
-                raise Exception("Reasoner {} rejected the element {} removal".format(name, e))
-        del self._elements_cache[e.id]
-        statements = self._element2statements(e)
-        for s, is_relation in statements:
-            self._remove(s, author, is_relation)
+        self._remove_elements([e], author)
         return True
 
-    @synchronized
+    @write_locked
     def remove_recursive(self, e, author, rel_filter="", type_filter=""):
         """
         @brief Remove an element from the scene and all elements related to the initial one
         """
-        rels_filter = []
-        types_filter = []
+        rels_filter = frozenset()
+        types_filter = frozenset()
         if rel_filter != "":
-            rels_filter = self.get_sub_relations(rel_filter)
+            rels_filter = self.get_sub_relations_set(rel_filter)
         if type_filter != "":
-            types_filter = self.get_sub_classes(type_filter)
+            types_filter = self.get_sub_classes_set(type_filter)
         self._remove_recursive(e, author, rels_filter, types_filter)
 
     def _remove_recursive(self, e, author, rels, types):
-        self.remove_element(e, author)
-        for r in e.getRelations("-1", rels):
-            if self.uri_exists(self.lightstring2uri(r['dst']), self.context.identifier):
-                e2 = self.get_element(r['dst'])
-                if e2.type in types or not types:
-                    self._remove_recursive(e2, author, rels, types)
+        if not self._subject_types_index.get(e.id):
+            log.warn("[remove_recursive]", "Trying to remove element {}, but doesn't exist.".format(e.id))
+            return
+        self._remove_elements([self.get_element(eid) for eid in self._walk(e.id, rels, types)], author)
+
+    def _remove_elements(self, elements, author):
+        """
+        @brief Remove elements from the scene. The statements shared by
+               the elements are removed once
+        """
+        for e in elements:
+            for name, r in self._reasoners.items():
+                if not r.parse(e, "remove"):
+                    raise Exception("Reasoner {} rejected the element {} removal".format(name, e))
+        statements = OrderedDict()
+        for e in elements:
+            for s, is_relation in self._element2statements(e, validate=False):
+                statements[s] = is_relation
+        for e in elements:
+            self._elements_cache.pop(e.id, None)
+        for s, is_relation in statements.items():
+            self._remove(s, author, is_relation)
+        for e in elements:
+            self._release_label_suffix(e)
 
-    @synchronized
-    def get_recursive(self, eid, rel_filter="", type_filter=""):
+    @read_locked
+    def get_recursive(self, eid, rel_filter="", type_filter="", snapshot=None):
         """
         @brief Get an element from the scene and all elements related to the initial one
+
+        @param snapshot if specified, get the elements of the snapshot
         """
         to_ret = OrderedDict()
-        rels_filter = []
-        types_filter = []
+        rels_filter = frozenset()
+        types_filter = frozenset()
         if rel_filter != "":
-            rels_filter = self.get_sub_relations(rel_filter)
+            rels_filter = self.get_sub_relations_set(rel_filter)
         if type_filter != "":
-            types_filter = self.get_sub_classes(type_filter)
-        self._get_recursive(self.get_element(eid), rels_filter, types_filter, to_ret)
+            types_filter = self.get_sub_classes_set(type_filter)
+        e = self.get_element(eid, snapshot)
+        if snapshot is not None:
+            self._get_recursive(e, rels_filter, types_filter, to_ret, snapshot)
+            return to_ret
+        for eid in self._walk(e.id, rels_filter, types_filter):
+            to_ret[eid] = self.get_element(eid)
         return to_ret
 
     def get_reasoner(self, reasoner_class):
@@ -384,21 +931,74 @@ class IndividualsDataset(Ontology):
             if not e.label:
                 e.label = "unknown"
             e._id = e.label
-        i = 1
+        if not self.uri_exists(self.lightstring2uri(e.id)):
+            return
+        # Suffixes already tried for the label, 0 being the label alone
+        suffixes = self._label_suffixes.get(e.label)
+        if suffixes is None:
+            suffixes = self._label_suffixes[e.label] = IdGen()
+            suffixes.getId(0)
+        e._id = "{}_{}".format(e.label, suffixes.getId())
         while self.uri_exists(self.lightstring2uri(e.id)):
-            e._id = "{}_{}".format(e.label, i)
-            i += 1
+            e._id = "{}_{}".format(e.label, suffixes.getId())
+
+    def _release_label_suffix(self, e):
+        """
+        @brief      Make the suffix of a removed element available again,
+                    and forget the suffixes of a label no longer used
+        """
+        suffixes = self._label_suffixes.get(e.label)
+        if suffixes is None:
+            return
+        if not self._labels_index.get(e.label):
+            del self._label_suffixes[e.label]
+            return
+        suffix = e.id[len(e.label) + 1:] if e.id.startswith(e.label + "_") else ""
+        if suffix.isdigit() and suffixes.hasId(int(suffix)):
+            suffixes.removeId(int(suffix))
 
-    def _get_recursive(self, e, rels_filter, types_filter, elist):
+    def _walk(self, eid, rels, types):
+        """
+        @brief      Returns the ids of an element and of the elements related
+                    to it, depth first, walking the relations index
+
+        @param      rels   set of the relations to follow. All object
+                           properties if empty
+        @param      types  set of the types of the related elements. Any if
+                           empty
+        """
+        kinds = self._property_kinds.get(self.ontology())
+        visited = OrderedDict([(eid, None)])
+        stack = [iter(list(self._children_index.get(eid)))]
+        while stack:
+            for predicate, child in stack[-1]:
+                if child in visited:
+                    continue
+                if rels:
+                    if predicate not in rels:
+                        continue
+                elif kinds.get(self.lightstring2uri(predicate)) != OWL.ObjectProperty:
+                    continue
+                child_types = self._subject_types_index.get(child)
+                if not child_types or (types and not any(t in types for t in child_types)):
+                    continue
+                visited[child] = None
+                stack.append(iter(list(self._children_index.get(child))))
+                break
+            else:
+                stack.pop()
+        return list(visited)
+
+    def _get_recursive(self, e, rels_filter, types_filter, elist, snapshot=None):
         """
         @brief Get all elements related to the initial one. Anti-loop guarded
         """
         elist[e.id] = e
         for r in e.getRelations("-1", rels_filter):
-            if self.uri_exists(self.lightstring2uri(r['dst']), self.context.identifier):
-                e2 = self.get_element(r['dst'])
+            if self.uri_exists(self.lightstring2uri(r['dst']), self.context.identifier if snapshot is None else snapshot):
+                e2 = self.get_element(r['dst'], snapshot)
                 if (e2._type in types_filter or not types_filter) and e2._id not in elist:
-                    self._get_recursive(e2, rels_filter, types_filter, elist)
+                    self._get_recursive(e2, rels_filter, types_filter, elist, snapshot)
 
     def _get_datatype(self, param):
         if param.dataTypeIs(str) or param.dataTypeIs(unicode):
@@ -413,6 +1013,53 @@ class IndividualsDataset(Ontology):
             log.error("[Wm]", "Param {} has type {} that is not supported.".format(param.key, param.dataType()))
             return None
 
+    def _clear_indexes(self):
+        self._types_index.clear()
+        self._labels_index.clear()
+        self._values_index.clear()
+        self._children_index.clear()
+        self._subject_types_index.clear()
+        self._label_suffixes.clear()
+
+    def _rebuild_indexes(self):
+        """
+        @brief Index all the statements of the context, e.g. after parsing a file
+        """
+        self._clear_indexes()
+        for statement in self.context:
+            self._index_statement(statement, True)
+
+    def _index_statement(self, statement, added):
+        """
+        @brief Update the type, label, property value and relation indexes
+        """
+        subj, predicate, obj = statement
+        if predicate == RDF.type:
+            if added:
+                self._subject_types_index.add(self.uri2lightstring(subj), self.uri2lightstring(obj))
+            else:
+                self._subject_types_index.remove(self.uri2lightstring(subj), self.uri2lightstring(obj))
+            if obj == OWL.NamedIndividual:
+                return
+            index = self._types_index
+            key = self.uri2lightstring(obj)
+        elif predicate == RDFS.label:
+            index = self._labels_index
+            key = obj.value
+        elif isinstance(obj, rdflib.term.Literal):
+            index = self._values_index
+            key = (self.uri2lightstring(predicate), self._literal_value(obj))
+        else:
+            if added:
+                self._children_index.add(self.uri2lightstring(subj), (self.uri2lightstring(predicate), self.uri2lightstring(obj)))
+            else:
+                self._children_index.remove(self.uri2lightstring(subj), (self.uri2lightstring(predicate), self.uri2lightstring(obj)))
+            return
+        if added:
+            index.add(key, self.uri2lightstring(subj))
+        else:
+            index.remove(key, self.uri2lightstring(subj))
+
     def _set(self, statement, author, time=None, probability=1.0):
         """
         @brief Remove any existing triples for subject and predicate before adding
@@ -420,7 +1067,12 @@ class IndividualsDataset(Ontology):
 
         Convenience method to update the value of object
         """
+        for obj in list(self.context.objects(statement[0], statement[1])):
+            self._index_statement((statement[0], statement[1], obj), False)
+            self._log_statement((statement[0], statement[1], obj), False)
         self.context.set(statement)
+        self._index_statement(statement, True)
+        self._log_statement(statement, True)
         if self._verbose:
             log.info("{}->{}".format(author, self.context.identifier.n3()), log.logColor.RED + log.logColor.BOLD +
                      "[-] ({}) - ({}) - (*)) . ".format(self.uri2lightstring(statement[0]), self.uri2lightstring(statement[1])))
@@ -431,15 +1083,21 @@ class IndividualsDataset(Ontology):
         """
         @brief Remove a statement from the scene
         """
-        self.context.remove(statement)
+        if statement in self.context:
+            self.context.remove(statement)
+            self._index_statement(statement, False)
+            self._log_statement(statement, False)
+        self._update_ontology_indexes(statement, False)
         if is_relation:
             s0 = self.uri2lightstring(statement[0])
             s1 = self.uri2lightstring(statement[1])
             s2 = self.uri2lightstring(statement[2])
-            if s0 in self._elements_cache:
-                self._elements_cache[s0].removeRelation2("-1", s1, s2)
-            if s2 in self._elements_cache:
-                self._elements_cache[s2].removeRelation2(s0, s1, "-1")
+            cached = self._elements_cache.peek(s0)
+            if cached is not None:
+                cached.removeRelation2("-1", s1, s2)
+            cached = self._elements_cache.peek(s2)
+            if cached is not None:
+                cached.removeRelation2(s0, s1, "-1")
         if self._verbose:
             log.info("{}->{}".format(author, self.context.identifier.n3()), log.logColor.RED + log.logColor.BOLD +
                      "[-] ({}) - ({}) - ({}) .".format(self.uri2lightstring(statement[0]), self.uri2lightstring(statement[1]), self.uri2lightstring(statement[2])))
@@ -448,20 +1106,36 @@ class IndividualsDataset(Ontology):
         """
         @brief Add a statement to the scene
         """
-        self.context.add(statement)
+        if statement not in self.context:
+            self.context.add(statement)
+            self._index_statement(statement, True)
+            self._log_statement(statement, True)
+        self._update_ontology_indexes(statement, True)
         if is_relation:
             s0 = self.uri2lightstring(statement[0])
             s1 = self.uri2lightstring(statement[1])
             s2 = self.uri2lightstring(statement[2])
-            if s0 in self._elements_cache:
-                self._elements_cache[s0].addRelation("-1", s1, s2)
-            if s2 in self._elements_cache:
-                self._elements_cache[s2].addRelation(s0, s1, "-1")
+            cached = self._elements_cache.peek(s0)
+            if cached is not None:
+                cached.addRelation("-1", s1, s2)
+            cached = self._elements_cache.peek(s2)
+            if cached is not None:
+                cached.addRelation(s0, s1, "-1")
         if self._verbose:
             log.info("{}->{}".format(author, self.context.identifier.n3()), log.logColor.GREEN + log.logColor.BOLD +
                      "[+] ({}) - ({}) - ({}) . ".format(self.uri2lightstring(statement[0]), self.uri2lightstring(statement[1]), self.uri2lightstring(statement[2])))
 
-    def _element2statements(self, e):
+    def _element2statements(self, e, validate=True, known=()):
+        """
+        @brief      Returns the statements describing an element
+
+        @param      validate  if True, the relations to elements not in
+                              the ontology are removed from the element
+        @param      known     statements already in the context. Their
+                              relations are not validated again
+
+        @return     list of (statement, is_relation)
+        """
         to_ret = []
         subject = self.lightstring2uri(e.id)
         to_ret.append(((subject, RDF.type, OWL.NamedIndividual), False))
@@ -474,33 +1148,36 @@ class IndividualsDataset(Ontology):
                 to_ret.append(((subject, predicate, value), False))
         for r in list(e._relations):
             if r['src'] == "-1" or r['src'] == e.id:
-                if not self.uri_exists(self.lightstring2uri(r['dst'])):
-                    log.error("[element2statements]", "Element with key {} is not defined in ontology. Skipped relation: {}".format(r['dst'], r))
-                    e.removeRelation(r)
-                    continue
-                to_ret.append(((subject, self.lightstring2uri(r['type']), self.lightstring2uri(r['dst'])), True))
+                other = self.lightstring2uri(r['dst'])
+                statement = (subject, self.lightstring2uri(r['type']), other)
             else:
-                if not self.uri_exists(self.lightstring2uri(r['src'])):
-                    log.error("[element2statements]", "Element with key {} is not defined in ontology. Skipped relation: {}".format(r['src'], r))
-                    e.removeRelation(r)
-                    continue
-                to_ret.append(((self.lightstring2uri(r['src']), self.lightstring2uri(r['type']), subject), True))
+                other = self.lightstring2uri(r['src'])
+                statement = (other, self.lightstring2uri(r['type']), subject)
+            if validate and statement not in known and not self.uri_exists(other):
+                log.error("[element2statements]", "Element with key {} is not defined in ontology. Skipped relation: {}".format(self.uri2lightstring(other), r))
+                e.removeRelation(r)
+                continue
+            to_ret.append((statement, True))
         return to_ret
 
-    def _get_types(self, eclass):
+    def _get_types(self, eclass, ids=None):
         """
         @brief Return all elements of a type
+
+        @param ids if specified, return only elements with an id in the set
         """
         to_ret = []
-        types_filter = self.get_sub_classes(eclass)
-        for etype in types_filter:
-            for subj in self.context.subjects(RDF.type, self.lightstring2uri(etype)):
-                to_ret.append(self.get_element(self.uri2lightstring(subj)))
+        visited = set()
+        for etype in self.get_sub_classes(eclass):
+            for eid in list(self._types_index.get(self._index_key(etype))):
+                if eid not in visited and (ids is None or eid in ids):
+                    visited.add(eid)
+                    to_ret.append(self.get_element(eid))
         return to_ret
 
 
 class WorldModel(IndividualsDataset):
-    def __init__(self, verbose, context_id, change_cb):
+    def __init__(self, verbose, context_id, change_cb, graph=None):
         """
         @brief      Manages a set of individuals with unique ID
                     generation
@@ -508,10 +1185,15 @@ class WorldModel(IndividualsDataset):
         @param      verbose     The verbose
         @param      context_id  The context identifier
         @param      change_cb   The change cb
+        @param      graph       The graph, e.g. backed by a persistent
+                                store. If None an in-memory graph is
+                                created
         """
         self._id_gen = IdGen()
         self._change_cb = change_cb
-        IndividualsDataset.__init__(self, verbose, context_id, init=False)
+        self._transaction_changes = None
+        self._transaction_ids = None
+        IndividualsDataset.__init__(self, verbose, context_id, graph, init=False)
 
     def reset(self, add_root=True, scene_name="skiros:blank_scene"):
         """
@@ -532,7 +1214,7 @@ class WorldModel(IndividualsDataset):
         """
         IndividualsDataset._remove(self, statement, author, is_relation)
         if is_relation:
-            self._change_cb(author, "remove", relation={'src': self.uri2lightstring(
+            self._notify_change(author, "remove", relation={'src': self.uri2lightstring(
                 statement[0]), 'type': self.uri2lightstring(statement[1]), 'dst': self.uri2lightstring(statement[2])})
 
     def _add(self, statement, author, is_relation=False):
@@ -541,9 +1223,40 @@ class WorldModel(IndividualsDataset):
         """
         IndividualsDataset._add(self, statement, author, is_relation)
         if is_relation:
-            self._change_cb(author, "add", relation={'src': self.uri2lightstring(
+            self._notify_change(author, "add", relation={'src': self.uri2lightstring(
                 statement[0]), 'type': self.uri2lightstring(statement[1]), 'dst': self.uri2lightstring(statement[2])})
 
+    def _notify_change(self, author, action, element=None, relation=None):
+        """
+        @brief Call the change callback, or delay the call to the end of the running transaction
+        """
+        if self._transaction_changes is not None:
+            self._transaction_changes.append((author, action, element, relation))
+        else:
+            self._change_cb(author, action, element, relation)
+
+    def _begin_transaction(self):
+        IndividualsDataset._begin_transaction(self)
+        self._transaction_changes = []
+        self._transaction_ids = []
+
+    def _commit_transaction(self):
+        IndividualsDataset._commit_transaction(self)
+        changes, self._transaction_changes = self._transaction_changes, None
+        self._transaction_ids = None
+        for change in changes:
+            self._change_cb(*change)
+
+    def _rollback_transaction(self):
+        IndividualsDataset._rollback_transaction(self)
+        self._transaction_changes = None
+        ids, self._transaction_ids = self._transaction_ids, None
+        for uid, allocated in reversed(ids):
+            if allocated:
+                self._id_gen.removeId(uid)
+            else:
+                self._id_gen.getId(uid)
+
     def _uri2type(self, uri):
         return uri.split('-')[0]
 
@@ -552,10 +1265,12 @@ class WorldModel(IndividualsDataset):
             return -1
         return int(uri.split('-')[1])
 
-    @synchronized
-    def load_context(self, filename):
+    @write_locked
+    def load_context(self, filename, parsed=None):
         """
         @brief Load scene from file
+
+        @param parsed (prefixes, statements) of the file, if already parsed with parse_files
         """
         if filename:
             self._filename = filename
@@ -564,26 +1279,34 @@ class WorldModel(IndividualsDataset):
             return
         self._stop_reasoners()
         self.reset(add_root=False)
-        self.context.parse(self.filedir, format='turtle')
-        individuals = self.context.query("SELECT ?x WHERE { ?x rdf:type <http://www.w3.org/2002/07/owl#NamedIndividual>. } ")
-        for i in individuals:
-            i = self.uri2lightstring(i[0])
-            iid = self._uri2id(i)
-            if iid >= 0:
-                self._id_gen.getId(iid)
+        if parsed is None:
+            # Parsed apart, so that the store adds the statements at once
+            parsed = parse_file(self.filedir, None, 'turtle')
+        self._merge(self.context, *parsed)
+        self._restore()
         self._start_reasoners()
         log.info("[load_scene]", "Loaded scene {}. ".format(self.filename))
 
-    @synchronized
+    def _restore(self):
+        IndividualsDataset._restore(self)
+        self._id_gen.clear()
+        for i in self.context.subjects(RDF.type, OWL.NamedIndividual):
+            iid = self._uri2id(self.uri2lightstring(i))
+            if iid >= 0:
+                self._id_gen.getId(iid)
+
+    @write_locked
     def add_element(self, e, author):
         """
         @brief Add an element to the scene
         """
         e.setUri(self._id_gen.getId(e.getIdNumber()))
+        if self._transaction_ids is not None:
+            self._transaction_ids.append((e.getIdNumber(), True))
         IndividualsDataset.add_element(self, e, author)
         return e
 
-    @synchronized
+    @write_locked
     def update_element(self, e, author):
         """
         @brief Update an element in the scene
@@ -591,9 +1314,9 @@ class WorldModel(IndividualsDataset):
         if not self._id_gen.hasId(self._uri2id(e.id)):
             log.error("[update_element]", "Request update from {}, but Id {} is not present in the wm. ".format(author, self._uri2id(e.id)))
             return
-        IndividualsDataset.update_element(self, e, author)
+        return IndividualsDataset.update_element(self, e, author)
 
-    @synchronized
+    @write_locked
     def update_properties(self, e, author, reasoner=None, publish=True):
         """
         @brief Update properties of an element in the scene
@@ -603,14 +1326,14 @@ class WorldModel(IndividualsDataset):
             return
         IndividualsDataset.update_properties(self, e, author, reasoner)
         if publish:
-            self._change_cb(author, "update", self.get_element(e.id))
+            self._notify_change(author, "update", self.get_element(e.id))
 
-    @synchronized
-    def remove_element(self, e, author):
+    def _remove_elements(self, elements, author):
         """
-        Remove an element from the scene
+        Remove elements from the scene and release their ids
         """
-        if IndividualsDataset.remove_element(self, e, author):
+        IndividualsDataset._remove_elements(self, elements, author)
+        for e in elements:
             self._id_gen.removeId(self._uri2id(e.id))
-            return True
-        return False
+            if self._transaction_ids is not None:
+                self._transaction_ids.append((self._uri2id(e.id), False))
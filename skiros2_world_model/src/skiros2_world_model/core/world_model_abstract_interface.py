@@ -10,7 +10,11 @@ class OntologyAbstractInterface:
         """ Not implemented in abstract class. """
         raise NotImplementedError("Not implemented in abstract class")
 
-    def query_ontology(self, query, cut_prefix=False):
+    def query_ontology(self, query, cut_prefix=False, bindings=None):
+        """ Not implemented in abstract class. """
+        raise NotImplementedError("Not implemented in abstract class")
+
+    def query_rows(self, query, cut_prefix=True, context="", bindings=None, page_size=0):
         """ Not implemented in abstract class. """
         raise NotImplementedError("Not implemented in abstract class")
 
@@ -76,6 +80,10 @@ class WorldModelAbstractInterface:
         """ Not implemented in abstract class. """
         raise NotImplementedError("Not implemented in abstract class")
 
+    def get_elements(self, eids):
+        """ Not implemented in abstract class. """
+        raise NotImplementedError("Not implemented in abstract class")
+
     def getChildElements(self, e, relation_filter="", type_filter=""):
         """ Not implemented in abstract class. """
         raise NotImplementedError("Not implemented in abstract class")
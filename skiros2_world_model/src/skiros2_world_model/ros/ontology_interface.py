@@ -1,4 +1,5 @@
 import rospy
+import rdflib
 import skiros2_msgs.srv as srvs
 import skiros2_msgs.msg as msgs
 import skiros2_common.ros.utils as utils
@@ -153,21 +154,86 @@ class OntologyInterface(OntologyAbstractInterface):
             return res.ok
         return False
 
-    def query_ontology(self, query, cut_prefix=True, context=""):
+    def query_ontology(self, query, cut_prefix=True, context="", bindings=None):
         """
         @brief Direct SPARQL interface. query should be a string in SPARQL syntax
 
         @param cut_prefix If True the prefix in returned values is removed
         @param context The context in which executing the query
+        @param bindings dict variable name -> uri, values of variables of the query. Prefer a
+                        fixed query with bindings to formatting the values in the query: the
+                        server parses each query once
 
         @return a list of strings
         """
         req = srvs.WoQueryRequest()
         req.query_string = query
+        self._set_bindings(req, bindings)
         req.context = context
         req.cut_prefix = cut_prefix
         return self._call(self._ontology_query, req).answer
 
+    def query_rows(self, query, cut_prefix=True, context="", bindings=None, page_size=0):
+        """
+        @brief Run a SPARQL query and iterate the answer rows, with typed values
+
+        @param cut_prefix If True the prefix in returned uris is removed
+        @param context The context in which executing the query
+        @param bindings dict variable name -> uri, values of variables of the query
+        @param page_size If > 0, the answer is fetched in pages of page_size rows. The pages are
+                         read from the same answer, unless the context changes in between
+
+        @return a generator of tuples, one item per unbound variable: uris as strings, literals
+                as python values (e.g. float for xsd:double), None for unbound values
+        """
+        req = srvs.WoQueryRequest()
+        req.query_string = query
+        self._set_bindings(req, bindings)
+        req.context = context
+        req.cut_prefix = cut_prefix
+        req.typed = True
+        req.limit = page_size
+        while True:
+            res = self._call(self._ontology_query, req)
+            columns = [self._column2values(c) for c in res.columns]
+            for row in zip(*columns):
+                yield row
+            req.offset += len(columns[0]) if columns else 0
+            if not page_size or not columns or not columns[0] or req.offset >= res.total:
+                return
+
+    def _column2values(self, column):
+        values = []
+        for kind, value, datatype in zip(column.kinds, column.values, column.datatypes):
+            if kind == column.LITERAL:
+                value = rdflib.Literal(value, datatype=rdflib.URIRef(datatype) if datatype else None).toPython()
+            elif kind == column.UNBOUND:
+                value = None
+            values.append(value)
+        return values
+
+    def query_template(self, template_id, bindings, cut_prefix=True, context=""):
+        """
+        @brief Run a query defined on the server (see QUERY_TEMPLATES in ontology_rdflib.py)
+
+        @param template_id (string) The query id, e.g. 'sub_classes'
+        @param bindings dict variable name -> uri, e.g. {'uri': 'skiros:Location'}
+
+        @return a list of strings
+        """
+        req = srvs.WoQueryRequest()
+        req.template_id = template_id
+        self._set_bindings(req, bindings)
+        req.context = context
+        req.cut_prefix = cut_prefix
+        return self._call(self._ontology_query, req).answer
+
+    def _set_bindings(self, req, bindings):
+        if bindings:
+            for k, v in bindings.items():
+                req.binding_keys.append(k)
+                req.binding_values.append(self.add_prefix(v))
+
     def set_default_prefix(self, default_prefix):
         self._def_prefix = default_prefix
 
@@ -218,21 +284,21 @@ class OntologyInterface(OntologyAbstractInterface):
         @return     list(string) The individuals.
         """
         if recursive:
-            return self.query_ontology("SELECT ?x WHERE { ?x rdf:type/rdfs:subClassOf* " + self.add_prefix(parent_class) + " . } ")
+            return self.query_template('individuals', {'class': parent_class})
         else:
-            return self.query_ontology("SELECT ?x where {?x rdf:type+ " + self.add_prefix(parent_class) + "}")
+            return self.query_template('direct_individuals', {'class': parent_class})
 
     def get_type(self, uri):
         """
         @brief Returns the type of an individual/class.
         """
-        return self.query_ontology("SELECT ?x where {" + self.add_prefix(uri) + " rdf:type ?x}")
+        return self.query_template('type', {'uri': uri})
 
     def get_types(self, uri):
         """
         @brief Returns all types of a class
         """
-        return self.query_ontology("SELECT ?x where {{ ?x rdf:type {} }}".format(self.add_prefix(uri)))
+        return self.query_template('instances', {'uri': uri})
 
     def get_triples(self, subj=None, pred=None, obj=None):
         """
@@ -240,25 +306,20 @@ class OntologyInterface(OntologyAbstractInterface):
 
         Note: at least one between subj, pred or obj must left blank for this function to work.
         """
+        bindings = {}
         if subj:
-            subj = self.add_prefix(subj)
-        else:
-            subj = "?x"
+            bindings['x'] = subj
         if pred:
-            pred = self.add_prefix(pred)
-        else:
-            pred = "?y"
+            bindings['y'] = pred
         if obj:
-            obj = self.add_prefix(obj)
-        else:
-            obj = "?z"
-        return self.query_ontology("SELECT * WHERE { " + "{} {} {}".format(subj, pred, obj) + " . } ")
+            bindings['z'] = obj
+        return self.query_template('triples', bindings)
 
     def get_super_class(self, child_class):
         """
         @brief Returns the parent class of child_class
         """
-        to_ret = self.query_ontology("SELECT ?x WHERE { " + self.add_prefix(child_class) + " rdfs:subClassOf ?x. } ")
+        to_ret = self.query_template('super_classes', {'uri': child_class})
         if not to_ret:
             log.error("[get_super_class]", "No super class found for {}".format(child_class))
         return to_ret[0]
@@ -269,10 +330,7 @@ class OntologyInterface(OntologyAbstractInterface):
         """
         if(parent_class in self._sub_classes_cache):
             return self._sub_classes_cache[parent_class]
-        if recursive:
-            to_ret = self.query_ontology("SELECT ?x WHERE { ?x rdfs:subClassOf* " + self.add_prefix(parent_class) + " . } ")
-        else:
-            to_ret = self.query_ontology("SELECT ?x WHERE { ?x rdfs:subClassOf " + self.add_prefix(parent_class) + " . } ")
+        to_ret = self.query_template('sub_classes' if recursive else 'direct_sub_classes', {'uri': parent_class})
         self._sub_classes_cache[parent_class] = to_ret
         return to_ret
 
@@ -282,10 +340,7 @@ class OntologyInterface(OntologyAbstractInterface):
         """
         if(parent_property in self._sub_properties_cache):
             return self._sub_properties_cache[parent_property]
-        if recursive:
-            to_ret = self.query_ontology("SELECT ?x WHERE { ?x rdfs:subPropertyOf* " + self.add_prefix(parent_property) + " . } ")
-        else:
-            to_ret = self.query_ontology("SELECT ?x WHERE { ?x rdfs:subPropertyOf " + self.add_prefix(parent_property) + " . } ")
+        to_ret = self.query_template('sub_properties' if recursive else 'direct_sub_properties', {'uri': parent_property})
         self._sub_properties_cache[parent_property] = to_ret
         return to_ret
 
@@ -293,7 +348,7 @@ class OntologyInterface(OntologyAbstractInterface):
         """
         @brief Returns the property datatype restriction
         """
-        answer = self.query_ontology("SELECT ?x WHERE {" + self.add_prefix(property) + " rdfs:range ?x.}")
+        answer = self.query_template('range', {'uri': property})
         return answer[0] if answer else None
 
     def _call(self, service, msg):
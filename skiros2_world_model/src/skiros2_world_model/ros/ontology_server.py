@@ -1,10 +1,12 @@
 import rospy
 import skiros2_common.tools.logger as log
 import skiros2_msgs.srv as srvs
+import skiros2_msgs.msg as msgs
 from std_srvs.srv import SetBool, SetBoolResponse
-from skiros2_world_model.core.ontology_rdflib import Ontology
+from skiros2_world_model.core.ontology_rdflib import Ontology, ResultCache
 from skiros2_common.tools.time_keeper import TimeKeeper
 import skiros2_common.ros.utils as utils
+import rdflib
 from threading import Lock
 from pyparsing import ParseException
 
@@ -19,9 +21,23 @@ class OntologyServer(object):
     def init_ontology_services(self):
         self._times = TimeKeeper()
         self._mutex = Lock()
+        # Results of the read-only queries, valid until their context is modified
+        self._results = ResultCache(int(rospy.get_param('~result_cache_mb', 16) * 1024 * 1024))
         self._mutex_srv = rospy.Service('~lock', SetBool, self._lock_cb)
         self._query = rospy.Service('~ontology/query', srvs.WoQuery, self._wo_query_cb)
         self._modify = rospy.Service('~ontology/modify', srvs.WoModify, self._wo_modify_cb)
+        self._cache_stats = rospy.Service('~ontology/cache_stats', srvs.WoCacheStats, self._wo_cache_stats_cb)
+        if self._verbose:
+            rospy.on_shutdown(self._log_lock_stats)
+
+    def _lock_wait(self):
+        """
+        @brief Time waited for the ontology lock by the calling thread, since the last call
+        """
+        return self._ontology._rw_lock.pop_thread_wait()
+
+    def _log_lock_stats(self):
+        log.info("[{}]".format(self.__class__.__name__), "Lock contention. {}".format(self._ontology._rw_lock.report()))
 
     def _lock_cb(self, msg):
         """
@@ -36,30 +52,117 @@ class OntologyServer(object):
                 return SetBoolResponse(False, "Mutex already unlocked.")
         return SetBoolResponse(True, "Ok")
 
+    def _binding2term(self, value):
+        """
+        @brief      Returns the uri of a binding value: a short uri like
+                    skiros:Product or a full uri, with or without < >
+        """
+        return rdflib.URIRef(self._ontology.lightstring2uri(value.strip("<>")))
+
     def _wo_query_cb(self, msg):
         to_ret = srvs.WoQueryResponse()
+        query = self._ontology.query_template(msg.template_id, msg.context) if msg.template_id else msg.query_string
+        bindings = {k: self._binding2term(v) for k, v in zip(msg.binding_keys, msg.binding_values)}
+        # The whole answer is cached, the pages are read from it
+        key = ('query', query, tuple(sorted(bindings.items())), msg.context, msg.cut_prefix, msg.typed)
+        end = msg.offset + msg.limit if msg.limit else None
         try:
-            log.assertInfo(self._verbose, "[WoQuery]", "Query: {}. Context: {}".format(msg.query_string, msg.context))
+            log.assertInfo(self._verbose, "[WoQuery]", "Query: {}. Bindings: {}. Context: {}".format(query, bindings, msg.context))
             with self._times:
-                for s in self._ontology.query(msg.query_string, context_id=msg.context):
-                    temp = ""
-                    for r in s:
-                        if r is None:
-                            continue
-                        elif msg.cut_prefix:
-                            temp += self._ontology.uri2lightstring(r)
-                        else:
-                            temp += r.n3()
-                        if len(s) > 1:
-                            temp += " "
-                    to_ret.answer.append(temp)
-            log.assertInfo(self._verbose, "[WoQuery]", "Answer: {}. Time: {:0.3f} sec".format(to_ret.answer, self._times.get_last()))
+                with self._ontology._rw_lock.read:
+                    version = self._ontology.context_version(msg.context)
+                    answer = self._results.get(key, version)
+                    if answer is None:
+                        answer = self._run_query(query, msg.context, bindings, msg.cut_prefix, msg.typed)
+                        self._results.put(key, version, answer, self._answer_size(answer, msg.typed) + len(query) + 256)
+                if msg.typed:
+                    to_ret.total = len(answer[0].values) if answer else 0
+                    to_ret.columns = [msgs.QueryColumn(name=c.name, kinds=c.kinds[msg.offset:end], values=c.values[msg.offset:end],
+                                                       datatypes=c.datatypes[msg.offset:end]) for c in answer]
+                else:
+                    to_ret.total = len(answer)
+                    to_ret.answer = answer[msg.offset:end]
+            log.assertInfo(self._verbose, "[WoQuery]", "Answer: {}. Time: {:0.3f} sec. Lock wait: {:0.3f} sec. Query cache hit rate: {:0.1%}. Result cache hit rate: {:0.1%}".format(
+                to_ret.answer if not msg.typed else "{} columns".format(len(to_ret.columns)), self._times.get_last(), self._lock_wait(), self._ontology._queries.hit_rate(), self._results.hit_rate()))
         except (AttributeError, ParseException) as e:
             # TODO: test if the bug is fixed, and remove the exception handling
-            log.error("[WoQuery]", "Parse error with following query: {}.".format(msg.query_string))
+            log.error("[WoQuery]", "Parse error with following query: {}.".format(query))
             raise e
         return to_ret
 
+    def _run_query(self, query, context_id, bindings, cut_prefix, typed):
+        """
+        @brief      Run a query. Returns the answer lines, or a list of
+                    QueryColumn if typed
+        """
+        result = self._ontology.query(query, context_id=context_id, bindings=bindings)
+        rows = list(result)
+        if result.vars is not None:
+            names = [str(v) for v in result.vars]
+        else:
+            # CONSTRUCT and DESCRIBE answer statements
+            names = ["subject", "predicate", "object"][:len(rows[0])] if rows else []
+        # The bound variables are known to the caller
+        columns = list(zip(*rows)) if rows else [()] * len(names)
+        selected = [i for i, name in enumerate(names) if name not in bindings]
+        if typed:
+            return [self._term2column(names[i], columns[i], cut_prefix) for i in selected]
+        fmt = self._ontology.uri2lightstring if cut_prefix else self._n3
+        strings = [[fmt(t) if t is not None else None for t in columns[i]] for i in selected]
+        if len(strings) == 1:
+            return [v if v is not None else "" for v in strings[0]]
+        elif not strings:
+            return [""] * len(rows)
+        # Every value is followed by a space
+        return [self._join_row([v for v in row if v is not None]) for row in zip(*strings)]
+
+    @staticmethod
+    def _n3(term):
+        return term.n3()
+
+    @staticmethod
+    def _join_row(values):
+        return " ".join(values) + " " if values else ""
+
+    def _term2column(self, name, terms, cut_prefix):
+        """
+        @brief      Returns a QueryColumn with the values of terms
+        """
+        column = msgs.QueryColumn(name=name)
+        kinds, values, datatypes = column.kinds, column.values, column.datatypes
+        for t in terms:
+            if t is None:
+                kinds.append(column.UNBOUND)
+                values.append("")
+                datatypes.append("")
+                continue
+            if isinstance(t, rdflib.URIRef):
+                kinds.append(column.URI)
+                values.append(self._ontology.uri2lightstring(t) if cut_prefix else str(t))
+            else:
+                kinds.append(column.LITERAL if isinstance(t, rdflib.Literal) else column.BNODE)
+                values.append(str(t))
+            # Full uris, to convert the literals
+            datatypes.append(str(t.datatype) if getattr(t, 'datatype', None) is not None else "")
+        return column
+
+    def _answer_size(self, answer, typed):
+        """
+        @brief      Returns an estimate of the memory of an answer, in bytes
+        """
+        if typed:
+            return sum(len(v) + len(d) + 1 for c in answer for v, d in zip(c.values, c.datatypes))
+        return sum(len(a) for a in answer)
+
+    def _wo_cache_stats_cb(self, msg):
+        results = self._results
+        to_ret = srvs.WoCacheStatsResponse(hits=results.hits, misses=results.misses, invalidations=results.invalidations,
+                                           evictions=results.evictions, entries=len(results), size=results.size,
+                                           budget=results.budget, query_cache_hit_rate=self._ontology._queries.hit_rate())
+        if msg.reset:
+            results.reset_stats()
+        return to_ret
+
     def _wo_modify_cb(self, msg):
         with self._times:
             for s in msg.statements:
@@ -67,7 +170,7 @@ class OntologyServer(object):
                     self._ontology.add_relation(utils.msg2relation(s.relation), msg.context, msg.author)
                 else:
                     self._ontology.remove_relation(utils.msg2relation(s.relation), msg.context, msg.author)
-        log.assertInfo(self._verbose, "[WoModify]", "Done in {} sec".format(self._times.get_last()))
+        log.assertInfo(self._verbose, "[WoModify]", "Done in {} sec. Lock wait: {:0.3f} sec".format(self._times.get_last(), self._lock_wait()))
         return srvs.WoModifyResponse(True)
 
     def run(self):
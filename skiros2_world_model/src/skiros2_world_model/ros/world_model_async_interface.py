@@ -0,0 +1,146 @@
+import copy
+import threading
+import types
+import rospy
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncWorldModelInterface(object):
+    """
+    @brief      Non-blocking interface to the world model services
+
+                The requests are run by a pool of worker threads and
+                return a concurrent.futures.Future, so that independent
+                requests overlap instead of waiting each other's round
+                trip. Every worker calls the methods of its own copy of
+                a WorldModelInterface, connected with persistent
+                service proxies. The lazy results, like the rows of
+                query_rows, are read by the worker.
+
+                The workers share the element cache of the
+                WorldModelInterface class with the wm monitor callback,
+                which updates it from another thread: every access of
+                the cache is a single dict operation, so a worker reads
+                an element either before or after a change, never a
+                missing entry.
+
+                The requests are not ordered: a request depending on
+                the result of another one must be submitted after the
+                first has completed. With asyncio, a future can be
+                awaited with asyncio.wrap_future.
+
+    Usage:
+        awmi = AsyncWorldModelInterface(wmi)
+        futures = [awmi.resolve_elements(Element(t)) for t in types]
+        results = [f.result() for f in futures]
+    """
+
+    def __init__(self, wmi, workers=4):
+        """
+        @param      wmi      (WorldModelInterface) the interface whose
+                             methods are run by the workers
+        @param      workers  (int) number of worker threads, i.e. of
+                             requests in flight
+        """
+        self._wmi = wmi
+        self._executor = ThreadPoolExecutor(workers)
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    def _interface(self):
+        """
+        @brief      Returns the interface of the calling worker thread,
+                    connecting it at the first call
+        """
+        interface = getattr(self._local, 'interface', None)
+        if interface is None:
+            interface = copy.copy(self._wmi)
+            for name, proxy in vars(self._wmi).items():
+                if isinstance(proxy, rospy.ServiceProxy):
+                    connection = self._connect(proxy)
+                    with self._connections_lock:
+                        self._connections.append(connection)
+                    setattr(interface, name, connection)
+            self._local.interface = interface
+        return interface
+
+    def _connect(self, proxy):
+        """
+        @brief      Returns a persistent connection to the service of
+                    proxy, kept open across the requests of a worker
+        """
+        return rospy.ServiceProxy(proxy.resolved_name, proxy.service_class, persistent=True)
+
+    def _run(self, method, args, kwargs):
+        result = getattr(self._interface(), method)(*args, **kwargs)
+        if isinstance(result, types.GeneratorType):
+            result = list(result)
+        return result
+
+    def submit(self, method, *args, **kwargs):
+        """
+        @brief      Run a method of the WorldModelInterface in a worker
+
+        @param      method  (string) name of the method
+
+        @return     (Future) the result of the method, a list if the
+                    method returns a generator. The exceptions raised
+                    by the method are raised by Future.result
+        """
+        return self._executor.submit(self._run, method, args, kwargs)
+
+    def shutdown(self, wait=True):
+        """
+        @brief      Stop the workers and close their connections
+        """
+        self._executor.shutdown(wait)
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+
+    #==============================================================================
+    # Read
+    #==============================================================================
+
+    def get_element(self, eid, context_id='scene', snapshot_id=""):
+        return self.submit('get_element', eid, context_id, snapshot_id)
+
+    def get_elements(self, eids, context_id='scene', snapshot_id=""):
+        return self.submit('get_elements', eids, context_id, snapshot_id)
+
+    def get_branch(self, eid, relation_filter="skiros:sceneProperty", type_filter="", context_id='scene', snapshot_id=""):
+        return self.submit('get_branch', eid, relation_filter, type_filter, context_id, snapshot_id)
+
+    def resolve_element(self, *args, **kwargs):
+        return self.submit('resolve_element', *args, **kwargs)
+
+    def resolve_elements(self, *args, **kwargs):
+        return self.submit('resolve_elements', *args, **kwargs)
+
+    def query_ontology(self, *args, **kwargs):
+        return self.submit('query_ontology', *args, **kwargs)
+
+    def query_rows(self, *args, **kwargs):
+        """
+        @brief      Future of the list of the rows, see
+                    WorldModelInterface.query_rows
+        """
+        return self.submit('query_rows', *args, **kwargs)
+
+    #==============================================================================
+    # Modify
+    #==============================================================================
+
+    def add_element(self, *args, **kwargs):
+        return self.submit('add_element', *args, **kwargs)
+
+    def update_element(self, *args, **kwargs):
+        return self.submit('update_element', *args, **kwargs)
+
+    def remove_element(self, *args, **kwargs):
+        return self.submit('remove_element', *args, **kwargs)
+
+    def set_relation(self, *args, **kwargs):
+        return self.submit('set_relation', *args, **kwargs)
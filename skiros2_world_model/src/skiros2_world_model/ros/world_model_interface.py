@@ -2,8 +2,9 @@ from .ontology_interface import *
 import skiros2_common.ros.utils as utils
 import skiros2_common.core.params as params
 import skiros2_common.tools.logger as log
-from skiros2_world_model.core.world_model_abstract_interface import WorldModelAbstractInterface
+from skiros2_world_model.core.world_model_abstract_interface import WorldModelAbstractInterface, WmException
 import copy
+from collections import OrderedDict
 import numpy as np
 from inspect import getframeinfo, stack
 try:
@@ -11,6 +12,126 @@ try:
 except NameError:
     basestring = str
 
+
+class WorldModelTransaction(object):
+    def __init__(self, wmi, context_id='scene'):
+        """
+        @brief      Collects world model changes and applies them with a
+                    single service call. Either all or none of the
+                    changes are applied
+
+                    Usually created with WorldModelInterface.transaction()
+                    and used as a context manager, committing when the
+                    with block exits without exceptions
+
+        @param      wmi         (WorldModelInterface) the interface
+                                used to commit
+        @param      context_id  (string)Ontology context identifier
+        """
+        self._wmi = wmi
+        self._context_id = context_id
+        self._operations = []
+        self._elements = []
+        self.snapshot_id = ""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        return False
+
+    def _append(self, action, e=None):
+        op = msgs.WmOperation()
+        op.action = action
+        if e is not None:
+            op.element = utils.element2msg(e)
+        self._operations.append(op)
+        self._elements.append(e)
+        return op
+
+    def add_element(self, e):
+        """
+        @brief      Add an element. The id is updated on commit
+
+        @param      e     (Element) without id
+        """
+        self._append(msgs.WmOperation.ADD, e)
+
+    def update_element(self, e):
+        """
+        @brief      Update properties and relations of an element
+
+        @param      e     (Element) to update
+        """
+        self._append(msgs.WmOperation.UPDATE, e)
+
+    def update_element_properties(self, e, reasoner=""):
+        """
+        @brief      Update the properties of an element, ignoring the
+                    relations
+
+        @param      e         (Element) to update
+        @param      reasoner  (string) If specified, only updates
+                              properties related to the reasoner
+        """
+        self._append(msgs.WmOperation.UPDATE_PROPERTIES, e).type_filter = reasoner
+
+    def remove_element(self, e):
+        """
+        @brief      Remove an element (not recursive)
+
+        @param      e     (Element/string) Element or id of element to
+                          remove
+        """
+        if not isinstance(e, Element):
+            e = Element("", "", e)
+        self._append(msgs.WmOperation.REMOVE, e)
+
+    def set_relation(self, subj, pred, obj, value=True):
+        """
+        @brief      Sets a relation.
+
+        @param      subj   (string)The subj uri
+        @param      pred   (string)The predicate uri
+        @param      obj    (string)The object uri
+        @param      value  (Bool) True set the relation, False removes
+                           it
+        """
+        op = self._append(msgs.WmOperation.SET_RELATION)
+        op.relation = utils.relation2msg(utils.makeRelation(subj, pred, obj))
+        op.value = value
+
+    def commit(self):
+        """
+        @brief      Apply all the collected changes. Raises WmException
+                    if the transaction fails, none of the changes is
+                    applied in that case
+
+        @return     list(Element) the updated element for each
+                    add/update, None for remove/set_relation
+        """
+        msg = srvs.WmTransactionRequest()
+        msg.context = self._context_id
+        msg.author = self._wmi._author_name + self._wmi._debug_info()
+        msg.operations = self._operations
+        res = self._wmi._call(self._wmi._transaction, msg)
+        self._operations = []
+        elements, self._elements = self._elements, []
+        if not res.ok:
+            raise WmException("Transaction failed: {}".format(res.error))
+        self.snapshot_id = res.snapshot_id
+        to_ret = list()
+        for old, new in zip(elements, res.elements):
+            if new.id == "":
+                to_ret.append(None)
+                continue
+            to_ret.append(utils.msg2element(new))
+            old._id = new.id
+        return to_ret
+
+
 class WorldModelInterface(OntologyInterface, WorldModelAbstractInterface):
     _elements_cache = {}
 
@@ -30,8 +151,11 @@ class WorldModelInterface(OntologyInterface, WorldModelAbstractInterface):
         self._set_relations = rospy.ServiceProxy('wm/scene/set_relation', srvs.WmSetRelation)
         self._get = rospy.ServiceProxy('wm/get', srvs.WmGet)
         self._modify = rospy.ServiceProxy('wm/modify', srvs.WmModify)
+        self._transaction = rospy.ServiceProxy('wm/transaction', srvs.WmTransaction)
+        self._get_deltas = rospy.ServiceProxy('wm/get_deltas', srvs.WmGetDeltas)
         self._query_relations = rospy.ServiceProxy('wm/scene/query_relations', srvs.WmQueryRelations)
         self._last_snapshot_id = ""
+        self._last_seq = 0
         self._make_cache = make_cache
         self._external_monitor_cb = None
         self._monitor = rospy.Subscriber("wm/monitor", msgs.WmMonitor, self._monitor_cb, queue_size=100)
@@ -52,27 +176,59 @@ class WorldModelInterface(OntologyInterface, WorldModelAbstractInterface):
         @brief      Callback updating the cache when a change on wm is detected
         """
         if self._make_cache:
-            if self._last_snapshot_id != msg.prev_snapshot_id or msg.action == 'reset':
+            if msg.action == 'reset' or msg.seq <= self._last_seq or (not self._last_seq and self._last_snapshot_id != msg.prev_snapshot_id):
+                # Scene reset, server restarted, or first message received
                 WorldModelInterface._elements_cache.clear()
-            self._last_snapshot_id = msg.snapshot_id
-            for elem in msg.elements:
-                elem = utils.msg2element(elem)
-                if msg.action == 'update' or msg.action == 'update_properties' or msg.action == 'add':
-                    WorldModelInterface._elements_cache[elem.id] = elem
-                elif msg.action == 'remove' or msg.action == 'remove_recursive':
-                    if elem.id in WorldModelInterface._elements_cache:
-                        del WorldModelInterface._elements_cache[elem.id]
-                else:
-                    log.error("[WmMonitor]", "Command {} not recognized.".format(msg.action))
-            if msg.relation:
-                rel = utils.msg2relation(msg.relation[0])
-                if rel['src'] in WorldModelInterface._elements_cache:
-                    del WorldModelInterface._elements_cache[rel['src']]
-                if rel['dst'] in WorldModelInterface._elements_cache:
-                    del WorldModelInterface._elements_cache[rel['dst']]
+            elif msg.seq > self._last_seq + 1:
+                self._recover_changes(msg.seq)
+            self._apply_change(msg)
         if self._external_monitor_cb:
             self._external_monitor_cb(msg)
 
+    def _recover_changes(self, seq):
+        """
+        @brief      Apply to the cache the changes missed before the change
+                    seq. Clears the cache if they are not available
+        """
+        deltas = self.get_deltas(self._last_seq)
+        if deltas is None:
+            log.warn("[WmMonitor]", "Missed changes {}-{} are not available. Clearing cache.".format(self._last_seq + 1, seq - 1))
+            WorldModelInterface._elements_cache.clear()
+            return
+        for msg in deltas:
+            if msg.seq < seq:
+                self._apply_change(msg)
+
+    def _apply_change(self, msg):
+        """
+        @brief      Update the cache with a change from the wm monitor
+        """
+        self._last_seq = msg.seq
+        self._last_snapshot_id = msg.snapshot_id
+        # Drop the elements at both ends of the changed relations, then cache the updated elements.
+        # The elements coming with a delta are kept, to be patched
+        patched = set(delta.id for delta in msg.element_deltas)
+        for rel in msg.relation:
+            rel = utils.msg2relation(rel)
+            if rel['src'] not in patched:
+                WorldModelInterface._elements_cache.pop(rel['src'], None)
+            if rel['dst'] not in patched:
+                WorldModelInterface._elements_cache.pop(rel['dst'], None)
+        for i, elem in enumerate(msg.elements):
+            elem = utils.msg2element(elem)
+            action = msg.element_actions[i] if msg.action == 'transaction' else msg.action
+            if action == 'update' or action == 'update_properties' or action == 'add':
+                WorldModelInterface._elements_cache[elem.id] = elem
+            elif action == 'remove' or action == 'remove_recursive':
+                WorldModelInterface._elements_cache.pop(elem.id, None)
+            else:
+                log.error("[WmMonitor]", "Command {} not recognized.".format(action))
+        # Patch the cached elements
+        for delta in msg.element_deltas:
+            e = WorldModelInterface._elements_cache.get(delta.id)
+            if e is not None:
+                utils.apply_delta_msg(e, delta)
+
     def _resolve_local_relations(self, e):
         for r in e._local_relations:
             sub_e = r['dst']
@@ -111,6 +267,40 @@ class WorldModelInterface(OntologyInterface, WorldModelAbstractInterface):
         if(res):
             return ([utils.msg2element(x) for x in res.elements], res.snapshot_id)
 
+    def transaction(self, context_id='scene'):
+        """
+        @brief      Start a transaction, to apply several changes with a
+                    single call and a single monitor update. Example:
+
+                    with wmi.transaction() as t:
+                        t.set_relation(robot.id, "skiros:contain", obj.id, False)
+                        t.set_relation(gripper.id, "skiros:contain", obj.id)
+                        t.update_element_properties(obj)
+
+        @param      context_id  (string)Ontology context identifier
+
+        @return     (WorldModelTransaction)
+        """
+        return WorldModelTransaction(self, context_id)
+
+    def get_deltas(self, since_seq):
+        """
+        @brief      Get the changes published on the wm monitor after
+                    the change since_seq
+
+        @param      since_seq  (int) seq of the last change received
+
+        @return     list(WmMonitor) the changes, or None if they are not
+                    available anymore
+        """
+        try:
+            res = self._call(self._get_deltas, srvs.WmGetDeltasRequest(since_seq))
+        except WmException:
+            return None
+        if res.ok:
+            return res.deltas
+        return None
+
     def set_monitor_cb(self, cb):
         """
         @brief      Set an external monitor callback
@@ -265,13 +455,32 @@ class WorldModelInterface(OntologyInterface, WorldModelAbstractInterface):
             return 1
         return -1
 
-    def resolve_elements(self, e, context_id='scene'):
+    def get_snapshot_id(self, context_id='scene'):
+        """
+        @brief      Get the id of the current snapshot of the scene. It can
+                    be passed to the get methods to read a consistent
+                    version of the scene, for a limited time
+
+        @param      context_id  (string)Ontology context identifier
+
+        @return     (string) The snapshot id
+        """
+        msg = srvs.WmGetRequest()
+        msg.context = context_id
+        msg.action = msg.GET_SNAPSHOT
+        res = self._call(self._get, msg)
+        if(res):
+            return res.snapshot_id
+
+    def resolve_elements(self, e, context_id='scene', snapshot_id=""):
         """
         @brief      Find all elements matching the input *type, label
                     and properties)
 
-        @param      e           An element to match
-        @param      context_id  (string)Ontology context identifier
+        @param      e            An element to match
+        @param      context_id   (string)Ontology context identifier
+        @param      snapshot_id  (string)If set, match the elements as
+                                 they were at this snapshot
 
         @return     list(Element) List of matches
         """
@@ -279,6 +488,7 @@ class WorldModelInterface(OntologyInterface, WorldModelAbstractInterface):
         msg.context = context_id
         msg.element = utils.element2msg(e)
         msg.action = msg.RESOLVE
+        msg.snapshot_id = snapshot_id
         res = self._call(self._get, msg)
         if(res):
             return [utils.msg2element(x) for x in res.elements]
@@ -356,32 +566,73 @@ class WorldModelInterface(OntologyInterface, WorldModelAbstractInterface):
         if(res):
             return utils.msg2element(res.elements[0])
 
-    def get_element(self, eid, context_id='scene'):
+    def get_element(self, eid, context_id='scene', snapshot_id=""):
         """
         @brief      Gets an element instanciated in the world model.
 
-        @param      eid         (string)Id of the element instance
-        @param      context_id  (string)Ontology context identifier
+        @param      eid          (string)Id of the element instance
+        @param      context_id   (string)Ontology context identifier
+        @param      snapshot_id  (string)If set, get the element as it
+                                 was at this snapshot
 
         @return     (Element)
         """
-        if eid not in WorldModelInterface._elements_cache:
+        # The cache is also updated by the monitor callback: read it once
+        e = WorldModelInterface._elements_cache.get(eid) if not snapshot_id else None
+        if e is None:
             msg = srvs.WmGetRequest()
-            e = msgs.WmElement()
-            e.id = eid
             msg.context = context_id
-            msg.element = e
+            msg.element = msgs.WmElement()
+            msg.element.id = eid
             msg.action = msg.GET
+            msg.snapshot_id = snapshot_id
             res = self._call(self._get, msg)
             if not res:
                 return None
-            if self._make_cache:
-                WorldModelInterface._elements_cache[eid] = utils.msg2element(res.elements[0])
-            else:
-                return utils.msg2element(res.elements[0])
-        return WorldModelInterface._elements_cache[eid]
+            e = utils.msg2element(res.elements[0])
+            if self._make_cache and not snapshot_id:
+                WorldModelInterface._elements_cache[eid] = e
+        return e
+
+    def get_elements(self, eids, context_id='scene', snapshot_id=""):
+        """
+        @brief      Gets several elements instanciated in the world model,
+                    reading the ones not in cache in a single request
+
+        @param      eids         (list)Ids of the element instances
+        @param      context_id   (string)Ontology context identifier
+        @param      snapshot_id  (string)If set, get the elements as they
+                                 were at this snapshot
+
+        @return     (list) Elements in the order of eids, None for the
+                    elements not in the world model
+        """
+        elements = {}
+        if not snapshot_id:
+            for eid in eids:
+                e = WorldModelInterface._elements_cache.get(eid)
+                if e is not None:
+                    elements[eid] = e
+        missing = list(OrderedDict.fromkeys(eid for eid in eids if eid not in elements))
+        if missing:
+            msg = srvs.WmGetRequest()
+            msg.context = context_id
+            msg.action = msg.GET_MULTIPLE
+            msg.ids = missing
+            msg.snapshot_id = snapshot_id
+            res = self._call(self._get, msg)
+            if not res:
+                return [None] * len(eids)
+            for eid, e in zip(missing, res.elements):
+                if not e.id:
+                    elements[eid] = None
+                    continue
+                elements[eid] = utils.msg2element(e)
+                if self._make_cache and not snapshot_id:
+                    WorldModelInterface._elements_cache[eid] = elements[eid]
+        return [elements[eid] for eid in eids]
 
-    def get_branch(self, eid, relation_filter="skiros:sceneProperty", type_filter="", context_id='scene'):
+    def get_branch(self, eid, relation_filter="skiros:sceneProperty", type_filter="", context_id='scene', snapshot_id=""):
         """
         @brief      Get an element and related children elements. Answer
                     can be filtered
@@ -392,6 +643,8 @@ class WorldModelInterface(OntologyInterface, WorldModelAbstractInterface):
         @param      type_filter      (string)Filter on Element class
                                      type (e.g. skiros:Manipulatable)
         @param      context_id       (string)Ontology context identifier
+        @param      snapshot_id      (string)If set, get the elements as
+                                     they were at this snapshot
 
         @return     list(Element)
         """
@@ -403,6 +656,7 @@ class WorldModelInterface(OntologyInterface, WorldModelAbstractInterface):
         msg.action = msg.GET_RECURSIVE
         msg.relation_filter = relation_filter
         msg.type_filter = type_filter
+        msg.snapshot_id = snapshot_id
         res = self._call(self._get, msg)
         if(res):
             return [utils.msg2element(x) for x in res.elements]
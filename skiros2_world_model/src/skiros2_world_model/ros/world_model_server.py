@@ -1,6 +1,8 @@
 import rospy
 import rospkg
-from os import walk
+import rdflib
+from rdflib.plugins.stores.memory import Memory
+from os import walk, path
 import skiros2_common.tools.logger as log
 import skiros2_common.ros.utils as utils
 import skiros2_msgs.msg as msgs
@@ -8,9 +10,36 @@ import skiros2_msgs.srv as srvs
 from skiros2_common.tools.plugin_loader import PluginLoader
 from skiros2_common.core.discrete_reasoner import DiscreteReasoner
 from skiros2_world_model.ros.ontology_server import OntologyServer
-from skiros2_world_model.core.world_model import WorldModel, IndividualsDataset, Element
+from skiros2_world_model.core.world_model import WorldModel, IndividualsDataset, Element, ElementCache
+from skiros2_world_model.core.sqlite_store import SQLiteStore
+from skiros2_world_model.core.compact_store import CompactStore, SplitStore
+from skiros2_world_model.core.journal import Journal
+from skiros2_world_model.core.parse_cache import ParseCache, parse_files
+from skiros2_world_model.core.ontology_rdflib import Ontology
+from skiros2_common.tools.time_keeper import TimeKeeper
 import uuid
-from time import sleep
+import threading
+from collections import deque, OrderedDict
+from time import sleep, time
+
+
+def _element_key(msg):
+    """
+    @brief      Returns a hashable key of a WmElement message
+    """
+    return (msg.id, msg.type, msg.label,
+            tuple((p.key, p.dataValue, p.dataType) for p in msg.properties),
+            tuple((r.subjectId, r.predicate, r.objectId) for r in msg.relations))
+
+
+def _element_size(msg):
+    """
+    @brief      Returns an estimate of the memory of a WmElement message, in bytes
+    """
+    size = len(msg.id) + len(msg.type) + len(msg.label)
+    size += sum(len(p.key) + len(p.dataValue) + len(p.dataType) + 64 for p in msg.properties)
+    size += sum(len(r.subjectId) + len(r.predicate) + len(r.objectId) + 64 for r in msg.relations)
+    return size + 128
 
 
 class WorldModelServer(OntologyServer):
@@ -19,50 +48,135 @@ class WorldModelServer(OntologyServer):
         rospy.init_node("wm", anonymous=anonymous)
         rospy.on_shutdown(self._wait_clients_disconnection)  # TODO: make this work
         self._verbose = rospy.get_param('~verbose', False)
+        # Elements cached per context, 0 for no bound
+        ElementCache.capacity = rospy.get_param('~element_cache_size', ElementCache.capacity)
         self.contexts = dict()
-        self._ontology = WorldModel(self._verbose, 'scene', self._wm_change_cb)
+        self._ontology = WorldModel(self._verbose, 'scene', self._wm_change_cb, self._open_graph())
         self.contexts['scene'] = self._ontology
         self._plug_loader = PluginLoader()
+        self._journal = self._open_journal()
         self._init_wm()
+        if rospy.get_param('~inferred_types', False):  # Materialize the rdf:type entailed by rdfs:subClassOf
+            self._ontology.enable_inferred_types()
+        if self._journal is not None:
+            self._ontology.set_journal(self._journal)
+            rospy.on_shutdown(self._journal.stop)
         self._load_reasoners()
         #================Snapshot======================
-        self._curr_snapshot = uuid.uuid4()  # random UUID
-        #self._snapshots_log = []
+        self._curr_snapshot = uuid.uuid4()  # random UUID, id of the current state of the scene
+        self._published_snapshot = self._curr_snapshot.hex  # Last snapshot id published on the monitor
+        self._snapshots_window = rospy.get_param('~snapshots_window', 30.0)  # Seconds a snapshot stays readable
+        self._snapshots = OrderedDict()  # Readable snapshots: snapshot id -> (scene version, time)
+        if self._snapshots_window > 0:
+            self._ontology.enable_snapshots()
+            self._retain_snapshot()
+        self._seq = 0
+        self._deltas = deque(maxlen=rospy.get_param('~deltas_buffer_size', 1000))  # Last published changes
+        self._unpublished = deque()  # Changes queued with their seq, not yet sent on the monitor
+        self._publish_lock = threading.Lock()
+        self._send_lock = threading.Lock()  # Sends the queued changes one thread at a time, in order
+        self._changes = threading.local()  # Change events collected by the running service call, per thread
+        self._delta_encoding = rospy.get_param('~delta_encoding', False)  # Publish only the changes of the updated elements
         #================ROS======================
         self._set_relation = rospy.Service('~scene/set_relation', srvs.WmSetRelation, self._wm_set_rel_cb)
         self._query_relations = rospy.Service('~scene/query_relations', srvs.WmQueryRelations, self._wm_query_rel_cb)
         self._get = rospy.Service('~get', srvs.WmGet, self._wm_get_cb)
         self._modify = rospy.Service('~modify', srvs.WmModify, self._wm_modify_cb)
+        self._transaction = rospy.Service('~transaction', srvs.WmTransaction, self._wm_transaction_cb)
         self._monitor = rospy.Publisher("~monitor", msgs.WmMonitor, queue_size=20, latch=True)
+        self._get_deltas = rospy.Service('~get_deltas', srvs.WmGetDeltas, self._wm_get_deltas_cb)
+        self._element_cache_stats = rospy.Service('~element_cache_stats', srvs.WmCacheStats, self._wm_cache_stats_cb)
         self._load_and_save = rospy.Service('~load_and_save', srvs.WoLoadAndSave, self._load_and_save_cb)
         self.init_ontology_services()
 
+    def _open_graph(self):
+        """
+        @brief      Create the graph with the store backend selected by the
+                    ~store param: 'memory' (default) or 'sqlite', persisted
+                    in the ~store_path file. With the memory store, the
+                    contexts listed in ~compact_contexts are kept in a
+                    CompactStore
+
+        @return     The graph, or None for the default in-memory graph
+        """
+        store = rospy.get_param('~store', 'memory')
+        compact_contexts = rospy.get_param('~compact_contexts', [])
+        if store == 'sqlite':
+            store_path = path.expanduser(rospy.get_param('~store_path', '~/.skiros/world_model.sqlite'))
+            log.info("[{}]".format(self.__class__.__name__), "Opening store: {}".format(store_path))
+            if compact_contexts:
+                log.warn("[{}]".format(self.__class__.__name__), "Ignoring compact_contexts: not supported with the sqlite store.")
+            graph = rdflib.ConjunctiveGraph(store=SQLiteStore(store_path))
+            rospy.on_shutdown(graph.close)
+            return graph
+        elif store != 'memory':
+            log.error("[{}]".format(self.__class__.__name__), "Unknown store '{}'. Using the in-memory store.".format(store))
+        if compact_contexts:
+            log.info("[{}]".format(self.__class__.__name__), "Compact store for contexts: {}".format(compact_contexts))
+            return rdflib.ConjunctiveGraph(store=SplitStore(Memory(), {context_id: CompactStore() for context_id in compact_contexts}))
+        return None
+
+    def _open_journal(self):
+        """
+        @brief      Create the journal of the scene changes, if the ~journal
+                    param is set. The files are ~journal_path.checkpoint and
+                    ~journal_path.journal
+
+        @return     The journal, or None
+        """
+        if not rospy.get_param('~journal', False):
+            return None
+        journal_path = path.expanduser(rospy.get_param('~journal_path', '~/.skiros/journal/scene'))
+        log.info("[{}]".format(self.__class__.__name__), "Journal: {}".format(journal_path))
+        return Journal(journal_path, rospy.get_param('~checkpoint_interval', 60.0), rospy.get_param('~checkpoint_size', 10000))
+
     def _init_wm(self):
         rospack = rospkg.RosPack()
         self._skiros_dir = rospack.get_path('skiros2') + '/owl'
         self._workspace = rospy.get_param('~workspace_dir', self._skiros_dir)
-        for (dirpath, dirnames, filenames) in walk(self._skiros_dir):
-            for name in filenames:
-                if name.find('.owl') >= 0:
-                    self._ontology.load(dirpath + '/' + name)
-        for (dirpath, dirnames, filenames) in walk(self._workspace):
-            for name in filenames:
-                if name.find('.owl') >= 0:
-                    self._ontology.load(dirpath + '/' + name)
+        if len(self._ontology.context) > 0:
+            # Persistent store: the ontologies and the contexts are already there
+            self._reopen_wm()
+            return
+        # Parsed files, reloaded without parsing while unchanged. Empty to disable
+        cache_dir = rospy.get_param('~parse_cache_dir', path.join(self._workspace or self._skiros_dir, '.parse_cache'))
+        cache = ParseCache(cache_dir) if cache_dir else None
+        init_scene = rospy.get_param('~init_scene', "")
+        recovered = self._journal.recover() if self._journal is not None else None
+        contexts = [context.split(" ") for context in rospy.get_param('~load_contexts', [])]
+        scenes = ([('scene', init_scene)] if recovered is None and init_scene != "" else []) + contexts
+        # The ontologies and the scenes are parsed together in worker processes, then added in order
+        ontologies = self._find_ontologies(self._skiros_dir) + self._find_ontologies(self._workspace)
+        files = [(name, Ontology.default_context_id(name), None) for name in ontologies]
+        for context_id, name in scenes:
+            if path.isfile(self._scene_path(name)) and (self._scene_path(name), context_id, 'turtle') not in files:
+                files.append((self._scene_path(name), context_id, 'turtle'))
+        processes = rospy.get_param('~load_processes', 0) or None  # 0 for one process per core
+        parse_times = {}
+        times = TimeKeeper()
+        with times:
+            parsed = dict(zip(files, parse_files(files, cache, processes, parse_times)))
+        log.info("[{}]".format(self.__class__.__name__), "Parsed {} files in {:0.3f} secs.{}".format(
+            len(parse_times), times.get_last(), " Parse cache {}: {} hits, {} misses".format(cache.directory, cache.hits, cache.misses) if cache is not None else ""))
+        with times:
+            for name in ontologies:
+                self._load_ontology(name, parsed[(name, Ontology.default_context_id(name), None)], parse_times)
+        log.info("[{}]".format(self.__class__.__name__), "Loaded the ontologies in {:0.3f} secs.".format(times.get_last()))
         if not self._workspace:
             self._workspace = self._skiros_dir
         self._ontology.workspace = self._workspace
         log.info("[{}]".format(self.__class__.__name__), "Workspace folder: {}".format(self._workspace))
         self._ontology.set_default_prefix('skiros', 'http://rvmi.aau.dk/ontologies/skiros.owl#')
-        init_scene = rospy.get_param('~init_scene', "")
-        self._ontology.reset()
-        if init_scene != "":
-            self._ontology.load_context(init_scene)
-        for context in rospy.get_param('~load_contexts', []):
-            context_id, filename = context.split(" ")
+        if recovered is not None:
+            self._ontology.recover(recovered)
+        else:
+            self._ontology.reset()
+            if init_scene != "":
+                self._ontology.load_context(init_scene, parsed.get((self._scene_path(init_scene), 'scene', 'turtle')))
+        for context_id, filename in contexts:
             log.info("[{}]".format(self.__class__.__name__), "Loading context {} from {}".format(context_id, filename))
             graph = self._get_context(context_id)
-            graph.load_context(filename)
+            graph.load_context(filename, parsed.get((self._scene_path(filename), context_id, 'turtle')))
         # Clear prefixes from autogenerated default
         # Fix: Without the copy this causes "RuntimeError: dictionary keys changed during iteration"
         namespaces = list(self._ontology._ontology.namespace_manager.store.namespaces())
@@ -71,6 +185,51 @@ class WorldModelServer(OntologyServer):
                 self._ontology._bind(prefix, "")
         self._ontology._bind("", "")
 
+    def _find_ontologies(self, directory):
+        """
+        @brief      Returns the .owl files found in directory
+        """
+        files = []
+        for (dirpath, dirnames, filenames) in walk(directory):
+            for name in filenames:
+                if name.find('.owl') >= 0:
+                    files.append(dirpath + '/' + name)
+        return files
+
+    def _scene_path(self, filename):
+        """
+        @brief      The path load_context reads a scene from
+        """
+        return "{}/{}".format(self._workspace or self._skiros_dir, filename)
+
+    def _load_ontology(self, filename, parsed, parse_times):
+        """
+        @brief      Add a parsed ontology file, logging the time spent on it
+        """
+        times = TimeKeeper()
+        with times:
+            self._ontology.load(filename, parsed=parsed)
+        source = "parsed in {:0.3f} secs".format(parse_times[filename]) if filename in parse_times else "from cache"
+        log.info("[{}]".format(self.__class__.__name__), "Loaded {} ({}) in {:0.3f} secs".format(path.basename(filename), source, times.get_last()))
+
+    def _reopen_wm(self):
+        """
+        @brief      Restore the world model from a non-empty persistent
+                    store, without parsing the ontology and scene files
+        """
+        if not self._workspace:
+            self._workspace = self._skiros_dir
+        self._ontology.workspace = self._workspace
+        log.info("[{}]".format(self.__class__.__name__), "Workspace folder: {}".format(self._workspace))
+        self._ontology.set_default_prefix('skiros', 'http://rvmi.aau.dk/ontologies/skiros.owl#')
+        times = TimeKeeper()
+        with times:
+            self._ontology.restore()
+            for context in rospy.get_param('~load_contexts', []):
+                context_id, _ = context.split(" ")
+                self._get_context(context_id).restore()
+        log.info("[{}]".format(self.__class__.__name__), "Reopened scene with {} statements. Time: {:0.3f} secs".format(len(self._ontology.context), times.get_last()))
+
     def _load_reasoners(self):
         """
         Load reasoner plugins
@@ -88,25 +247,149 @@ class WorldModelServer(OntologyServer):
                 sleep(0.1)
 
     def _wm_change_cb(self, author, action, element=None, relation=None):
+        """
+        @brief      Publish a change of the scene. During a service call,
+                    the change is collected and published with the others
+                    at the end of the call
+        """
+        changes = getattr(self._changes, 'batch', None)
+        if changes is not None:
+            changes.append((action, element, relation))
+            return
         if element is not None:
-            self._publish_change(author, action, [utils.element2msg(element)])
+            self._queue_change(author, action, [utils.element2msg(element)])
         else:
-            self._publish_change(author, action, relation=utils.relation2msg(relation))
+            self._queue_change(author, action, relation=utils.relation2msg(relation))
+        self._send_changes()
+
+    def _begin_changes(self):
+        """
+        @brief      Start collecting the change events raised by this thread.
+                    The scene stays write locked until _end_changes, so
+                    that the changes of a service call get a snapshot and
+                    a seq of their own
+        """
+        self._ontology._rw_lock.acquire_write()
+        self._changes.batch = []
+        self._changes.snapshot_id = None
+
+    def _changed_relations(self):
+        """
+        @brief      The relations changed since _begin_changes
+
+        @return     list of relation msgs. The changed elements are
+                    returned by the service calls themselves
+        """
+        return [utils.relation2msg(r) for _, _, r in self._changes.batch if r is not None]
+
+    def _end_changes(self):
+        """
+        @brief      Stop collecting the change events raised by this thread,
+                    make the snapshot of the resulting state if no change
+                    was queued, then release the scene and send the
+                    queued changes
+
+        @return     (string) the snapshot id
+        """
+        try:
+            self._changes.batch = None
+            snapshot_id = self._changes.snapshot_id
+            if snapshot_id is None:
+                snapshot_id = self._new_snapshot()
+        finally:
+            self._ontology._rw_lock.release_write()
+        self._send_changes()
+        return snapshot_id
+
+    def _new_snapshot(self):
+        """
+        @brief      Make a new snapshot id for the current state of the
+                    scene. Called with the scene write locked, so that the
+                    id matches the scene version
+
+        @return     (string) the snapshot id
+        """
+        with self._publish_lock:
+            self._curr_snapshot = uuid.uuid4()  # random UUID
+            self._retain_snapshot()
+            return self._curr_snapshot.hex
+
+    def _queue_change(self, author, action, elements=None, relation=None, context_id='scene', element_actions=None, element_deltas=None):
+        """
+        @brief      Queue a change for the monitor topic, with the snapshot
+                    id of the state after it. The snapshot, the seq and the
+                    previous snapshot id are assigned with the scene write
+                    locked, so that they follow the order of the changes.
+                    The change is sent by _send_changes
 
-    def _publish_change(self, author, action, elements=None, relation=None, context_id='scene'):
+        @param      relation         a relation msg or a list of relation msgs
+        @param      element_actions  for transactions, the action applied on each element
+        @param      element_deltas   for updates with delta encoding, the changes of the elements
+        """
         if context_id == 'scene':
             msg = msgs.WmMonitor()
-            msg.prev_snapshot_id = self._curr_snapshot.hex
-            self._curr_snapshot = uuid.uuid4()  # random UUID
-            msg.snapshot_id = self._curr_snapshot.hex
             msg.stamp = rospy.Time.now()
             msg.author = author
             msg.action = action
             if elements:
                 msg.elements = elements
-            if relation:
+            if isinstance(relation, list):
+                msg.relation = relation
+            elif relation:
                 msg.relation.append(relation)
-            self._monitor.publish(msg)
+            if element_actions:
+                msg.element_actions = element_actions
+            if element_deltas:
+                msg.element_deltas = element_deltas
+            with self._ontology._rw_lock.write:
+                snapshot_id = self._new_snapshot()
+                if getattr(self._changes, 'batch', None) is not None:
+                    self._changes.snapshot_id = snapshot_id
+                with self._publish_lock:
+                    msg.prev_snapshot_id = self._published_snapshot
+                    msg.snapshot_id = self._published_snapshot = snapshot_id
+                    self._seq += 1
+                    msg.seq = self._seq
+                    self._deltas.append(msg)
+                    self._unpublished.append(msg)
+
+    def _send_changes(self):
+        """
+        @brief      Publish the queued changes on the monitor topic, in the
+                    order of their seq. Called without the scene locked
+        """
+        with self._send_lock:
+            while True:
+                with self._publish_lock:
+                    if not self._unpublished:
+                        return
+                    msg = self._unpublished.popleft()
+                self._monitor.publish(msg)
+
+    def _retain_snapshot(self):
+        """
+        @brief      Keep the current snapshot readable, and release the ones
+                    older than the snapshots window. Called with the scene
+                    write locked and the publish lock held
+        """
+        if self._snapshots_window <= 0:
+            return
+        now = time()
+        self._snapshots[self._curr_snapshot.hex] = (self._ontology.version, now)
+        while now - next(iter(self._snapshots.values()))[1] > self._snapshots_window:
+            self._snapshots.popitem(last=False)
+        self._ontology.release_snapshots(next(iter(self._snapshots.values()))[0])
+
+    def _get_snapshot(self, context_id, snapshot_id):
+        """
+        @brief      Returns a view of the scene at a snapshot. Must be used
+                    with the ontology read lock held
+        """
+        with self._publish_lock:
+            snapshot = self._snapshots.get(snapshot_id)
+        if context_id != 'scene' or snapshot is None:
+            raise Exception("Snapshot {} of context {} is not available.".format(snapshot_id, context_id))
+        return self._ontology.snapshot(snapshot[0])
 
     def _get_context(self, context_id):
         if context_id not in self.contexts:
@@ -121,91 +404,217 @@ class WorldModelServer(OntologyServer):
             if msg.action == msg.SAVE:
                 self._get_context(msg.context).save_context(msg.filename)
             elif msg.action == msg.LOAD:
-                self._get_context(msg.context).load_context(msg.filename)
-                self._publish_change("", "reset", elements=[], context_id=msg.context)
+                with self._ontology._rw_lock.write:
+                    self._get_context(msg.context).load_context(msg.filename)
+                    self._queue_change("", "reset", elements=[], context_id=msg.context)
+                self._send_changes()
             else:
                 return srvs.WoLoadAndSaveResponse(False)
         if self._verbose:
-            log.info("[wmLoadAndSave]", "{} {} to file {}. Time: {:0.3f} secs".format(msg.action, msg.context, self._get_context(msg.context).filename, self._times.get_last()))
+            log.info("[wmLoadAndSave]", "{} {} to file {}. Time: {:0.3f} secs. Lock wait: {:0.3f} secs".format(msg.action, msg.context, self._get_context(msg.context).filename, self._times.get_last(), self._lock_wait()))
         return srvs.WoLoadAndSaveResponse(True)
 
+    def _wm_get_deltas_cb(self, msg):
+        to_ret = srvs.WmGetDeltasResponse()
+        with self._publish_lock:
+            to_ret.seq = self._seq
+            deltas = list(self._deltas)
+        first = deltas[0].seq if deltas else self._seq + 1
+        # The changes after since_seq must all be in the buffer
+        to_ret.ok = first <= msg.since_seq + 1 and msg.since_seq <= to_ret.seq
+        if to_ret.ok:
+            to_ret.deltas = deltas[msg.since_seq + 1 - first:]
+        if self._verbose:
+            log.info("[WmGetDeltas]", "Since: {} Last: {} Ok: {}. Sent {} changes".format(msg.since_seq, to_ret.seq, to_ret.ok, len(to_ret.deltas)))
+        return to_ret
+
+    def _wm_cache_stats_cb(self, msg):
+        to_ret = srvs.WmCacheStatsResponse()
+        for context_id, context in list(self.contexts.items()):
+            cache = context._elements_cache
+            to_ret.contexts.append(msgs.ElementCacheStats(context=context_id, hits=cache.hits, misses=cache.misses, evictions=cache.evictions,
+                                                          entries=len(cache), capacity=cache.capacity, size=cache.memory()))
+            if msg.reset:
+                cache.reset_stats()
+        return to_ret
+
     def _wm_query_rel_cb(self, msg):
         # TODO: get rid of this. Replace implementation with a standard SPARQL query
         to_ret = srvs.WmQueryRelationsResponse()
         with self._times:
             to_ret.matches = [utils.relation2msg(x) for x in self._ontology.get_relations(utils.msg2relation(msg.relation))]
         if self._verbose:
-            log.info("[wmQueryRelation]", "Query: {} Answer: {}. Time: {:0.3f} secs".format(msg.relation, to_ret.matches, self._times.get_last()))
+            log.info("[wmQueryRelation]", "Query: {} Answer: {}. Time: {:0.3f} secs. Lock wait: {:0.3f} secs".format(msg.relation, to_ret.matches, self._times.get_last(), self._lock_wait()))
         return to_ret
 
     def _wm_get_cb(self, msg):
         with self._times:
             to_ret = srvs.WmGetResponse()
-            if msg.action == msg.GET:
-                to_ret.elements.append(utils.element2msg(self._get_context(msg.context).get_element(msg.element.id)))
-            elif msg.action == msg.GET_TEMPLATE:
-                to_ret.elements.append(utils.element2msg(self._get_context(msg.context).get_template_individual(msg.element.label)))
-            elif msg.action == msg.GET_RECURSIVE:
-                for _, e in self._get_context(msg.context).get_recursive(msg.element.id, msg.relation_filter, msg.type_filter).items():
-                    to_ret.elements.append(utils.element2msg(e))
-            elif msg.action == msg.RESOLVE:
-                for e in self._get_context(msg.context).resolve_elements(utils.msg2element(msg.element)):
-                    to_ret.elements.append(utils.element2msg(e))
+            context = self._get_context(msg.context)
+            # The snapshot view is valid until the next change
+            with context._rw_lock.read:
+                to_ret.snapshot_id = self._curr_snapshot.hex
+                snapshot = None
+                if msg.snapshot_id:
+                    snapshot = self._get_snapshot(msg.context, msg.snapshot_id)
+                    to_ret.snapshot_id = msg.snapshot_id
+                if msg.action == msg.GET:
+                    to_ret.elements.append(utils.element2msg(context.get_element(msg.element.id, snapshot)))
+                elif msg.action == msg.GET_MULTIPLE:
+                    for eid in msg.ids:
+                        if context.has_element(eid, snapshot):
+                            to_ret.elements.append(utils.element2msg(context.get_element(eid, snapshot)))
+                        else:
+                            to_ret.elements.append(msgs.WmElement())
+                elif msg.action == msg.GET_TEMPLATE:
+                    to_ret.elements.append(utils.element2msg(context.get_template_individual(msg.element.label)))
+                elif msg.action == msg.GET_RECURSIVE:
+                    for _, e in context.get_recursive(msg.element.id, msg.relation_filter, msg.type_filter, snapshot).items():
+                        to_ret.elements.append(utils.element2msg(e))
+                elif msg.action == msg.RESOLVE:
+                    # Resolving depends also on the class and property hierarchies
+                    # of the ontology contexts: the version is the one of the whole graph
+                    key = ('resolve', msg.context, msg.snapshot_id, _element_key(msg.element))
+                    version = context.context_version("")
+                    elements = self._results.get(key, version)
+                    if elements is None:
+                        elements = [utils.element2msg(e) for e in context.resolve_elements(utils.msg2element(msg.element), snapshot)]
+                        self._results.put(key, version, elements, sum(_element_size(e) for e in elements) + 256)
+                    to_ret.elements.extend(elements)
         output = ""
         einput = utils.msg2element(msg.element)
         for e in to_ret.elements:
             output += "{} ".format(e.id)
         if self._verbose:
-            log.info("[WmGet]", "Done {} [{}]. Answer: {}. Time: {:0.3f} secs".format(msg.action, einput, output, self._times.get_last()))
-        to_ret.snapshot_id = self._curr_snapshot.hex
+            log.info("[WmGet]", "Done {} [{}]. Answer: {}. Time: {:0.3f} secs. Lock wait: {:0.3f} secs".format(msg.action, einput, output, self._times.get_last(), self._lock_wait()))
         return to_ret
 
     def _wm_set_rel_cb(self, msg):
         with self._times:
-            if msg.value:
-                temp = "+"
-                self._ontology.add_relation(utils.msg2relation(msg.relation), msg.author, is_relation=True)
-                self._publish_change(msg.author, "add", relation=msg.relation)
-            else:
-                temp = "-"
-                self._ontology.remove_relation(utils.msg2relation(msg.relation), msg.author, is_relation=True)
-                self._publish_change(msg.author, "remove", relation=msg.relation)
+            self._begin_changes()
+            try:
+                if msg.value:
+                    temp = "+"
+                    self._ontology.add_relation(utils.msg2relation(msg.relation), msg.author, is_relation=True)
+                else:
+                    temp = "-"
+                    self._ontology.remove_relation(utils.msg2relation(msg.relation), msg.author, is_relation=True)
+                self._queue_change(msg.author, "add" if msg.value else "remove", relation=msg.relation)
+            finally:
+                self._end_changes()
         if self._verbose:
-            log.info("[wmSetRelCb]", "[{}] {} Time: {:0.3f} secs".format(temp, msg.relation, self._times.get_last()))
+            log.info("[wmSetRelCb]", "[{}] {} Time: {:0.3f} secs. Lock wait: {:0.3f} secs".format(temp, msg.relation, self._times.get_last(), self._lock_wait()))
         return srvs.WmSetRelationResponse(True)
 
     def _wm_modify_cb(self, msg):
         to_ret = srvs.WmModifyResponse()
         with self._times:
-            if msg.action == msg.ADD:
-                for e in msg.elements:
-                    updated_e = self._get_context(msg.context).add_element(utils.msg2element(e), msg.author)
-                    to_ret.elements.append(utils.element2msg(updated_e))
-                self._publish_change(msg.author, "add", elements=to_ret.elements, context_id=msg.context)
-            elif msg.action == msg.UPDATE:
-                for e in msg.elements:
-                    self._get_context(msg.context).update_element(utils.msg2element(e), msg.author)
-                    er = utils.element2msg(self._get_context(msg.context).get_element(e.id))
-                    to_ret.elements.append(er)
-                self._publish_change(msg.author, "update", elements=to_ret.elements, context_id=msg.context)
-            elif msg.action == msg.UPDATE_PROPERTIES:
-                for e in msg.elements:
-                    self._get_context(msg.context).update_properties(utils.msg2element(e), msg.author, self._ontology.get_reasoner(msg.type_filter), False)
-                    er = utils.element2msg(self._get_context(msg.context).get_element(e.id))
-                    to_ret.elements.append(er)
-                self._publish_change(msg.author, "update", elements=to_ret.elements, context_id=msg.context)
-            elif msg.action == msg.REMOVE:
-                for e in msg.elements:
-                    self._get_context(msg.context).remove_element(utils.msg2element(e), msg.author)
-                to_ret.elements = msg.elements
-                self._publish_change(msg.author, "remove", elements=msg.elements, context_id=msg.context)
-            elif msg.action == msg.REMOVE_RECURSIVE:
-                for e in msg.elements:
-                    self._get_context(msg.context).remove_recursive(utils.msg2element(e), msg.author, msg.relation_filter, msg.type_filter)
-                to_ret.elements = msg.elements
-                self._publish_change(msg.author, "remove_recursive", elements=msg.elements, context_id=msg.context)
+            self._begin_changes()
+            deltas = [] if self._delta_encoding else None
+            try:
+                try:
+                    action = self._apply_modify(msg, to_ret, deltas)
+                except BaseException:
+                    # Let the clients know about the relations changed before the failure
+                    relations = self._changed_relations()
+                    if relations:
+                        self._queue_change(msg.author, "update", relation=relations, context_id=msg.context)
+                    raise
+                if deltas:
+                    self._queue_change(msg.author, action, relation=self._changed_relations(), context_id=msg.context, element_deltas=deltas)
+                elif action is not None:
+                    self._queue_change(msg.author, action, elements=to_ret.elements, relation=self._changed_relations(), context_id=msg.context)
+            finally:
+                self._end_changes()
+        if self._verbose:
+            log.info("[WmModify]", "{} {} {}. Time: {:0.3f} secs. Lock wait: {:0.3f} secs".format(msg.author, msg.action, [e.id for e in to_ret.elements], self._times.get_last(), self._lock_wait()))
+        return to_ret
+
+    def _apply_modify(self, msg, to_ret, deltas=None):
+        """
+        @brief      Apply a WmModify request, filling the response elements
+
+        @param      deltas  if a list, filled with the changes of the
+                            updated elements
+
+        @return     (string) the action to publish on the monitor, None
+                    if the request action is not recognized
+        """
+        if msg.action == msg.ADD:
+            for e in msg.elements:
+                updated_e = self._get_context(msg.context).add_element(utils.msg2element(e), msg.author)
+                to_ret.elements.append(utils.element2msg(updated_e))
+            return "add"
+        elif msg.action == msg.UPDATE:
+            for e in msg.elements:
+                self._update(msg.context, e.id, to_ret, deltas, lambda context: context.update_element(utils.msg2element(e), msg.author))
+            return "update"
+        elif msg.action == msg.UPDATE_PROPERTIES:
+            for e in msg.elements:
+                self._update(msg.context, e.id, to_ret, deltas, lambda context: context.update_properties(utils.msg2element(e), msg.author, self._ontology.get_reasoner(msg.type_filter), False))
+            return "update"
+        elif msg.action == msg.REMOVE:
+            for e in msg.elements:
+                self._get_context(msg.context).remove_element(utils.msg2element(e), msg.author)
+            to_ret.elements = msg.elements
+            return "remove"
+        elif msg.action == msg.REMOVE_RECURSIVE:
+            for e in msg.elements:
+                self._get_context(msg.context).remove_recursive(utils.msg2element(e), msg.author, msg.relation_filter, msg.type_filter)
+            to_ret.elements = msg.elements
+            return "remove_recursive"
+        return None
+
+    def _update(self, context_id, eid, to_ret, deltas, update):
+        """
+        @brief      Apply an update to an element, adding the updated element
+                    to the response and its changes to deltas, if a list
+        """
+        context = self._get_context(context_id)
+        # The element must not change between the state and the update
+        with context._rw_lock.write:
+            state = utils.element2state(context.get_element(eid)) if deltas is not None else None
+            update(context)
+            updated = context.get_element(eid)
+            to_ret.elements.append(utils.element2msg(updated))
+            if deltas is not None:
+                deltas.append(utils.delta2msg(state, updated))
+
+    def _msg2operation(self, msg):
+        if msg.action == msg.SET_RELATION:
+            return {'action': msg.action, 'relation': utils.msg2relation(msg.relation), 'value': msg.value}
+        return {'action': msg.action, 'element': utils.msg2element(msg.element), 'reasoner': self._ontology.get_reasoner(msg.type_filter)}
+
+    def _wm_transaction_cb(self, msg):
+        to_ret = srvs.WmTransactionResponse()
+        with self._times:
+            self._begin_changes()
+            try:
+                try:
+                    results = self._get_context(msg.context).transaction([self._msg2operation(op) for op in msg.operations], msg.author)
+                    to_ret.ok = True
+                except Exception as e:
+                    log.error("[WmTransaction]", "Transaction from {} rolled back. {}".format(msg.author, e))
+                    to_ret.error = str(e)
+                if to_ret.ok:
+                    elements = []
+                    element_actions = []
+                    for op, e in zip(msg.operations, results):
+                        if e is not None:
+                            er = utils.element2msg(e)
+                            to_ret.elements.append(er)
+                            elements.append(er)
+                            element_actions.append("add" if op.action == op.ADD else "update")
+                        else:
+                            to_ret.elements.append(msgs.WmElement())
+                            if op.action == op.REMOVE:
+                                elements.append(op.element)
+                                element_actions.append("remove")
+                    self._queue_change(msg.author, "transaction", elements, self._changed_relations(), msg.context, element_actions)
+            finally:
+                to_ret.snapshot_id = self._end_changes()
         if self._verbose:
-            log.info("[WmModify]", "{} {} {}. Time: {:0.3f} secs".format(msg.author, msg.action, [e.id for e in to_ret.elements], self._times.get_last()))
+            log.info("[WmTransaction]", "{} {} operations. Ok: {}. Time: {:0.3f} secs. Lock wait: {:0.3f} secs".format(msg.author, len(msg.operations), to_ret.ok, self._times.get_last(), self._lock_wait()))
         return to_ret
 
     def run(self):
@@ -0,0 +1,28 @@
+import os
+from skiros2_world_model.core.world_model import WorldModel
+
+OWL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'skiros2', 'owl')
+SKIROS_OWL = os.path.join(OWL_DIR, 'skiros.owl')
+
+
+def load_skiros(dataset):
+    """
+    @brief      Load skiros.owl in an ontology or dataset, with skiros as
+                default prefix
+
+    @return     the dataset
+    """
+    dataset.load(SKIROS_OWL)
+    dataset.set_default_prefix('skiros', 'http://rvmi.aau.dk/ontologies/skiros.owl#')
+    return dataset
+
+
+def make_world_model(change_cb=lambda *args, **kwargs: None, graph=None):
+    """
+    @brief      A scene world model with skiros.owl loaded
+
+    @param      change_cb  called at every change, ignored by default
+    @param      graph      the graph storing the world model, a new
+                           in-memory one if None
+    """
+    return load_skiros(WorldModel(False, 'scene', change_cb, graph))
@@ -0,0 +1,59 @@
+import unittest
+import rdflib
+from rdflib.plugins.stores.memory import Memory
+from skiros2_common.core.world_element import Element
+from skiros2_world_model.core.compact_store import CompactStore, SplitStore
+from helpers import make_world_model
+
+
+class TestCompactStore(unittest.TestCase):
+    def test_statements(self):
+        graph = rdflib.ConjunctiveGraph(store=CompactStore())
+        context = graph.get_context('test')
+        x = rdflib.URIRef('http://test.org/test.owl#x')
+        statements = {(x, rdflib.RDF.type, rdflib.OWL.NamedIndividual),
+                      (x, rdflib.RDFS.label, rdflib.Literal('x', lang='en')),
+                      (x, rdflib.URIRef('http://test.org/test.owl#size'), rdflib.Literal(1.5))}
+        for s in statements:
+            context.add(s)
+        graph.get_context('other').add((x, rdflib.RDF.type, rdflib.OWL.NamedIndividual))
+        self.assertEqual(len(graph), 3)
+        self.assertEqual(len(context), 3)
+        self.assertEqual(set(context), statements)
+        self.assertEqual(set(graph.contexts((x, rdflib.RDF.type, rdflib.OWL.NamedIndividual))), {context, graph.get_context('other')})
+        context.remove((x, None, None))
+        self.assertEqual(len(context), 0)
+        self.assertEqual(len(graph), 1)
+        # Removed statements are skipped in the indexes, and found again once added back
+        context.add((x, rdflib.RDF.type, rdflib.OWL.NamedIndividual))
+        self.assertEqual(list(graph.subjects(rdflib.RDF.type, rdflib.OWL.NamedIndividual)), [x])
+        graph.store._compact()
+        self.assertEqual(set(context), {(x, rdflib.RDF.type, rdflib.OWL.NamedIndividual)})
+
+    def test_split_world_model(self):
+        compact = CompactStore()
+        wms = []
+        for graph in (None, rdflib.ConjunctiveGraph(store=SplitStore(Memory(), {'scene': compact}))):
+            wm = make_world_model(graph=graph)
+            wm.reset()
+            location = Element("skiros:Location", "table")
+            location.addRelation("skiros:Scene-0", "skiros:contain", "-1")
+            location = wm.add_element(location, "test")
+            product = Element("skiros:Product", "cup")
+            product.setProperty("skiros:Size", 1.0)
+            product.addRelation(location.id, "skiros:contain", "-1")
+            wm.add_element(product, "test")
+            wm.remove_element(wm.get_element(location.id), "test")
+            wms.append(wm)
+        memory, split = wms
+        self.assertEqual(set(split.context), set(memory.context))
+        self.assertEqual(len(compact), len(memory.context))
+        self.assertEqual(len(split.ontology()), len(memory.ontology()))
+        query = "SELECT ?x WHERE { ?x rdf:type/rdfs:subClassOf* skiros:Location . }"
+        self.assertEqual(set(split.query(query)), set(memory.query(query)))
+        self.assertEqual([e.id for e in split.resolve_elements(Element("skiros:Product", "cup"))], ["skiros:Product-2"])
+        self.assertEqual(split.get_element("skiros:Product-2").getProperty("skiros:Size").value, 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
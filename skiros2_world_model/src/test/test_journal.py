@@ -0,0 +1,112 @@
+import errno
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import rdflib
+from skiros2_common.core.world_element import Element
+from skiros2_world_model.core.journal import Journal
+from helpers import make_world_model
+
+EX = rdflib.Namespace('http://test.org/test.owl#')
+
+
+class FullFile(object):
+    """
+    @brief      A file on a full disk
+    """
+
+    def write(self, data):
+        raise IOError(errno.ENOSPC, "No space left on device")
+
+    def close(self):
+        pass
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'scene')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_recover(self):
+        journal = Journal(self.path)
+        self.assertIsNone(journal.recover())
+        journal.start([(EX.a, EX.p, EX.b)])
+        journal.append((EX.c, EX.p, EX.d), True)
+        journal.extend([((EX.a, EX.p, EX.b), False), ((EX.e, EX.p, rdflib.Literal(1.0)), True)])
+        journal.stop()
+        expected = {(EX.c, EX.p, EX.d), (EX.e, EX.p, rdflib.Literal(1.0))}
+        self.assertEqual(Journal(self.path).recover(), expected)
+        # A torn record at the end of the journal is discarded
+        with open(self.path + ".journal", 'ab') as f:
+            f.write(b'\x10\x00\x00')
+        self.assertEqual(Journal(self.path).recover(), expected)
+        self.assertEqual(Journal(self.path).recover(), expected)
+
+    def test_checkpoint(self):
+        journal = Journal(self.path, checkpoint_size=2)
+        journal.start([])
+        journal.append((EX.a, EX.p, EX.b), True)
+        journal.append((EX.c, EX.p, EX.d), True)
+        journal.checkpoint((os.path.join(self.directory, 'scene.turtle'), [('ex', EX)]))
+        journal.stop()
+        self.assertEqual(os.path.getsize(self.path + ".journal"), 0)
+        self.assertEqual(Journal(self.path).recover(), {(EX.a, EX.p, EX.b), (EX.c, EX.p, EX.d)})
+        graph = rdflib.Graph().parse(os.path.join(self.directory, 'scene.turtle'), format='turtle')
+        self.assertEqual(len(graph), 2)
+
+    def test_idle(self):
+        journal = Journal(self.path, checkpoint_interval=0.01)
+        syncs = []
+        checkpoints = []
+        journal._sync = lambda: syncs.append(1)
+        journal.start([])
+        write_checkpoint = journal._write_checkpoint
+        journal._write_checkpoint = lambda: checkpoints.append(write_checkpoint())
+        time.sleep(0.2)
+        # The writer blocks while there is nothing to write
+        self.assertEqual((len(syncs), len(checkpoints)), (0, 0))
+        journal.append((EX.a, EX.p, EX.b), True)
+        time.sleep(0.2)
+        self.assertEqual((len(syncs), len(checkpoints)), (1, 1))
+        journal.stop()
+
+    def test_write_error(self):
+        journal = Journal(self.path, checkpoint_interval=0.05)
+        journal.start([])
+        journal._file = FullFile()
+        journal.append((EX.a, EX.p, EX.b), True)
+        time.sleep(0.2)
+        # The writer survives, and the checkpoint saves the change
+        self.assertTrue(journal._thread.is_alive())
+        journal.append((EX.c, EX.p, EX.d), True)
+        journal.stop()
+        self.assertEqual(Journal(self.path).recover(), {(EX.a, EX.p, EX.b), (EX.c, EX.p, EX.d)})
+
+    def test_world_model(self):
+        wm = make_world_model()
+        wm.reset()
+        wm.set_journal(Journal(self.path))
+        location = Element("skiros:Location", "table")
+        location.addRelation("skiros:Scene-0", "skiros:contain", "-1")
+        location = wm.add_element(location, "test")
+        with self.assertRaises(Exception):
+            wm.transaction([{'action': 'add', 'element': Element("skiros:Product", "cup")},
+                            {'action': 'update', 'element': Element("skiros:Product", "missing", "skiros:Product-9")}], "test")
+        wm.transaction([{'action': 'add', 'element': Element("skiros:Product", "cup")}], "test")
+        statements = set(wm.context)
+        wm._journal.stop()
+
+        wm.reset()
+        wm.recover(Journal(self.path).recover())
+        self.assertEqual(set(wm.context), statements)
+        self.assertEqual([e.id for e in wm.resolve_elements(Element("skiros:Product", "cup"))], ["skiros:Product-2"])
+        self.assertEqual(wm.add_element(Element("skiros:Product"), "test").id, "skiros:Product-3")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,181 @@
+import unittest
+import rdflib
+from rdflib.namespace import OWL
+from skiros2_world_model.core.ontology_rdflib import Ontology, ResultCache, INFERRED_CONTEXT
+
+
+class TestNamespaceIndex(unittest.TestCase):
+    def setUp(self):
+        self.o = Ontology()
+        self.o.set_default_prefix('skiros', 'http://rvmi.aau.dk/ontologies/skiros.owl#')
+
+    def test_conversions(self):
+        uri = rdflib.URIRef('http://rvmi.aau.dk/ontologies/skiros.owl#Location')
+        self.assertEqual(self.o.uri2lightstring(uri), 'skiros:Location')
+        self.assertEqual(self.o.uri2lightstring(str(uri)), 'skiros:Location')
+        self.assertEqual(self.o.lightstring2uri('skiros:Location'), uri)
+        self.assertEqual(self.o.lightstring2uri(':Location'), uri)
+        self.assertEqual(self.o.lightstring2uri('Location'), uri)
+        self.assertEqual(self.o.uri2lightstring('http://unknown.org/test#A'), 'http://unknown.org/test#A')
+        self.assertEqual(self.o.lightstring2uri('unknown:A'), rdflib.URIRef('unknown:A'))
+
+    def test_bind(self):
+        self.assertEqual(self.o.uri2lightstring('http://test.org/test.owl#A'), 'http://test.org/test.owl#A')
+        self.assertEqual(self.o.lightstring2uri('test:A'), rdflib.URIRef('test:A'))
+        self.o._bind('test', 'http://test.org/test.owl#')
+        self.assertEqual(self.o.uri2lightstring('http://test.org/test.owl#A'), 'test:A')
+        self.assertEqual(self.o.lightstring2uri('test:A'), rdflib.URIRef('http://test.org/test.owl#A'))
+        self.o._bind('test2', 'http://test.org/test.owl#')
+        self.assertEqual(self.o.uri2lightstring('http://test.org/test.owl#A'), 'test2:A')
+
+    def test_shared_graph(self):
+        o2 = Ontology(self.o.ontology())
+        o2._bind('test', 'http://test.org/test.owl#')
+        self.assertEqual(self.o.uri2lightstring('http://test.org/test.owl#A'), 'test:A')
+
+
+class TestHierarchyIndex(unittest.TestCase):
+    def setUp(self):
+        self.o = Ontology()
+        self.o.set_default_prefix('skiros', 'http://rvmi.aau.dk/ontologies/skiros.owl#')
+        for child, parent in [("skiros:B", "skiros:A"), ("skiros:C", "skiros:B"), ("skiros:D", "skiros:A")]:
+            self.o.add_relation({'src': child, 'type': 'rdfs:subClassOf', 'dst': parent}, 'test', 'test')
+
+    def test_sub_classes(self):
+        self.assertEqual(self.o.get_sub_classes("skiros:A")[0], "skiros:A")
+        self.assertEqual(set(self.o.get_sub_classes("skiros:A")), {"skiros:A", "skiros:B", "skiros:C", "skiros:D"})
+        self.assertEqual(self.o.get_sub_classes_set("skiros:B"), frozenset({"skiros:B", "skiros:C"}))
+        self.assertEqual(self.o.get_sub_classes("skiros:C"), ["skiros:C"])
+
+    def test_incremental_update(self):
+        self.assertNotIn("skiros:E", self.o.get_sub_classes_set("skiros:A"))
+        self.o.add_relation({'src': "skiros:E", 'type': 'rdfs:subClassOf', 'dst': "skiros:C"}, 'test', 'test')
+        self.assertIn("skiros:E", self.o.get_sub_classes_set("skiros:A"))
+        self.assertNotIn("skiros:E", self.o.get_sub_classes_set("skiros:D"))
+        self.o.remove_relation({'src': "skiros:C", 'type': 'rdfs:subClassOf', 'dst': "skiros:B"}, 'test', 'test')
+        self.assertEqual(self.o.get_sub_classes_set("skiros:A"), frozenset({"skiros:A", "skiros:B", "skiros:D"}))
+        self.assertEqual(self.o.get_sub_classes_set("skiros:C"), frozenset({"skiros:C", "skiros:E"}))
+
+    def test_sub_properties(self):
+        self.o.add_relation({'src': "skiros:contain", 'type': 'rdfs:subPropertyOf', 'dst': "skiros:spatiallyRelated"}, 'test', 'test')
+        self.assertEqual(self.o.get_sub_relations_set("skiros:spatiallyRelated"), frozenset({"skiros:spatiallyRelated", "skiros:contain"}))
+        self.assertEqual(self.o.get_sub_properties("skiros:spatiallyRelated"), ["skiros:spatiallyRelated", "skiros:contain"])
+
+
+class TestPropertyKinds(unittest.TestCase):
+    def test_property_kind(self):
+        o = Ontology()
+        o.set_default_prefix('skiros', 'http://rvmi.aau.dk/ontologies/skiros.owl#')
+        self.assertIsNone(o.get_property_kind("skiros:Size"))
+        o.add_relation({'src': "skiros:Size", 'type': 'rdf:type', 'dst': "owl:DatatypeProperty"}, 'test', 'test')
+        o.add_relation({'src': "skiros:contain", 'type': 'rdf:type', 'dst': "owl:ObjectProperty"}, 'test', 'test')
+        self.assertEqual(o.get_property_kind("skiros:Size"), OWL.DatatypeProperty)
+        self.assertEqual(o.get_property_kind("skiros:contain"), OWL.ObjectProperty)
+        o.remove_relation({'src': "skiros:contain", 'type': 'rdf:type', 'dst': "owl:ObjectProperty"}, 'test', 'test')
+        self.assertIsNone(o.get_property_kind("skiros:contain"))
+
+
+class TestQueryCache(unittest.TestCase):
+    def setUp(self):
+        self.o = Ontology()
+        self.o.set_default_prefix('skiros', 'http://rvmi.aau.dk/ontologies/skiros.owl#')
+        for child, parent in [("skiros:B", "skiros:A"), ("skiros:C", "skiros:A")]:
+            self.o.add_relation({'src': child, 'type': 'rdfs:subClassOf', 'dst': parent}, 'test', 'test')
+
+    def test_bindings(self):
+        query = "SELECT ?x WHERE { ?x rdfs:subClassOf ?class . }"
+        bound = self.o.query(query, bindings={'class': self.o.lightstring2uri("skiros:A")})
+        literal = self.o.query("SELECT ?x WHERE { ?x rdfs:subClassOf skiros:A . }")
+        self.assertEqual({r[0] for r in bound}, {r[0] for r in literal})
+        self.assertEqual(len({r[0] for r in bound}), 2)
+        self.assertEqual(list(self.o.query(query, bindings={'class': self.o.lightstring2uri("skiros:B")})), [])
+
+    def test_cache(self):
+        cache = self.o._queries
+        hits, misses = cache.hits, cache.misses
+        self.o.query("SELECT ?x WHERE { ?x rdfs:subClassOf ?class . }")
+        self.o.query("SELECT ?x  WHERE {\n ?x rdfs:subClassOf ?class . }")
+        self.assertEqual((cache.hits - hits, cache.misses - misses), (1, 1))
+        # Binding a prefix invalidates the prepared queries
+        self.o._bind('test', 'http://test.org/test.owl#')
+        self.o.query("SELECT ?x WHERE { ?x rdfs:subClassOf ?class . }")
+        self.assertEqual(cache.misses - misses, 2)
+
+
+class TestResultCache(unittest.TestCase):
+    def test_context_version(self):
+        o = Ontology()
+        o.set_default_prefix('skiros', 'http://rvmi.aau.dk/ontologies/skiros.owl#')
+        a, b, total = o.context_version('a'), o.context_version('b'), o.context_version()
+        o.add_relation({'src': "skiros:B", 'type': 'rdfs:subClassOf', 'dst': "skiros:A"}, 'a', 'test')
+        self.assertNotEqual(o.context_version('a'), a)
+        self.assertEqual(o.context_version('b'), b)
+        self.assertNotEqual(o.context_version(), total)
+        self.assertEqual(Ontology(o.ontology()).context_version('a'), o.context_version('a'))
+        # A modification of the whole graph changes contexts never modified
+        c = o.context_version('c')
+        o.add_relation({'src': "skiros:C", 'type': 'rdfs:subClassOf', 'dst': "skiros:A"}, '', 'test')
+        self.assertNotEqual(o.context_version('c'), c)
+
+    def test_lru(self):
+        cache = ResultCache(budget=100)
+        cache.put('a', 0, ['a'], 40)
+        cache.put('b', 0, ['b'], 40)
+        self.assertEqual(cache.get('a', 0), ['a'])
+        cache.put('c', 0, ['c'], 40)
+        self.assertIsNone(cache.get('b', 0))
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.size, 80)
+        cache.put('d', 0, ['d'], 200)
+        self.assertIsNone(cache.get('d', 0))
+
+    def test_invalidation(self):
+        cache = ResultCache()
+        cache.put('a', 1, ['a'], 10)
+        self.assertEqual(cache.get('a', 1), ['a'])
+        self.assertIsNone(cache.get('a', 2))
+        self.assertEqual((cache.hits, cache.misses, cache.invalidations, len(cache), cache.size), (1, 1, 1, 0, 0))
+
+
+class TestInferredTypes(unittest.TestCase):
+    def setUp(self):
+        self.plain = Ontology()
+        self.inferred = Ontology()
+        for o in (self.plain, self.inferred):
+            o.set_default_prefix('skiros', 'http://rvmi.aau.dk/ontologies/skiros.owl#')
+            self.apply(o, [("skiros:B", 'rdfs:subClassOf', "skiros:A"), ("skiros:x", 'rdf:type', "skiros:B")])
+        self.inferred.enable_inferred_types()
+
+    def apply(self, o, statements, add=True):
+        for subj, predicate, obj in statements:
+            relation = {'src': subj, 'type': predicate, 'dst': obj}
+            if add:
+                o.add_relation(relation, 'test', 'test')
+            else:
+                o.remove_relation(relation, 'test', 'test')
+
+    def assertSameTypes(self):
+        expected = set(self.plain.query("SELECT ?x ?c WHERE { ?x rdf:type/rdfs:subClassOf* ?c . }"))
+        self.assertEqual(set(self.inferred.query("SELECT ?x ?c WHERE { ?x rdf:type ?c . }")), expected)
+
+    def test_same_as_paths(self):
+        steps = [
+            ([("skiros:C", 'rdfs:subClassOf', "skiros:B"), ("skiros:y", 'rdf:type', "skiros:C")], True),
+            ([("skiros:A", 'rdfs:subClassOf', "skiros:Root"), ("skiros:y", 'rdf:type', "skiros:A")], True),
+            ([("skiros:C", 'rdfs:subClassOf', "skiros:B")], False),
+            ([("skiros:x", 'rdf:type', "skiros:B")], False),
+            ([("skiros:A", 'rdfs:subClassOf', "skiros:Root")], False),
+        ]
+        self.assertSameTypes()
+        for statements, add in steps:
+            for o in (self.plain, self.inferred):
+                self.apply(o, statements, add)
+            self.assertSameTypes()
+
+    def test_context(self):
+        inferred = self.inferred.ontology(INFERRED_CONTEXT)
+        self.assertEqual(len(inferred), 1)
+        self.assertEqual(len(self.inferred.ontology('test').query("SELECT ?x WHERE { ?x rdf:type skiros:A . }")), 0)
+        self.assertEqual(self.inferred.query_template('individuals'), "SELECT ?x WHERE { ?x rdf:type ?class . }")
+        self.assertIn("rdfs:subClassOf*", self.inferred.query_template('individuals', 'test'))
+        self.assertIn("rdfs:subClassOf*", self.plain.query_template('individuals'))
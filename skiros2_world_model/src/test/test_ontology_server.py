@@ -0,0 +1,41 @@
+import unittest
+import skiros2_msgs.srv as srvs
+from rdflib.namespace import RDFS
+from skiros2_common.tools.time_keeper import TimeKeeper
+from skiros2_world_model.core.ontology_rdflib import Ontology, ResultCache
+from skiros2_world_model.ros.ontology_server import OntologyServer
+from helpers import load_skiros
+
+
+def make_server():
+    """
+    @brief      An OntologyServer with skiros.owl loaded, not connected to ROS
+    """
+    server = OntologyServer.__new__(OntologyServer)
+    server._verbose = False
+    server._ontology = load_skiros(Ontology())
+    server._times = TimeKeeper()
+    server._results = ResultCache(1024 * 1024)
+    return server
+
+
+class TestQuery(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = make_server()
+
+    def test_construct(self):
+        query = "CONSTRUCT { ?x rdfs:subClassOf skiros:TransformationPose } WHERE { ?x rdfs:subClassOf skiros:TransformationPose }"
+        o = self.server._ontology
+        pose = o.lightstring2uri("skiros:TransformationPose")
+        statements = [(o.uri2lightstring(x), "rdfs:subClassOf", "skiros:TransformationPose") for x in o.ontology().subjects(RDFS.subClassOf, pose)]
+        self.assertTrue(statements)
+        res = self.server._wo_query_cb(srvs.WoQueryRequest(query_string=query, cut_prefix=True))
+        self.assertEqual(sorted(res.answer), sorted(" ".join(s) + " " for s in statements))
+        res = self.server._wo_query_cb(srvs.WoQueryRequest(query_string=query, cut_prefix=True, typed=True))
+        self.assertEqual([c.name for c in res.columns], ["subject", "predicate", "object"])
+        self.assertEqual(sorted(zip(*[c.values for c in res.columns])), sorted(statements))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import unittest
+import rdflib
+from skiros2_world_model.core.ontology_rdflib import Ontology
+from skiros2_world_model.core.parse_cache import ParseCache, parse_files
+from helpers import SKIROS_OWL
+
+TEST_OWL = """<?xml version="1.0"?>
+<rdf:RDF xmlns="http://test.org/test.owl#" xmlns:test="http://test.org/test.owl#"
+     xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" xmlns:rdfs="http://www.w3.org/2000/01/rdf-schema#"
+     xmlns:owl="http://www.w3.org/2002/07/owl#">
+    <owl:Ontology rdf:about="http://test.org/test.owl"/>
+    <owl:Class rdf:about="http://test.org/test.owl#{}"/>
+</rdf:RDF>
+"""
+
+
+class TestParseCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ParseCache(os.path.join(self.directory, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _statements(self, o):
+        return {t for t in o.ontology() if not any(isinstance(x, rdflib.BNode) for x in t)}
+
+    def test_same_as_parse(self):
+        parsed = Ontology()
+        parsed.load(SKIROS_OWL)
+        for hits in (0, 1):
+            o = Ontology()
+            o.load(SKIROS_OWL, cache=self.cache)
+            self.assertEqual(self.cache.hits, hits)
+            self.assertEqual(len(o.ontology()), len(parsed.ontology()))
+            self.assertEqual(self._statements(o), self._statements(parsed))
+            self.assertEqual(set(o.ontology().namespaces()), set(parsed.ontology().namespaces()))
+
+    def test_invalidation(self):
+        filename = os.path.join(self.directory, 'test.owl')
+        with open(filename, 'w') as f:
+            f.write(TEST_OWL.format('A'))
+        Ontology().load(filename, cache=self.cache)
+        with open(filename, 'w') as f:
+            f.write(TEST_OWL.format('Ab'))
+        o = Ontology()
+        o.load(filename, cache=self.cache)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+        self.assertIn((rdflib.URIRef('http://test.org/test.owl#Ab'), rdflib.RDF.type, rdflib.OWL.Class), o.ontology())
+        self.assertEqual(o.uri2lightstring('http://test.org/test.owl#Ab'), 'test:Ab')
+
+    def test_parse_files(self):
+        filenames = []
+        for name in ('A', 'B', 'C'):
+            filenames.append(os.path.join(self.directory, '{}.owl'.format(name)))
+            with open(filenames[-1], 'w') as f:
+                f.write(TEST_OWL.format(name))
+        files = [(f, Ontology.default_context_id(f), None) for f in filenames]
+        times = {}
+        parsed = parse_files(files, self.cache, processes=2, times=times)
+        self.assertEqual(set(times), set(filenames))
+        for name, (namespaces, statements) in zip(('A', 'B', 'C'), parsed):
+            self.assertIn((rdflib.URIRef('http://test.org/test.owl#' + name), rdflib.RDF.type, rdflib.OWL.Class), statements)
+            self.assertIn(rdflib.URIRef('http://test.org/test.owl#'), [ns for _, ns in namespaces])
+        self.assertEqual(parse_files(files, self.cache, times=times), parsed)
+        self.assertEqual(self.cache.hits, 3)
+
+    def test_context_id(self):
+        # The relative uris are resolved against the context id
+        filename = os.path.join(self.directory, 'scene.turtle')
+        with open(filename, 'w') as f:
+            f.write('<a> <b> <c> .\n')
+        files = [(filename, 'http://test.org/one/', 'turtle'), (filename, 'http://test.org/two/', 'turtle')]
+        for hits in (0, 2):
+            one, two = parse_files(files, self.cache, processes=1)
+            self.assertEqual(self.cache.hits, hits)
+            for (_, statements), base in zip((one, two), ('one', 'two')):
+                self.assertEqual(statements, [tuple(rdflib.URIRef('http://test.org/{}/{}'.format(base, x)) for x in 'abc')])
+        self.assertIsNone(self.cache.load(filename, 'http://test.org/one/', 'xml'))
@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import unittest
+import rdflib
+from skiros2_common.core.world_element import Element
+from skiros2_world_model.core.world_model import WorldModel
+from skiros2_world_model.core.sqlite_store import SQLiteStore
+from helpers import SKIROS_OWL
+
+
+class TestSQLiteStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'wm.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def open(self):
+        graph = rdflib.ConjunctiveGraph(store=SQLiteStore(self.path))
+        wm = WorldModel(False, 'scene', lambda *args: None, graph)
+        wm.set_default_prefix('skiros', 'http://rvmi.aau.dk/ontologies/skiros.owl#')
+        return wm
+
+    def test_statements(self):
+        graph = rdflib.ConjunctiveGraph(store=SQLiteStore(self.path))
+        context = graph.get_context('test')
+        x = rdflib.URIRef('http://test.org/test.owl#x')
+        statements = {(x, rdflib.RDF.type, rdflib.OWL.NamedIndividual),
+                      (x, rdflib.RDFS.label, rdflib.Literal('x', lang='en')),
+                      (x, rdflib.URIRef('http://test.org/test.owl#size'), rdflib.Literal(1.5))}
+        for s in statements:
+            context.add(s)
+        graph.get_context('other').add((x, rdflib.RDF.type, rdflib.OWL.NamedIndividual))
+        self.assertEqual(len(graph), 3)
+        self.assertEqual(len(context), 3)
+        self.assertEqual(set(context), statements)
+        self.assertEqual(set(graph.contexts((x, rdflib.RDF.type, rdflib.OWL.NamedIndividual))), {context, graph.get_context('other')})
+        context.remove((x, None, None))
+        self.assertEqual(len(context), 0)
+        self.assertEqual(len(graph), 1)
+
+    def test_reopen(self):
+        wm = self.open()
+        wm.load(SKIROS_OWL)
+        wm.reset()
+        location = Element("skiros:Location", "table")
+        location.addRelation("skiros:Scene-0", "skiros:contain", "-1")
+        location = wm.add_element(location, "test")
+        product = Element("skiros:Product", "cup")
+        product.setProperty("skiros:Size", 1.0)
+        product.addRelation(location.id, "skiros:contain", "-1")
+        product = wm.add_element(product, "test")
+        statements = set(wm.context)
+        wm.ontology().close()
+
+        wm = self.open()
+        wm.restore()
+        self.assertEqual(set(wm.context), statements)
+        self.assertEqual(wm.get_sub_classes_set("skiros:Location"), frozenset(wm.get_sub_classes("skiros:Location")))
+        self.assertEqual([e.id for e in wm.resolve_elements(Element("skiros:Product", "cup"))], [product.id])
+        self.assertEqual(wm.get_element(product.id).getProperty("skiros:Size").value, 1.0)
+        self.assertEqual(wm.add_element(Element("skiros:Product"), "test").id, "skiros:Product-3")
+
+    def test_load_transactions(self):
+        wm = self.open()
+        store = wm.ontology().store
+        calls = []
+        add, addN = store.add, store.addN
+        store.add = lambda *args, **kwargs: calls.append('add') or add(*args, **kwargs)
+        store.addN = lambda quads: calls.append('addN') or addN(quads)
+        wm.load(SKIROS_OWL)
+        # The parsed statements are added in a single transaction
+        self.assertEqual(calls, ['addN'])
+        wm.reset()
+        wm.add_element(Element("skiros:Location", "table"), "test")
+        wm.workspace = self.directory
+        wm.context.serialize(destination=os.path.join(self.directory, 'scene.turtle'), format='turtle')
+        statements = set(wm.context)
+        del calls[:]
+        wm.load_context('scene.turtle')
+        self.assertIn('addN', calls)
+        self.assertNotIn('add', calls[:calls.index('addN')])
+        self.assertEqual(set(wm.context), statements)
+
+
+if __name__ == '__main__':
+    unittest.main()
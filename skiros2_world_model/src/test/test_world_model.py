@@ -0,0 +1,226 @@
+import unittest
+from copy import deepcopy
+from skiros2_common.core.world_element import Element
+from skiros2_common.core.discrete_reasoner import DiscreteReasoner
+from skiros2_world_model.core.world_model import IndividualsDataset, ElementCache
+from helpers import make_world_model, load_skiros
+
+
+class TestTransaction(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.changes = []
+        cls.wm = make_world_model(lambda author, action, element=None, relation=None: cls.changes.append((action, element, relation)))
+
+    def setUp(self):
+        self.wm.reset()
+        location = Element("skiros:Location", "table")
+        location.addRelation("skiros:Scene-0", "skiros:contain", "-1")
+        self.location = self.wm.add_element(location, "test")
+        del self.changes[:]
+
+    def test_commit(self):
+        product = Element("skiros:Product", "cup")
+        product.setProperty("skiros:Size", 1.0)
+        product.addRelation(self.location.id, "skiros:contain", "-1")
+        results = self.wm.transaction([{'action': 'add', 'element': product},
+                                       {'action': 'set_relation', 'relation': {'src': "skiros:Scene-0", 'type': "skiros:contain", 'dst': self.location.id}, 'value': False}], "test")
+        self.assertEqual(results[0].id, "skiros:Product-2")
+        self.assertIsNone(results[1])
+        self.assertEqual(self.wm.get_element("skiros:Scene-0").getRelations(pred="skiros:contain"), [])
+        self.assertEqual([r['dst'] for r in self.wm.get_element(self.location.id).getRelations(pred="skiros:contain")], ["skiros:Product-2"])
+        self.assertEqual([e.id for e in self.wm.resolve_elements(Element("skiros:Product", "cup"))], ["skiros:Product-2"])
+        self.assertEqual([action for action, _, _ in self.changes], ["add", "remove"])
+
+    def test_rollback(self):
+        product = Element("skiros:Product", "cup")
+        product.addRelation(self.location.id, "skiros:contain", "-1")
+        statements = set(self.wm.context)
+        with self.assertRaises(Exception):
+            self.wm.transaction([{'action': 'add', 'element': product},
+                                 {'action': 'remove', 'element': self.location},
+                                 {'action': 'update', 'element': Element("skiros:Product", "missing", "skiros:Product-9")}], "test")
+        self.assertEqual(set(self.wm.context), statements)
+        self.assertEqual(self.changes, [])
+        self.assertEqual(self.wm.resolve_elements(Element("skiros:Product")), [])
+        self.assertEqual([r['src'] for r in self.wm.get_element(self.location.id).getRelations(pred="skiros:contain")], ["skiros:Scene-0"])
+        self.assertEqual(self.wm.add_element(Element("skiros:Product", "cup"), "test").id, "skiros:Product-2")
+
+    def test_update_delta(self):
+        product = Element("skiros:Product", "cup")
+        product.setProperty("skiros:Size", 1.0)
+        product.addRelation(self.location.id, "skiros:contain", "-1")
+        # The element is cached by the world model: modify a copy
+        product = deepcopy(self.wm.add_element(product, "test"))
+        product.setProperty("skiros:Size", 2.0)
+        product.addRelation(product.id, "skiros:contain", "skiros:Product-9")
+        removed, added = self.wm.update_element(product, "test")
+        size = self.wm.lightstring2uri("skiros:Size")
+        self.assertEqual([(s[1], s[2].value, r) for s, r in removed], [(size, 1.0, False)])
+        self.assertEqual([(s[1], s[2].value, r) for s, r in added], [(size, 2.0, False)])
+        # The relation to an unknown element is dropped
+        self.assertEqual(product.getRelations(pred="skiros:contain", subj="-1"), [])
+        self.assertEqual(self.wm.update_element(product, "test"), ([], []))
+
+    def test_recursive(self):
+        cup = Element("skiros:Product", "cup")
+        cup.addRelation(self.location.id, "skiros:contain", "-1")
+        cup = self.wm.add_element(cup, "test")
+        box = Element("skiros:Location", "box")
+        box.addRelation(self.location.id, "skiros:contain", "-1")
+        box = self.wm.add_element(box, "test")
+        mug = Element("skiros:Product", "mug")
+        mug.addRelation(box.id, "skiros:contain", "-1")
+        mug = self.wm.add_element(mug, "test")
+        self.assertEqual(list(self.wm.get_recursive("skiros:Scene-0", "skiros:sceneProperty")), ["skiros:Scene-0", self.location.id, cup.id, box.id, mug.id])
+        self.assertEqual(list(self.wm.get_recursive("skiros:Scene-0", "skiros:sceneProperty", "skiros:Location")), ["skiros:Scene-0", self.location.id, box.id])
+        del self.changes[:]
+        self.wm.remove_recursive(Element("", "", self.location.id), "test", "skiros:sceneProperty")
+        self.assertEqual(list(self.wm.get_recursive("skiros:Scene-0", "skiros:sceneProperty")), ["skiros:Scene-0"])
+        self.assertEqual(self.wm.resolve_elements(Element("skiros:Product")), [])
+        # Every relation removed is notified once
+        self.assertEqual(sorted((r['src'], r['dst']) for _, _, r in self.changes), sorted([("skiros:Scene-0", self.location.id), (self.location.id, cup.id), (self.location.id, box.id), (box.id, mug.id)]))
+        # The ids are released
+        self.assertIn(self.wm.add_element(Element("skiros:Product", "cup"), "test").getIdNumber(), [e.getIdNumber() for e in (self.location, cup, box, mug)])
+
+
+class TestSnapshot(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.wm = make_world_model()
+        cls.wm.enable_snapshots()
+
+    def setUp(self):
+        self.wm.reset()
+        location = Element("skiros:Location", "table")
+        location.addRelation("skiros:Scene-0", "skiros:contain", "-1")
+        self.location = self.wm.add_element(location, "test")
+        product = Element("skiros:Product", "cup")
+        product.setProperty("skiros:Size", 1.0)
+        product.addRelation(self.location.id, "skiros:contain", "-1")
+        self.product = self.wm.add_element(product, "test")
+        self.version = self.wm.version
+
+    def test_read_past_version(self):
+        product = self.wm.get_element(self.product.id)
+        product.setProperty("skiros:Size", 2.0)
+        self.wm.update_element(product, "test")
+        self.wm.remove_element(self.wm.get_element(self.location.id), "test")
+        added = self.wm.add_element(Element("skiros:Product", "cup"), "test")
+        snapshot = self.wm.snapshot(self.version)
+        self.assertEqual(self.wm.get_element(self.product.id, snapshot).getProperty("skiros:Size").value, 1.0)
+        self.assertEqual([r['src'] for r in self.wm.get_element(self.product.id, snapshot).getRelations(pred="skiros:contain")], [self.location.id])
+        self.assertEqual(sorted(e.id for e in self.wm.resolve_elements(Element("skiros:Product", "cup"), snapshot)), [self.product.id])
+        self.assertEqual(sorted(e.id for e in self.wm.resolve_elements(Element("skiros:Product", "cup"))), sorted([self.product.id, added.id]))
+        self.assertEqual(list(self.wm.get_recursive("skiros:Scene-0", "skiros:sceneProperty", snapshot=snapshot).keys()), ["skiros:Scene-0", self.location.id, self.product.id])
+        self.assertEqual(self.wm.get_element(self.product.id).getProperty("skiros:Size").value, 2.0)
+        self.assertEqual([self.wm.has_element(eid, snapshot) for eid in (self.location.id, added.id)], [True, False])
+        self.assertEqual([self.wm.has_element(eid) for eid in (self.location.id, added.id)], [False, True])
+        # The snapshot stores only the changed statements
+        self.assertLess(len(snapshot._changes), len(self.wm.context))
+
+    def test_release(self):
+        self.wm.add_element(Element("skiros:Product", "cup"), "test")
+        self.wm.release_snapshots(self.wm.version)
+        self.assertRaises(Exception, self.wm.snapshot, self.version)
+        self.assertEqual(self.wm.snapshot(self.wm.version).elements, {})
+        self.wm.reset()
+        self.assertRaises(Exception, self.wm.snapshot, self.version)
+
+
+class ColorReasoner(DiscreteReasoner):
+    """
+    @brief      Colors the elements when they are read
+    """
+
+    def parse(self, element, action):
+        return True
+
+    def run(self):
+        pass
+
+    def onAddProperties(self, element):
+        element.setProperty("skiros:Color", "red")
+
+    def getAssociatedData(self):
+        return ["skiros:Color"]
+
+
+class TestResolve(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.wm = make_world_model()
+
+    def setUp(self):
+        self.wm.reset()
+        product = Element("skiros:Product", "cup")
+        product.setProperty("skiros:Size", 1.0)
+        product.addRelation("skiros:Scene-0", "skiros:contain", "-1")
+        self.product = self.wm.add_element(product, "test")
+
+    def test_unprefixed(self):
+        self.assertEqual([e.id for e in self.wm.resolve_elements(Element("Product"))], [self.product.id])
+        description = Element("Product", "cup")
+        description.setProperty("skiros:Size", 1.0)
+        self.assertEqual([e.id for e in self.wm.resolve_elements(description)], [self.product.id])
+        description.setProperty("skiros:Size", 2.0)
+        self.assertEqual(self.wm.resolve_elements(description), [])
+
+    def test_reasoner_property(self):
+        self.wm.load_reasoner(ColorReasoner)
+        try:
+            product = deepcopy(self.wm.get_element(self.product.id))
+            product.setProperty("skiros:DiscreteReasoner", "ColorReasoner")
+            self.wm.update_element(product, "test")
+            # Read back from the graph, as after loading a scene
+            self.wm._elements_cache.clear()
+            description = Element("skiros:Product")
+            description.setProperty("skiros:Color", "red")
+            self.assertEqual([e.id for e in self.wm.resolve_elements(description)], [self.product.id])
+        finally:
+            del self.wm._reasoners["ColorReasoner"]
+
+
+class TestElementCache(unittest.TestCase):
+    def test_lru(self):
+        cache = ElementCache(capacity=2)
+        cache.put('a', Element("skiros:Location", "a"))
+        cache.put('b', Element("skiros:Location", "b"))
+        self.assertEqual(cache.get('a').label, "a")
+        cache.put('c', Element("skiros:Location", "c"))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.hits, cache.misses, cache.evictions, len(cache)), (1, 1, 1, 2))
+        self.assertGreater(cache.memory(), 0)
+
+    def test_evicted_relations(self):
+        wm = make_world_model()
+        wm._elements_cache.capacity = 2
+        wm.reset()
+        ids = []
+        for label in ("a", "b", "c"):
+            location = Element("skiros:Location", label)
+            location.addRelation("skiros:Scene-0", "skiros:contain", "-1")
+            ids.append(wm.add_element(location, "test").id)
+        self.assertLessEqual(len(wm._elements_cache), 2)
+        # Relations of cached elements are patched, the evicted ones are read back
+        wm.add_relation({'src': ids[0], 'type': "skiros:contain", 'dst': ids[1]}, "test", True)
+        self.assertEqual([r['dst'] for r in wm.get_element(ids[0]).getRelations(subj="-1", pred="skiros:contain")], [ids[1]])
+        self.assertEqual([r['src'] for r in wm.get_element(ids[1]).getRelations(pred="skiros:contain", obj="-1")], ["skiros:Scene-0", ids[0]])
+        self.assertEqual(len(wm.get_element("skiros:Scene-0").getRelations(subj="-1", pred="skiros:contain")), 3)
+
+
+class TestUniqueUri(unittest.TestCase):
+    def test_label_suffixes(self):
+        dataset = load_skiros(IndividualsDataset(False, 'test'))
+        dataset.add_element(Element("skiros:Product", "skiros:cup_2"), "test")
+        ids = [dataset.add_element(Element("skiros:Product", "skiros:cup"), "test").id for _ in range(4)]
+        self.assertEqual(ids, ["skiros:cup", "skiros:cup_1", "skiros:cup_3", "skiros:cup_4"])
+        dataset.remove_element(dataset.get_element("skiros:cup_3"), "test")
+        self.assertEqual(dataset.add_element(Element("skiros:Product", "skiros:cup"), "test").id, "skiros:cup_3")
+        for eid in ids + ["skiros:cup_2"]:
+            dataset.remove_element(dataset.get_element(eid), "test")
+        self.assertNotIn("skiros:cup", dataset._label_suffixes)
+
+
+if __name__ == '__main__':
+    unittest.main()
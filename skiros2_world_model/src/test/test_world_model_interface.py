@@ -0,0 +1,160 @@
+import time
+import unittest
+import rospy
+import skiros2_msgs.msg as msgs
+import skiros2_msgs.srv as srvs
+import skiros2_common.ros.utils as utils
+from skiros2_common.core.world_element import Element
+from skiros2_world_model.core.world_model_abstract_interface import WmException
+from skiros2_world_model.ros.world_model_interface import WorldModelInterface
+from skiros2_world_model.ros.world_model_async_interface import AsyncWorldModelInterface
+
+
+def make_interface(**services):
+    """
+    @brief      A WorldModelInterface with a cache, not connected to ROS.
+                The services are replaced by the given callables
+    """
+    wmi = WorldModelInterface.__new__(WorldModelInterface)
+    wmi._author_name = "test"
+    wmi._make_cache = True
+    wmi._last_seq = 0
+    wmi._last_snapshot_id = ""
+    wmi._external_monitor_cb = None
+    for name, service in services.items():
+        setattr(wmi, name, service)
+    return wmi
+
+
+class TestMonitorCache(unittest.TestCase):
+    def setUp(self):
+        WorldModelInterface._elements_cache.clear()
+        self.wmi = make_interface()
+
+    def test_delta(self):
+        cache = WorldModelInterface._elements_cache
+        cup = Element("skiros:Product", "cup", "skiros:Product-2")
+        cup.setProperty("skiros:Size", 1.0)
+        cup.addRelation("skiros:Location-1", "skiros:contain", "-1")
+        cache[cup.id] = cup
+        cache["skiros:Location-1"] = Element("skiros:Location", "table", "skiros:Location-1")
+        state = utils.element2state(cup)
+        moved = utils.msg2element(utils.element2msg(cup))
+        moved.setProperty("skiros:Size", 2.0)
+        moved.removeRelation(moved.getRelation(pred="skiros:contain"))
+        moved.addRelation("skiros:Scene-0", "skiros:contain", "-1")
+        msg = msgs.WmMonitor(action="update", seq=1)
+        msg.relation = [utils.relation2msg({'src': "skiros:Location-1", 'type': "skiros:contain", 'dst': cup.id}),
+                        utils.relation2msg({'src': "skiros:Scene-0", 'type': "skiros:contain", 'dst': cup.id})]
+        msg.element_deltas = [utils.delta2msg(state, moved)]
+        self.wmi._monitor_cb(msg)
+        # The element with a delta is patched, the other end of the relation is dropped
+        self.assertIs(cache.get(cup.id), cup)
+        self.assertEqual(cup.getProperty("skiros:Size").value, 2.0)
+        self.assertEqual([r['src'] for r in cup.getRelations(pred="skiros:contain")], ["skiros:Scene-0"])
+        self.assertNotIn("skiros:Location-1", cache)
+
+
+class TestGetElements(unittest.TestCase):
+    def setUp(self):
+        WorldModelInterface._elements_cache.clear()
+        self.scene = {eid: Element("skiros:Location", label, eid) for eid, label in
+                      (("skiros:Location-1", "a"), ("skiros:Location-2", "b"), ("skiros:Location-3", "c"))}
+        self.requests = []
+        self.wmi = make_interface(_get=self._get)
+
+    def _get(self, msg):
+        self.requests.append((msg.action, list(msg.ids)))
+        res = srvs.WmGetResponse()
+        ids = msg.ids if msg.action == msg.GET_MULTIPLE else [msg.element.id]
+        res.elements = [utils.element2msg(self.scene[eid]) if eid in self.scene else msgs.WmElement() for eid in ids]
+        return res
+
+    def test_order(self):
+        ids = ["skiros:Location-3", "skiros:Location-9", "skiros:Location-1", "skiros:Location-3"]
+        elements = self.wmi.get_elements(ids)
+        self.assertEqual([e.label if e is not None else None for e in elements], ["c", None, "a", "c"])
+        # One request, without duplicates
+        self.assertEqual(self.requests, [("get_multiple", ["skiros:Location-3", "skiros:Location-9", "skiros:Location-1"])])
+
+    def test_cache(self):
+        self.wmi.get_element("skiros:Location-2")
+        self.wmi.get_elements(["skiros:Location-1", "skiros:Location-2"])
+        self.assertEqual(self.requests[1], ("get_multiple", ["skiros:Location-1"]))
+        self.assertEqual(sorted(WorldModelInterface._elements_cache), ["skiros:Location-1", "skiros:Location-2"])
+        self.assertEqual([e.label for e in self.wmi.get_elements(["skiros:Location-2", "skiros:Location-1"])], ["b", "a"])
+        self.assertEqual(len(self.requests), 2)
+        # The elements at a snapshot are always read, and not cached
+        self.wmi.get_elements(["skiros:Location-3"], snapshot_id="past")
+        self.assertEqual(len(self.requests), 3)
+        self.assertNotIn("skiros:Location-3", WorldModelInterface._elements_cache)
+
+
+class Connection(object):
+    """
+    @brief      A persistent service connection, calling a function
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self.closed = False
+
+    def __call__(self, msg):
+        return self.service(msg)
+
+    def close(self):
+        self.closed = True
+
+
+class TestAsyncInterface(unittest.TestCase):
+    def setUp(self):
+        WorldModelInterface._elements_cache.clear()
+        wmi = make_interface(_get=rospy.ServiceProxy('wm/get', srvs.WmGet),
+                             _ontology_query=rospy.ServiceProxy('wm/ontology/query', srvs.WoQuery))
+        self.services = {wmi._get: self._get, wmi._ontology_query: self._query}
+        self.connections = []
+        self.awmi = AsyncWorldModelInterface(wmi, workers=4)
+        self.awmi._connect = self._connect
+
+    def tearDown(self):
+        self.awmi.shutdown()
+
+    def _connect(self, proxy):
+        self.connections.append(Connection(self.services[proxy]))
+        return self.connections[-1]
+
+    def _get(self, msg):
+        # The answers come back in another order than the requests
+        number = int(msg.element.id.split('-')[1])
+        time.sleep(0.001 * (number % 5))
+        if number == 99:
+            raise rospy.ServiceException("{} not found".format(msg.element.id))
+        return srvs.WmGetResponse(elements=[utils.element2msg(Element("skiros:Location", str(number), msg.element.id))])
+
+    def _query(self, msg):
+        column = msgs.QueryColumn(name="x", kinds=[msgs.QueryColumn.LITERAL] * 3, values=["1", "2", "3"],
+                                  datatypes=["http://www.w3.org/2001/XMLSchema#integer"] * 3)
+        return srvs.WoQueryResponse(columns=[column], total=3)
+
+    def test_results(self):
+        futures = [self.awmi.get_element("skiros:Location-{}".format(i)) for i in range(20)]
+        self.assertEqual([f.result().label for f in futures], [str(i) for i in range(20)])
+        self.assertEqual(self.awmi.query_rows("SELECT ?x WHERE { }").result(), [(1,), (2,), (3,)])
+
+    def test_exception(self):
+        future = self.awmi.get_element("skiros:Location-99")
+        self.assertRaises(WmException, future.result)
+        self.assertEqual(self.awmi.get_element("skiros:Location-1").result().label, "1")
+
+    def test_shutdown(self):
+        futures = [self.awmi.get_element("skiros:Location-{}".format(i)) for i in range(20)]
+        self.awmi.shutdown()
+        self.assertTrue(all(f.done() for f in futures))
+        # One persistent connection per service and per worker
+        self.assertLessEqual(len(self.connections), 2 * 4)
+        self.assertTrue(self.connections)
+        self.assertTrue(all(c.closed for c in self.connections))
+
+
+if __name__ == '__main__':
+    unittest.main()